@@ -1,7 +1,13 @@
 # advanced_backtest.py
 
+import numpy as np
 import pandas as pd
 from strategy_engine import apply_indicators
+from cost_model import apply_costs
+from ledger import EquityLedger, EquityRuns, LegLedger, TradeLedger, index_to_int64
+from position_sizing import sizing_arrays
+
+BLOCK_ROWS = 65536      # bars per block when equity is compressed or streamed
 
 
 class DynamicPosition:
@@ -28,77 +34,248 @@ class DynamicPosition:
         return total_pnl, total_size, avg_leverage
 
 
-def simulate_strategy_advanced(df, strategy="sma_ema", initial_capital=100000,
-                                stop_loss_pct=0.002, take_profit_pct=0.004,
-                                max_leverage=4, symbol=""):
-    if symbol:
-        print(f"\n🔍 Running advanced backtest for: {symbol}")
+class AdvancedBacktestState:
+    # Per-bar simulation state; step() can be fed bar by bar or chunk by chunk
+    def __init__(self, initial_capital=100000, stop_loss_pct=0.002,
+                 take_profit_pct=0.004, max_leverage=4, tz=None, metrics=None, verbose=True,
+                 kill_drawdown=None, mark_to_market=False, fills=None, sizing=None):
+        self.capital = initial_capital
+        self.stop_loss_pct = stop_loss_pct
+        self.take_profit_pct = take_profit_pct
+        self.max_leverage = max_leverage
+        self.position = None
+        self.bar_index = 0
+        self.trades = TradeLedger(tz=tz)
+        self.metrics = metrics
+        self.verbose = verbose
+        # Optional early stop: `killed` is set once capital falls kill_drawdown below its peak
+        self.kill_drawdown = kill_drawdown
+        self.peak_capital = initial_capital
+        self.killed = False
+        # Mark-to-market: run() adds the open position's unrealized PnL to the equity it
+        # returns (and feeds that to metrics); step() itself still returns realized capital
+        self.legs = LegLedger() if mark_to_market else None
+        # fills: optional LegLedger that keeps every entry leg with its exit bar, for
+        # post-run cost models (cost_model.py); never pruned
+        self.fills = fills
+        # Entry sizing: per-bar (bet_risk, leverage) arrays from position_sizing for bars
+        # sizing_start onwards; None keeps the legacy bar-index pattern
+        self.bet_risk = self.leverage = None
+        self.sizing_start = 0
+        if sizing is not None:
+            self.size_with(*sizing)
+
+    def size_with(self, bet_risk, leverage, first_bar=0):
+        # Arrays may cover just the bars about to run (first_bar = their bar_index)
+        self.bet_risk, self.leverage, self.sizing_start = bet_risk, leverage, first_bar
+
+    def _sizing(self, i):
+        if self.bet_risk is None:
+            return 0.01 + (0.01 * (i % 5)), min(1 + (i % self.max_leverage), self.max_leverage)
+        j = i - self.sizing_start
+        return self.bet_risk[j], self.leverage[j]
+
+    def _open_leg(self, bar, price, exposure):
+        for ledger in (self.legs, self.fills):
+            if ledger is not None:
+                ledger.append(bar, price, exposure)
 
-    df = apply_indicators(df, strategy=strategy)
-    capital = initial_capital
-    position = None
-    trade_log = []
-    equity_curve = []
+    def _close(self, time, price):
+        position = self.position
+        pnl, size, avg_leverage = position.exit_position(price)
+        self.capital += pnl
+        self.trades.append(position.entry_time, time, pnl, len(position.history), avg_leverage)
+        for ledger in (self.legs, self.fills):
+            if ledger is not None:
+                ledger.close(self.bar_index)
+        if self.metrics is not None:
+            self.metrics.record_trade(pnl)
+        self.position = None
+        return pnl
 
-    for i in range(len(df)):
-        row = df.iloc[i]
-        time = row.name
-        price = row['close']
-        signal = row['signal']
+    def step(self, time, price, signal):
+        i = self.bar_index
+        position = self.position
 
         if position:
             position.update_extremes(price)
             entry_price = position.history[0][0]
 
-            if price <= entry_price * (1 - stop_loss_pct) or price >= entry_price * (1 + take_profit_pct):
-                pnl, size, avg_leverage = position.exit_position(price)
-                capital += pnl
-                trade_log.append({
-                    "entry_time": position.entry_time,
-                    "exit_time": time,
-                    "pnl": pnl,
-                    "entry_count": len(position.history),
-                    "avg_leverage": avg_leverage
-                })
-                print(f"❌ Exit @ {price:.2f} | PnL: ${pnl:.2f}")
+            if price <= entry_price * (1 - self.stop_loss_pct) or price >= entry_price * (1 + self.take_profit_pct):
+                pnl = self._close(time, price)
+                if self.verbose:
+                    print(f"❌ Exit @ {price:.2f} | PnL: ${pnl:.2f}")
                 position = None
 
         if signal == 1 and not position:
-            bet_risk = 0.01 + (0.01 * (i % 5))
-            bet_amount = capital * bet_risk
-            size = bet_amount / price
-            leverage = min(1 + (i % max_leverage), max_leverage)
-            position = DynamicPosition(price, size, leverage, entry_time=time)
-            print(f"📈 Enter Long @ {price:.2f} | Size: {size:.2f} | Leverage: {leverage}x")
+            bet_risk, leverage = self._sizing(i)
+            if bet_risk > 0 and leverage > 0:       # a sizer can veto the entry with 0
+                bet_amount = self.capital * bet_risk
+                size = bet_amount / price
+                self.position = DynamicPosition(price, size, leverage, entry_time=time)
+                self._open_leg(i, price, size * leverage)
+                if self.verbose:
+                    print(f"📈 Enter Long @ {price:.2f} | Size: {size:.2f} | Leverage: {leverage:g}x")
 
         elif signal == 1 and position and len(position.history) == 1:
-            bet_amount = capital * 0.01
+            bet_amount = self.capital * 0.01
             size = bet_amount / price
-            leverage = min(3, max_leverage)
+            leverage = min(3, self.max_leverage)
             position.add(price, size, leverage)
-            print(f"➕ Scaled In @ {price:.2f} (Leverage {leverage}x)")
-
-        equity_curve.append({
-            "timestamp": time,
-            "equity": capital
-        })
-
-    if position:
-        final_price = df.iloc[-1]['close']
-        pnl, size, avg_leverage = position.exit_position(final_price)
-        capital += pnl
-        trade_log.append({
-            "entry_time": position.entry_time,
-            "exit_time": df.iloc[-1].name,
-            "pnl": pnl,
-            "entry_count": len(position.history),
-            "avg_leverage": avg_leverage
-        })
-        print(f"⏹️ Forced Exit @ {final_price:.2f} | PnL: ${pnl:.2f}")
-
-    equity_df = pd.DataFrame(equity_curve)
-    trade_df = pd.DataFrame(trade_log)
-    equity_df["cum_max"] = equity_df["equity"].cummax()
-    equity_df["drawdown"] = equity_df["equity"] / equity_df["cum_max"] - 1
-
-    return trade_df, equity_df
+            self._open_leg(i, price, size * leverage)
+            if self.verbose:
+                print(f"➕ Scaled In @ {price:.2f} (Leverage {leverage}x)")
+
+        self.bar_index += 1
+        if self.metrics is not None and self.legs is None:
+            self.metrics.update(self.capital)
+        if self.kill_drawdown is not None:
+            if self.capital > self.peak_capital:
+                self.peak_capital = self.capital
+            elif self.capital <= self.peak_capital * (1 - self.kill_drawdown):
+                self.killed = True
+        return self.capital
+
+    def run(self, timestamps, closes, signals, equity=None):
+        # Steps through a block of bars, stopping after the bar that trips the kill
+        # threshold. Returns the number of bars processed; `equity` is filled if given.
+        first_bar = self.bar_index
+        if equity is None and self.legs is not None:
+            equity = np.empty(len(closes))
+        bars = zip(timestamps, closes, signals)
+        n = len(closes)
+        if equity is None:
+            for j, (time, price, signal) in enumerate(bars):
+                self.step(time, price, signal)
+                if self.killed:
+                    return j + 1
+        else:
+            for j, (time, price, signal) in enumerate(bars):
+                equity[j] = self.step(time, price, signal)
+                if self.killed:
+                    n = j + 1
+                    break
+        if self.legs is not None:
+            self.mark(first_bar, closes[:n], equity[:n])
+        return n
+
+    def mark(self, first_bar, closes, equity):
+        # Adds unrealized PnL to a block's realized equity in place, once the loop has
+        # settled which bars each leg was held; metrics then see the marked curve
+        equity += self.legs.unrealized(first_bar, closes)
+        self.legs.prune()
+        if self.metrics is not None:
+            for value in equity:
+                self.metrics.update(value)
+
+    def force_exit(self, time, price):
+        if self.position:
+            pnl = self._close(time, price)
+            if self.verbose:
+                print(f"⏹️ Forced Exit @ {price:.2f} | PnL: ${pnl:.2f}")
+
+
+def backtest_signals(timestamps, closes, signals, tz=None, initial_capital=100000,
+                     stop_loss_pct=0.002, take_profit_pct=0.004, max_leverage=4,
+                     metrics=None, record_equity=True, verbose=True, kill_drawdown=None,
+                     datetimes=True, recorder=None, equity_runs=False, mark_to_market=False,
+                     fills=None, sizing=None, bars=None):
+    # Runs the simulator over precomputed arrays (int64 epoch-ns timestamps, closes,
+    # signals), so sweeps can reuse one indicator pass across many windows.
+    # With kill_drawdown set the run stops early and the equity curve is truncated.
+    # datetimes=False returns epoch-ns int64 time columns (no tz-aware conversion).
+    # recorder: a record_log.BacktestRecorder; records stream to disk block by block
+    # and (None, None) is returned. equity_runs=True returns the equity curve run-length
+    # compressed (ledger.EquityRuns frame: change points plus the last bar), and the
+    # simulation runs in blocks so no per-bar equity array is held for the whole run.
+    # mark_to_market=True values open positions at each bar's close (intratrade drawdown).
+    # fills: a ledger.LegLedger that receives every entry leg with its exit bar (offsets
+    # into these arrays) for cost_model.apply_costs / cost_sensitivity.
+    # sizing: a position_sizing sizer or SIZERS name (or (bet_risk, leverage) arrays);
+    # bars: optional aligned high/low arrays the sizer may read.
+    if sizing is not None:
+        sizing = sizing_arrays(sizing, closes, signals, bars, stop_loss_pct, take_profit_pct, max_leverage)
+    state = AdvancedBacktestState(initial_capital, stop_loss_pct, take_profit_pct, max_leverage,
+                                  tz=tz, metrics=metrics, verbose=verbose, kill_drawdown=kill_drawdown,
+                                  mark_to_market=mark_to_market, fills=fills, sizing=sizing)
+    if recorder is not None:
+        _record_blocks(state, timestamps, closes, signals, tz, recorder)
+        return None, None
+    if equity_runs and record_equity:
+        runs = EquityRuns(tz=tz)
+        n = 0
+        for start, n, equity in _run_blocks(state, timestamps, closes, signals, BLOCK_ROWS):
+            runs.extend(timestamps[start:n], equity)
+        if state.position:
+            state.force_exit(timestamps[n - 1], closes[n - 1])
+        return state.trades.to_frame(datetimes=datetimes), runs.to_frame(datetimes=datetimes)
+
+    equity = np.empty(len(closes)) if record_equity else None
+    n = state.run(timestamps, closes, signals, equity)
+
+    if state.position:
+        state.force_exit(timestamps[n - 1], closes[n - 1])
+    trades = state.trades.to_frame(datetimes=datetimes)
+    if not record_equity:
+        return trades, None
+
+    ledger = EquityLedger(capacity=n, tz=tz)
+    ledger.extend(timestamps[:n], equity[:n])
+    return trades, ledger.to_frame(datetimes=datetimes)
+
+
+def _run_blocks(state, timestamps, closes, signals, block_rows):
+    # Runs the state over consecutive blocks, yielding (start, stop, equity) for each;
+    # the equity buffer is reused, and a killed run ends after its partial block
+    equity = np.empty(min(block_rows, len(closes)))
+    for start in range(0, len(closes), block_rows):
+        stop = min(start + block_rows, len(closes))
+        k = state.run(timestamps[start:stop], closes[start:stop], signals[start:stop], equity)
+        yield start, start + k, equity[:k]
+        if state.killed:
+            break
+
+
+def _record_blocks(state, timestamps, closes, signals, tz, recorder):
+    recorder.open(tz)
+    n = 0
+    try:
+        for start, n, equity in _run_blocks(state, timestamps, closes, signals, recorder.block_rows):
+            recorder.write_equity(timestamps[start:n], equity)
+            recorder.write_trades(state.trades)
+        if state.position:
+            state.force_exit(timestamps[n - 1], closes[n - 1])
+            recorder.write_trades(state.trades)
+    finally:
+        recorder.close()
+
+
+def simulate_strategy_advanced(df, strategy="sma_ema", initial_capital=100000,
+                                stop_loss_pct=0.002, take_profit_pct=0.004,
+                                max_leverage=4, symbol="", metrics=None, record_equity=True,
+                                recorder=None, equity_runs=False, mark_to_market=False,
+                                costs=None, sizing=None, **indicator_params):
+    # metrics: optional online_metrics.RunningMetrics updated every bar and trade.
+    # With record_equity=False no equity curve is kept and None is returned for it.
+    # With a record_log.BacktestRecorder the records go to disk instead (None, None).
+    # equity_runs=True returns the equity curve as change points (see backtest_signals).
+    # mark_to_market=True includes unrealized PnL of the open position in equity.
+    # costs: a cost_model.CostModel; trades and equity are returned net of its costs
+    # (metrics still see the gross run).
+    # sizing: a position_sizing sizer or SIZERS name; None keeps the legacy sizing.
+    if costs is not None and (recorder is not None or equity_runs):
+        raise ValueError("costs are applied to in-memory per-bar results (no recorder or equity_runs)")
+    if symbol:
+        print(f"\n🔍 Running advanced backtest for: {symbol}")
+
+    df = apply_indicators(df, strategy=strategy, **indicator_params)
+    timestamps, tz = index_to_int64(df.index)
+    fills = LegLedger() if costs is not None else None
+    trades, equity = backtest_signals(timestamps, df['close'].to_numpy(), df['signal'].to_numpy(), tz,
+                                      initial_capital, stop_loss_pct, take_profit_pct, max_leverage,
+                                      metrics=metrics, record_equity=record_equity, recorder=recorder,
+                                      equity_runs=equity_runs, mark_to_market=mark_to_market, fills=fills,
+                                      sizing=sizing, bars=df)
+    if costs is not None:
+        trades, equity = apply_costs(trades, equity, fills, df, costs)
+    return trades, equity
@@ -1,10 +1,10 @@
+from metrics import compute_metrics, INTRADAY_PERIODS
+
+
 def calculate_sharpe_ratio(equity_df, risk_free_rate=0.0):
-    equity_df = equity_df.copy()
-    equity_df['returns'] = equity_df['equity'].pct_change()
-    excess_returns = equity_df['returns'] - risk_free_rate
-    sharpe = excess_returns.mean() / excess_returns.std()
-    return sharpe * (252 * 78)**0.5 if sharpe and sharpe != float('inf') else 0
+    return compute_metrics(equity_df, periods_per_year=INTRADAY_PERIODS,
+                           risk_free_rate=risk_free_rate)['sharpe']
 
 def calculate_volatility(equity_df):
-    returns = equity_df['equity'].pct_change().dropna()
-    return returns.std() * (252 * 78)**0.5  # Annualized intraday volatility
+    # Annualized intraday volatility
+    return compute_metrics(equity_df, periods_per_year=INTRADAY_PERIODS)['annual_volatility']
@@ -2,9 +2,13 @@
 # Author: Monte Krull
 # Simulates SMA/EMA crossover strategy with scaling, leverage, equity tracking, and performance metrics
 
+import math
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from metrics import compute_metrics, trade_stats, pnl_values
+from ledger import EquityLedger, LegLedger, TradeLedger, SCALING_TRADE_DTYPE, index_to_int64
 
 class Position:
     def __init__(self, entry_price, base_size, leverage):
@@ -38,22 +42,34 @@ def apply_indicators(df):
     df.loc[df['ema_20'] < df['sma_20'], 'signal'] = -1
     return df
 
-def simulate_strategy(df):
+def simulate_strategy_loop(df, metrics=None, record_equity=True, mark_to_market=False):
+    # Reference per-bar implementation of simulate_strategy (kept for benchmarks and
+    # equivalence checks).
+    # metrics: optional online_metrics.RunningMetrics updated every bar and trade
+    # mark_to_market: equity includes the open Position legs' unrealized PnL, filled in
+    # vectorized after the loop (ledger.LegLedger). Scale-outs do not change the exit
+    # PnL (exit_position prices every history leg), so they are not marked either.
     position = None
-    trade_log = []
     capital = 100000
-    equity_curve = []
+    timestamps, tz = index_to_int64(df.index)
+    closes = df['close'].to_numpy()
+    signals = df['signal'].to_numpy()
+    trade_log = TradeLedger(SCALING_TRADE_DTYPE, tz=tz)
+    legs = LegLedger() if mark_to_market else None
+    keep_equity = record_equity or mark_to_market
+    equity = np.empty(max(len(df) - 20, 0) if keep_equity else 0)
 
     for i in range(20, len(df)):
-        row = df.iloc[i]
-        price = row['close']
-        signal = row['signal']
-        timestamp = row.name
+        price = closes[i]
+        signal = signals[i]
+        timestamp = timestamps[i]
 
         if position is None:
             if signal == 1:
                 base_size = capital * 0.5 / price
                 position = Position(entry_price=price, base_size=base_size, leverage=2)
+                if legs is not None:
+                    legs.append(i, price, base_size * 2)
                 print(f"📈 Enter Long @ {price:.2f}")
 
         else:
@@ -62,11 +78,15 @@ def simulate_strategy(df):
             if price >= last_entry_price * 1.005 and position.scaled_steps == 0:
                 add_size = capital * 0.25 / price
                 position.scale_in(price, add_size, 3)
+                if legs is not None:
+                    legs.append(i, price, add_size * 3)
                 print(f"➕ Scaled In @ {price:.2f} (Leverage 3x)")
 
             elif price >= last_entry_price * 1.01 and position.scaled_steps == 1:
                 add_size = capital * 0.25 / price
                 position.scale_in(price, add_size, 4)
+                if legs is not None:
+                    legs.append(i, price, add_size * 4)
                 print(f"➕ Final Scale @ {price:.2f} (Leverage 4x)")
 
             elif price <= last_entry_price * 0.995 and position.size > 0:
@@ -77,29 +97,213 @@ def simulate_strategy(df):
             elif signal == -1:
                 pnl = position.exit_position(price)
                 avg_lev = np.mean([lev for _, _, lev in position.history])
-                trade_log.append({
-                    'exit_time': timestamp,
-                    'pnl': pnl,
-                    'entry_count': len(position.history),
-                    'avg_leverage': round(avg_lev, 2)
-                })
+                trade_log.append(timestamp, pnl, len(position.history), round(avg_lev, 2))
 
                 print(f"❌ Exit @ {price:.2f} | PnL: ${pnl:.2f}")
                 capital += pnl
                 position = None
+                if legs is not None:
+                    legs.close(i)
+                if metrics is not None:
+                    metrics.record_trade(pnl)
+
+        if keep_equity:
+            equity[i - 20] = capital
+        if metrics is not None and legs is None:
+            metrics.update(capital)
+
+    if legs is not None:
+        equity += legs.unrealized(20, closes[20:])
+        if metrics is not None:
+            for value in equity:
+                metrics.update(value)
+
+    if not record_equity:
+        return trade_log.to_frame(), None
+
+    equity_curve = EquityLedger(capacity=len(equity), tz=tz)
+    equity_curve.extend(timestamps[20:], equity)
+    return trade_log.to_frame(), equity_curve.to_frame(drawdown=False)
+
+# === Loop-free engine ===
+def _next_bar(mask):
+    # For every bar (plus one past the end), the first bar at or after it where mask
+    # is set; len(mask) when there is none
+    n = len(mask)
+    bars = np.where(mask, np.arange(n), n)
+    return np.append(np.minimum.accumulate(bars[::-1])[::-1], n).tolist()
+
+
+def _scan(closes, next_sell, start, up=None, lo=None):
+    # From bar `start`: the first scale-in (close >= up) or exit (signal -1 with the close
+    # not at or below lo, where closes at or below lo are scale-outs; lo=None: any close),
+    # whichever comes first. Jumps from sell bar to sell bar; the scale-in threshold is
+    # checked on the closes in between. Returns (scale_in_bar, exit_bar), at most one set.
+    n = len(closes)
+    checked = start
+    sell = next_sell[start]
+    while True:
+        stop = min(sell + 1, n)
+        if up is not None and stop > checked:
+            hits = closes[checked:stop] >= up
+            first = int(hits.argmax())
+            if hits[first]:
+                return checked + first, None
+            checked = stop
+        if sell >= n:
+            return None, None
+        if lo is None or not closes[sell] <= lo:
+            return None, sell
+        sell = next_sell[sell + 1]
+
+
+def _cut(size, cuts):
+    # Position.scale_out `cuts` times; returns the new size and, if it reaches 0, the
+    # index of the cut that zeroed it. Far from underflow the product is closed-form;
+    # the exact repeated subtraction only runs when a phase has thousands of cuts.
+    if size <= 0 or not cuts:
+        return size, None
+    if cuts * math.log(4 / 3) < math.log(size) + 650:
+        return size * 0.75 ** cuts, None
+    for k in range(cuts):
+        size = max(size - size * 0.25, 0)
+        if size == 0:
+            return 0.0, k
+    return size, None
+
+
+def _underflow_bars(size):
+    # Bars a position can be held before 25% scale-outs could floor its size at 0
+    return (math.log(size) + 650) / math.log(4 / 3) if size > 0 else 0
+
+
+def simulate_strategy(df, metrics=None, record_equity=True, mark_to_market=False, verbose=True,
+                      fills=None):
+    # Same trades, equity and log lines as simulate_strategy_loop, without the per-bar
+    # loop. Entries are the first signal 1 after the previous exit. Inside a trade the
+    # +0.5% / +1% scale-ins and the scale-outs (closes 0.5% under the last entry, which
+    # block an exit on signal -1) are found per phase by jumping between sell bars and
+    # testing the scale-in threshold on the closes in between. Python only runs per
+    # trade and phase (and per log line when verbose).
+    # metrics: optional online_metrics.RunningMetrics updated every bar and trade
+    # mark_to_market: equity includes the open Position legs' unrealized PnL
+    # (ledger.LegLedger). Scale-outs do not change the exit PnL (exit_position prices
+    # every history leg), so they are not marked either.
+    # fills: a ledger.LegLedger that receives every entry leg and its exit bar (df row
+    # offsets), for cost_model.apply_costs(..., first_bar=20)
+    capital = 100000
+    timestamps, tz = index_to_int64(df.index)
+    closes = df['close'].to_numpy()
+    signals = df['signal'].to_numpy()
+    trade_log = TradeLedger(SCALING_TRADE_DTYPE, tz=tz)
+    legs = LegLedger() if mark_to_market else None
+    ledgers = [ledger for ledger in (legs, fills) if ledger is not None]
+    n = len(df)
+    prices = closes.tolist()
+    next_entry = _next_bar(signals == 1)
+    next_sell = _next_bar(signals == -1)
+    exit_bars, capitals = [], []
+    phases = ((1.005, 3, "Scaled In"), (1.01, 4, "Final Scale"), (None, None, None))
+
+    bar = 20
+    while bar < n and next_entry[bar] < n:
+        entry = next_entry[bar]
+        price = prices[entry]
+        base_size = capital * 0.5 / price
+        position = Position(entry_price=price, base_size=base_size, leverage=2)
+        for ledger in ledgers:
+            ledger.append(entry, price, base_size * 2)
+        lines = [(entry, f"📈 Enter Long @ {price:.2f}")] if verbose else None
+
+        # Position size only matters once it could underflow to 0 (size > 0 gates the
+        # scale-outs); until then it is not tracked
+        limit = _underflow_bars(base_size)
+        held, adds, size = [], [], None
+        last_bar, exit_bar = entry, None
+        for rise, leverage, label in phases:
+            up = prices[last_bar] * rise if rise else None
+            lo = prices[last_bar] * 0.995 if capital > 0 and size != 0 else None
+            start = last_bar + 1
+            scale_in, exit_bar = _scan(closes, next_sell, start, up, lo)
+            end = scale_in if scale_in is not None else exit_bar if exit_bar is not None else n
+            cuts = None
+            if lo is not None and (size is not None or end - entry > limit):
+                if size is None:
+                    size = base_size
+                    for (s, e, l), add in zip(held, adds):
+                        size = _cut(size, int(np.count_nonzero(closes[s:e] <= l)))[0] + add
+                cuts = start + np.flatnonzero(closes[start:end] <= lo)
+                size, zeroed = _cut(size, len(cuts))
+                if zeroed is not None:
+                    # Floored at 0: later closes under lo no longer block the exit
+                    cuts = cuts[:zeroed + 1]
+                    scale_in, exit_bar = _scan(closes, next_sell, int(cuts[-1]) + 1, up)
+            if verbose and lo is not None:
+                if cuts is None:
+                    cuts = start + np.flatnonzero(closes[start:end] <= lo)
+                lines.extend((int(i), f"➖ Scaled Out @ {prices[i]:.2f}") for i in cuts)
+            if scale_in is None:
+                break
+            price = prices[scale_in]
+            add_size = capital * 0.25 / price
+            position.scale_in(price, add_size, leverage)
+            held.append((start, scale_in, lo))
+            adds.append(add_size)
+            if size is not None:
+                size += add_size
+            for ledger in ledgers:
+                ledger.append(scale_in, price, add_size * leverage)
+            if verbose:
+                lines.append((scale_in, f"➕ {label} @ {price:.2f} (Leverage {leverage}x)"))
+            last_bar = scale_in
+
+        if exit_bar is not None:
+            price = prices[exit_bar]
+            pnl = position.exit_position(price)
+            levs = [lev for _, _, lev in position.history]
+            trade_log.append(timestamps[exit_bar], pnl, len(levs), round(sum(levs) / len(levs), 2))
+            if verbose:
+                lines.append((exit_bar, f"❌ Exit @ {price:.2f} | PnL: ${pnl:.2f}"))
+            capital += pnl
+            exit_bars.append(exit_bar)
+            capitals.append(capital)
+            for ledger in ledgers:
+                ledger.close(exit_bar)
+            if metrics is not None:
+                metrics.record_trade(pnl)
+        if verbose:
+            print("\n".join(line for _, line in sorted(lines, key=lambda item: item[0])))
+        if exit_bar is None:
+            break
+        bar = exit_bar + 1
+
+    # Capital only moves at exits: one run of constant equity per trade
+    runs = np.diff(np.array([20, *exit_bars, max(n, 20)]))
+    values = np.array([100000, *capitals], dtype="float64")
+    equity = np.repeat(values, runs)
+    if legs is not None:
+        equity += legs.unrealized(20, closes[20:])
+        if metrics is not None:
+            for value in equity:
+                metrics.update(value)
+    elif metrics is not None:
+        for value, count in zip(values.tolist(), runs.tolist()):
+            if count:
+                metrics.update(value, bars=count)
+    if not record_equity:
+        return trade_log.to_frame(), None
 
-        equity_curve.append({'timestamp': timestamp, 'equity': capital})
+    equity_curve = EquityLedger(capacity=len(equity), tz=tz)
+    equity_curve.extend(timestamps[20:], equity)
+    return trade_log.to_frame(), equity_curve.to_frame(drawdown=False)
 
-    return pd.DataFrame(trade_log), pd.DataFrame(equity_curve)
 
 def load_price_data(file_path):
     df = pd.read_csv(file_path, index_col='timestamp', parse_dates=True)
     return df[['close']]
 
 def calculate_max_drawdown(equity_df):
-    equity_df['cum_max'] = equity_df['equity'].cummax()
-    equity_df['drawdown'] = equity_df['equity'] / equity_df['cum_max'] - 1
-    max_dd = equity_df['drawdown'].min()
+    max_dd = compute_metrics(equity_df)['max_drawdown']
     print(f"\n📉 Max Drawdown: {max_dd:.2%}")
     return max_dd
 
@@ -114,19 +318,15 @@ def plot_equity_curve(equity_df):
     plt.legend()
     plt.show()
 
+# Legacy convention: daily annualization, first bar counted as a 0% return, population std
 def calculate_sharpe_ratio(equity_df, risk_free_rate=0.01):
-    equity_df['returns'] = equity_df['equity'].pct_change().fillna(0)
-    excess_returns = equity_df['returns'] - (risk_free_rate / 252)
-    sharpe = np.mean(excess_returns) / np.std(excess_returns) * np.sqrt(252)
-    return round(sharpe, 2)
+    m = compute_metrics(equity_df, periods_per_year=252, risk_free_rate=risk_free_rate / 252,
+                        ddof=0, fill_first=True)
+    return round(m['sharpe'], 2)
 
 def calculate_trade_stats(trade_df):
-    wins = trade_df[trade_df['pnl'] > 0]
-    losses = trade_df[trade_df['pnl'] < 0]
-    win_rate = len(wins) / len(trade_df) if len(trade_df) > 0 else 0
-    avg_win = wins['pnl'].mean() if not wins.empty else 0
-    avg_loss = losses['pnl'].mean() if not losses.empty else 0
-    return round(win_rate * 100, 2), round(avg_win, 2), round(avg_loss, 2)
+    stats = trade_stats(pnl_values(trade_df))
+    return round(stats['win_rate'] * 100, 2), round(stats['avg_win'], 2), round(stats['avg_loss'], 2)
 
 # === MAIN TEST BLOCK ===
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+# bar_loader.py
+# Purpose: Bar CSV loading with fast timestamp parsing, column projection and an
+# optional compact-memory mode for sweeps. Compact mode reads prices as float32, counts as int32 and the
+# symbol as a categorical, and KernelContext follows the frame's float width, so
+# derived series (SMA, EMA, bands, RSI) are stored as float32 as well. Signals are
+# int8 in both modes. The accuracy check runs a strategy on the same bars in float64
+# and float32 and reports indicator error and signal disagreement.
+#
+# Usage:
+#   bars = load_bars("SPY_5Min_strategy_2d.csv", strategies=["macd"], compact=True)
+#   python bar_loader.py SPY_5Min_strategy_2d.csv --strategies sma_ema macd     # memory + accuracy report
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from ledger import int64_to_datetime, parse_timestamps
+from strategy_engine import REGISTRY, KernelContext, compute_signals, get_strategy
+
+# float32 keeps ~7 significant digits: exact to the cent for prices below $100k.
+# Volume stays float64 because 5-minute volumes can exceed float32's 2**24 integer range.
+COMPACT_DTYPES = {
+    "open": "float32", "high": "float32", "low": "float32", "close": "float32", "vwap": "float32",
+    "trade_count": "int32", "volume": "float64", "symbol": "category",
+}
+FULL_DTYPES = {"symbol": "category"}
+
+
+def strategy_columns(strategies):
+    # Union of the input columns the given strategies read
+    columns = []
+    for name in strategies:
+        for column in get_strategy(name).inputs:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+# === Loading ===
+def load_bars(path, columns=None, strategies=None, compact=False, **read_kwargs):
+    # columns: explicit projection; strategies: project to their inputs instead.
+    # With neither, every column is read (and the symbol is still categorical).
+    # Projection also narrows the NaN check apply_indicators does on the whole frame:
+    # only the loaded columns can invalidate a row.
+    if columns is None and strategies is not None:
+        columns = strategy_columns(strategies)
+    dtypes = COMPACT_DTYPES if compact else FULL_DTYPES
+    usecols = None if columns is None else ["timestamp", *columns]
+    header = pd.read_csv(path, nrows=0).columns
+    dtype = {c: t for c, t in dtypes.items() if c in header and (usecols is None or c in usecols)}
+    frames = pd.read_csv(path, usecols=usecols, dtype=dtype, **read_kwargs)
+    if read_kwargs.get("chunksize"):
+        return (_index_timestamps(chunk) for chunk in frames)
+    return _index_timestamps(frames)
+
+
+def _index_timestamps(df):
+    # Timestamps are parsed to epoch-ns once (ledger.parse_timestamps) instead of by
+    # read_csv's per-string date parser, then wrapped as the usual tz-aware index
+    values, tz = parse_timestamps(df.pop("timestamp").to_numpy())
+    df.index = int64_to_datetime(values, tz).rename("timestamp")
+    return df
+
+
+def compact_frame(df, columns=None):
+    # In-memory version of load_bars(compact=True) for frames that are already loaded
+    if columns is not None:
+        df = df[list(columns)]
+    return df.astype({c: t for c, t in COMPACT_DTYPES.items() if c in df.columns})
+
+
+def bytes_per_bar(df):
+    return df.memory_usage(deep=True, index=True).sum() / max(len(df), 1)
+
+
+# === Accuracy check ===
+def accuracy_check(df, strategy, params=None):
+    # Runs the kernel on float64 and float32 copies of the same projected bars
+    columns = list(get_strategy(strategy).inputs)
+    full = df[columns].astype("float64")
+    compact = compact_frame(full)
+    sig64, valid64, cols64 = compute_signals(KernelContext(full), strategy, params)
+    sig32, valid32, cols32 = compute_signals(KernelContext(compact), strategy, params)
+    both = valid64 & valid32
+    errors = {}
+    for name, values in cols64.items():
+        # Error relative to the column's magnitude (MACD lines cross zero, so per-value
+        # relative error would blow up near the crossings that matter least)
+        a, b = values[both], cols32[name][both].astype("float64")
+        scale = max(float(np.max(np.abs(a))), 1e-12) if len(a) else 1.0
+        errors[name] = float(np.max(np.abs(b - a))) / scale if len(a) else 0.0
+    flips = int((sig64[both] != sig32[both]).sum())
+    return {
+        "strategy": strategy,
+        "bars": int(both.sum()),
+        "validity_mismatch": int((valid64 != valid32).sum()),
+        "signal_flips": flips,
+        "signal_agreement": 1 - flips / max(int(both.sum()), 1),
+        "max_rel_error": max(errors.values(), default=0.0),
+        "column_errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact bar loading: memory and float32 accuracy report")
+    parser.add_argument("csv")
+    parser.add_argument("--strategies", nargs="+", default=sorted(REGISTRY))
+    args = parser.parse_args()
+
+    full = pd.read_csv(args.csv, parse_dates=['timestamp'], index_col='timestamp')
+    columns = strategy_columns(args.strategies)
+    sizes = {
+        "full load": bytes_per_bar(full),
+        "float32 only": bytes_per_bar(compact_frame(full)),
+        f"projected {columns}": bytes_per_bar(load_bars(args.csv, columns=columns)),
+        "projected + float32": bytes_per_bar(load_bars(args.csv, columns=columns, compact=True)),
+    }
+    print(f"💾 {args.csv} (bytes per bar, index included):")
+    for label, size in sizes.items():
+        print(f" - {label:32s} {size:7.1f}  ({sizes['full load'] / size:.1f}x more bars per GB)")
+
+    print("\n🎯 float32 vs float64:")
+    for name in args.strategies:
+        check = accuracy_check(full, name)
+        print(f" - {name:20s} max rel. error {check['max_rel_error']:.2e}, "
+              f"signal agreement {check['signal_agreement']:.4%} ({check['signal_flips']} flips / {check['bars']} bars)")
@@ -7,7 +7,10 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from weasyprint import HTML
 from strategy_engine import apply_indicators
+from bar_loader import load_bars
 from advanced_backtest import simulate_strategy_advanced
+from instrumentation import StageTimer, export_json
+from metrics import compute_metrics
 
 # === Strategy Configurations ===
 configs = [
@@ -47,73 +50,79 @@ configs = [
 ]
 
 summary = []
+timers = []
 
 for config in configs:
     symbol = config["symbol"]
     strategy = config["strategy"]
     tag = f"{symbol}_{strategy}"
     print(f"➡️ Processing {tag}...")
-
-    df = pd.read_csv(f"{symbol}_5Min_strategy_2d.csv", parse_dates=['timestamp'], index_col='timestamp')
-    df = apply_indicators(df, strategy=strategy, **config["indicators"])
-
-    trades, equity = simulate_strategy_advanced(
-        df,
-        strategy=strategy,
-        initial_capital=config["capital"],
-        stop_loss_pct=config["stop_loss_pct"],
-        take_profit_pct=config["take_profit_pct"],
-        max_leverage=config["max_leverage"]
-    )
-
-    trades.to_csv(f"{tag}_trade_log.csv", index=False)
-    equity.to_csv(f"{tag}_equity_curve.csv", index=False)
+    timer = StageTimer(tag)
+    timers.append(timer)
+
+    with timer.stage("load"):
+        df = load_bars(f"{symbol}_5Min_strategy_2d.csv")
+    with timer.stage("indicators"):
+        df = apply_indicators(df, strategy=strategy, **config["indicators"])
+
+    with timer.stage("simulate"):
+        trades, equity = simulate_strategy_advanced(
+            df,
+            strategy=strategy,
+            initial_capital=config["capital"],
+            stop_loss_pct=config["stop_loss_pct"],
+            take_profit_pct=config["take_profit_pct"],
+            max_leverage=config["max_leverage"]
+        )
+
+    with timer.stage("save"):
+        trades.to_csv(f"{tag}_trade_log.csv", index=False)
+        equity.to_csv(f"{tag}_equity_curve.csv", index=False)
 
     # === Charts ===
-    plt.figure(figsize=(12, 6))
-    plt.plot(equity['timestamp'], equity['equity'], label='Equity', linewidth=2)
-    plt.title("📈 Advanced Backtest – Equity Curve")
-    plt.xlabel("Time")
-    plt.ylabel("Equity ($)")
-    plt.grid(True)
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(f"{tag}_equity_chart.png")
-    plt.close()
-
-    plt.figure(figsize=(12, 4))
-    plt.plot(equity['timestamp'], equity['drawdown'], label='Drawdown', color='red')
-    plt.fill_between(equity['timestamp'], equity['drawdown'], 0, color='red', alpha=0.3)
-    plt.title("📉 Drawdown Over Time")
-    plt.xlabel("Time")
-    plt.ylabel("Drawdown %")
-    plt.tight_layout()
-    plt.savefig(f"{tag}_drawdown_chart.png")
-    plt.close()
-
-    plt.figure(figsize=(8, 5))
-    trades['pnl'].hist(bins=20, edgecolor='black')
-    plt.title("📊 PnL Distribution")
-    plt.xlabel("PnL ($)")
-    plt.ylabel("Frequency")
-    plt.tight_layout()
-    plt.savefig(f"{tag}_pnl_histogram.png")
-    plt.close()
+    with timer.stage("chart"):
+        plt.figure(figsize=(12, 6))
+        plt.plot(equity['timestamp'], equity['equity'], label='Equity', linewidth=2)
+        plt.title("📈 Advanced Backtest – Equity Curve")
+        plt.xlabel("Time")
+        plt.ylabel("Equity ($)")
+        plt.grid(True)
+        plt.legend()
+        plt.tight_layout()
+        plt.savefig(f"{tag}_equity_chart.png")
+        plt.close()
+
+        plt.figure(figsize=(12, 4))
+        plt.plot(equity['timestamp'], equity['drawdown'], label='Drawdown', color='red')
+        plt.fill_between(equity['timestamp'], equity['drawdown'], 0, color='red', alpha=0.3)
+        plt.title("📉 Drawdown Over Time")
+        plt.xlabel("Time")
+        plt.ylabel("Drawdown %")
+        plt.tight_layout()
+        plt.savefig(f"{tag}_drawdown_chart.png")
+        plt.close()
+
+        plt.figure(figsize=(8, 5))
+        trades['pnl'].hist(bins=20, edgecolor='black')
+        plt.title("📊 PnL Distribution")
+        plt.xlabel("PnL ($)")
+        plt.ylabel("Frequency")
+        plt.tight_layout()
+        plt.savefig(f"{tag}_pnl_histogram.png")
+        plt.close()
 
     # === Stats ===
-    total_trades = len(trades)
-    win_trades = trades[trades['pnl'] > 0]
-    win_rate = (len(win_trades) / total_trades) * 100 if total_trades else 0
-    avg_pnl = trades['pnl'].mean() if total_trades else 0
-    max_drawdown = equity['drawdown'].min() * 100
-    final_equity = equity.iloc[-1]['equity']
-    volatility = equity['equity'].pct_change().std() * 100
-    sharpe_ratio = (
-        (equity['equity'].pct_change().mean() / equity['equity'].pct_change().std()) * (252**0.5)
-        if equity['equity'].pct_change().std() > 0 else 0
-    )
-
-    html = f"""
+    metrics = compute_metrics(equity, trades, periods_per_year=252)
+    total_trades = metrics['total_trades']
+    win_rate = metrics['win_rate'] * 100
+    avg_pnl = metrics['avg_pnl']
+    max_drawdown = metrics['max_drawdown'] * 100
+    final_equity = metrics['final_equity']
+    volatility = metrics['volatility'] * 100
+    sharpe_ratio = metrics['sharpe']
+
+    def render_html():
+        return f"""
     <html>
     <head><meta charset='UTF-8'><title>{tag} Report</title></head>
     <body>
@@ -138,13 +147,19 @@ for config in configs:
     <img src='{tag}_equity_chart.png'><br>
     <img src='{tag}_drawdown_chart.png'><br>
     <img src='{tag}_pnl_histogram.png'><br>
+    {timer.to_html_table()}
     </body></html>
     """
 
     html_path = f"{tag}_report.html"
+    with timer.stage("html"):
+        with open(html_path, "w") as f:
+            f.write(render_html())
+    with timer.stage("pdf"):
+        HTML(html_path).write_pdf(f"{tag}_report.pdf")
+    # Re-render so the HTML report also carries the PDF stage timing
     with open(html_path, "w") as f:
-        f.write(html)
-    HTML(html_path).write_pdf(f"{tag}_report.pdf")
+        f.write(render_html())
 
     out_dir = Path(tag)
     out_dir.mkdir(exist_ok=True)
@@ -155,6 +170,7 @@ for config in configs:
         file = f"{tag}{suffix}"
         shutil.move(file, out_dir / file)
 
+    timer.print_summary()
     summary.append((tag, total_trades, win_rate, avg_pnl, max_drawdown, final_equity, volatility, sharpe_ratio))
 
 # === Build Index Page ===
@@ -170,5 +186,6 @@ for s in summary:
     index += f"<tr><td>{s[0]}</td><td>{s[1]}</td><td>{s[2]:.2f}</td><td>{s[3]:.2f}</td><td>{s[4]:.2f}</td><td>{s[6]:.2f}</td><td>{s[7]:.2f}</td><td>{s[5]:.2f}</td><td><a href='{s[0]}/{s[0]}_report.html'>📄</a></td></tr>"
 index += "</table></body></html>"
 Path("index.html").write_text(index.strip())
+export_json(timers, "batch_timings.json")
 
 print("✅ All reports and index.html generated.")
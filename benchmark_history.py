@@ -0,0 +1,342 @@
+# benchmark_history.py
+# Purpose: Persist benchmark runs to a local history file and flag slowdowns
+# against a chosen baseline run, with an HTML trend page next to reports/index.html.
+#
+# Usage:
+#   python benchmark_history.py list
+#   python benchmark_history.py compare                      # latest vs previous run
+#   python benchmark_history.py compare --baseline 3f2a9c1   # run id or git revision prefix
+#   python benchmark_history.py compare --baseline '#12'     # history index (also -1, or up to 3 digits)
+#   python benchmark_history.py trends
+
+import argparse
+import hashlib
+import json
+import math
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+HISTORY_FILE = Path("benchmarks") / "history.jsonl"
+REPORTS_DIR = Path("reports")
+TREND_PAGE = REPORTS_DIR / "benchmark_trends.html"
+TREND_CHART_DIR = REPORTS_DIR / "benchmarks"
+
+
+# === Run metadata ===
+def machine_fingerprint(machine):
+    keys = ("platform", "processor", "cpu_count", "python")
+    raw = "|".join(str(machine.get(k)) for k in keys)
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+def git_revision():
+    def git(*args):
+        try:
+            out = subprocess.run(["git", *args], capture_output=True, text=True, check=True)
+            return out.stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "revision": git("rev-parse", "HEAD"),
+        "branch": git("rev-parse", "--abbrev-ref", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+def record_run(payload, history_path=HISTORY_FILE):
+    rev = git_revision()
+    fingerprint = machine_fingerprint(payload["machine"])
+    short_rev = (rev["revision"] or "nogit")[:7]
+    run = {
+        "run_id": f"{payload['created'].replace(':', '').replace('-', '')[:15]}-{short_rev}",
+        "git": rev,
+        "fingerprint": fingerprint,
+        **payload,
+    }
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_path, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+
+def load_history(history_path=HISTORY_FILE):
+    if not history_path.exists():
+        return []
+    with open(history_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _history_index(ref):
+    # "#N" and negative numbers are always indices; other digit strings only below the
+    # 4 characters a revision prefix needs, so an all-digit revision is never an index
+    text = ref[1:] if ref.startswith("#") else ref
+    try:
+        index = int(text)
+    except ValueError:
+        return None
+    return index if ref.startswith("#") or index < 0 or len(ref) < 4 else None
+
+
+def select_run(history, ref):
+    if ref is None:
+        return None
+    index = _history_index(ref)
+    if index is not None:
+        try:
+            return history[index]
+        except IndexError:
+            raise ValueError(f"No benchmark run at index {index} ({len(history)} recorded)") from None
+    for run in reversed(history):
+        rev = run["git"].get("revision") or ""
+        if run["run_id"] == ref or (len(ref) >= 4 and rev.startswith(ref)):
+            return run
+    raise ValueError(f"No benchmark run matches '{ref}'")
+
+
+# === Statistics ===
+def _nonzero(v):
+    return v if abs(v) > 1e-30 else 1e-30
+
+
+def _betacf(a, b, x):
+    # Continued fraction for the regularized incomplete beta (Numerical Recipes)
+    qab, qap, qam = a + b, a + 1, a - 1
+    c, d = 1.0, 1 / _nonzero(1 - qab * x / qap)
+    h = d
+    for m in range(1, 200):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1 / _nonzero(1 + aa * d)
+        c = _nonzero(1 + aa / c)
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1 / _nonzero(1 + aa * d)
+        c = _nonzero(1 + aa / c)
+        h *= d * c
+        if abs(d * c - 1) < 3e-12:
+            break
+    return h
+
+
+def _betainc(a, b, x):
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    lbeta = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+    front = math.exp(lbeta + a * math.log(x) + b * math.log(1 - x))
+    if x < (a + 1) / (a + b + 2):
+        return front * _betacf(a, b, x) / a
+    return 1 - front * _betacf(b, a, 1 - x) / b
+
+
+def student_t_sf(t, dof):
+    # P(T > t) for Student's t with `dof` degrees of freedom
+    tail = 0.5 * _betainc(dof / 2, 0.5, dof / (dof + t * t))
+    return tail if t > 0 else 1 - tail
+
+
+def welch_test(baseline, candidate):
+    # One-sided Welch t-test on log-times: H1 candidate is slower than baseline
+    a, b = np.log(baseline), np.log(candidate)
+    if len(a) < 2 or len(b) < 2:
+        return None
+    va, vb = a.var(ddof=1) / len(a), b.var(ddof=1) / len(b)
+    if va + vb == 0:
+        return 0.0 if b.mean() > a.mean() else 1.0
+    t = (b.mean() - a.mean()) / math.sqrt(va + vb)
+    dof = (va + vb) ** 2 / (va ** 2 / (len(a) - 1) + vb ** 2 / (len(b) - 1))
+    return student_t_sf(t, dof)
+
+
+def _key(result):
+    return result["name"], result["bars"], result.get("leverage", 1)
+
+
+def compare_runs(baseline, candidate, threshold=0.05, alpha=0.05):
+    base = {_key(r): r for r in baseline["results"] if "times_sec" in r}
+    rows = []
+    for r in candidate["results"]:
+        if "times_sec" not in r or _key(r) not in base:
+            continue
+        b = base[_key(r)]
+        ratio = r["median_sec"] / b["median_sec"] if b["median_sec"] else float("nan")
+        p_slower = welch_test(b["times_sec"], r["times_sec"])
+        p_faster = welch_test(r["times_sec"], b["times_sec"])
+        # Under 2 samples per run (--repeat 1) there is no t-test; judge on the ratio alone
+        slower = p_slower is None or p_slower < alpha
+        faster = p_faster is None or p_faster < alpha
+        if slower and ratio > 1 + threshold:
+            status = "slower"
+        elif faster and ratio < 1 - threshold:
+            status = "faster"
+        else:
+            status = "unchanged"
+        rows.append({
+            "name": r["name"],
+            "bars": r["bars"],
+            "leverage": r.get("leverage", 1),
+            "baseline_sec": b["median_sec"],
+            "candidate_sec": r["median_sec"],
+            "ratio": ratio,
+            "p_value": p_slower,
+            "status": status,
+        })
+    return rows
+
+
+# === HTML trend page ===
+def _plot_trend(name, bars, runs, points, path):
+    plt.figure(figsize=(6, 3))
+    plt.plot(range(len(points)), points, marker="o")
+    plt.xticks(range(len(points)), [r["run_id"][-7:] for r in runs], rotation=45, fontsize=7)
+    plt.title(f"{name} – {bars:,} bars", fontsize=9)
+    plt.ylabel("Median (s)")
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+
+def render_trend_page(history, comparison=None, baseline=None, candidate=None,
+                      output=TREND_PAGE, chart_dir=TREND_CHART_DIR):
+    chart_dir.mkdir(parents=True, exist_ok=True)
+    series = {}
+    for run in history:
+        for r in run["results"]:
+            if "median_sec" in r and r.get("leverage", 1) == 1:
+                series.setdefault((r["name"], r["bars"]), []).append((run, r["median_sec"]))
+
+    html = """<html><head>
+    <title>Benchmark Trends</title>
+    <style>
+        body { font-family: Arial; padding: 2em; background: #f9f9f9; }
+        h1 { margin-bottom: 1em; }
+        .grid { display: flex; flex-wrap: wrap; gap: 1em; }
+        .card {
+            background: white;
+            border-radius: 8px;
+            padding: 1em;
+            box-shadow: 0 0 10px rgba(0,0,0,0.1);
+            width: 440px;
+        }
+        .symbol { font-size: 1.1em; font-weight: bold; }
+        .meta, .stat { font-size: 0.9em; color: #555; margin: 0.3em 0; }
+        img { max-width: 100%; }
+        table { border-collapse: collapse; background: white; margin-bottom: 2em; }
+        th, td { border: 1px solid #ccc; padding: 0.4em; text-align: right; }
+        .slower { color: #c0392b; font-weight: bold; }
+        .faster { color: #27ae60; }
+        a { text-decoration: none; color: #007acc; }
+        a:hover { text-decoration: underline; }
+    </style>
+    </head><body>
+    <h1>⏱️ Benchmark Trends</h1>
+    """
+
+    if comparison:
+        html += f"""
+    <div class="meta">Baseline <b>{baseline['run_id']}</b> vs candidate <b>{candidate['run_id']}</b></div>
+    <table>
+    <tr><th>Benchmark</th><th>Bars</th><th>Lev</th><th>Baseline (s)</th><th>Candidate (s)</th><th>Ratio</th><th>p</th><th>Status</th></tr>
+    """
+        for row in comparison:
+            p = "–" if row["p_value"] is None else f"{row['p_value']:.3f}"
+            html += (f"<tr class='{row['status']}'><td>{row['name']}</td><td>{row['bars']:,}</td>"
+                     f"<td>{row['leverage']}</td><td>{row['baseline_sec']:.4f}</td>"
+                     f"<td>{row['candidate_sec']:.4f}</td><td>{row['ratio']:.2f}</td>"
+                     f"<td>{p}</td><td>{row['status']}</td></tr>\n")
+        html += "</table>\n"
+
+    html += '<div class="grid">\n'
+    for (name, bars), points in sorted(series.items()):
+        runs = [run for run, _ in points]
+        safe = "".join(c if c.isalnum() else "_" for c in name)
+        chart = chart_dir / f"{safe}_{bars}.png"
+        _plot_trend(name, bars, runs, [t for _, t in points], chart)
+        html += f"""
+        <div class="card">
+            <div class="symbol">{name}</div>
+            <div class="meta">{bars:,} bars · {len(points)} runs · latest {points[-1][1]:.4f}s</div>
+            <img src="{chart.relative_to(output.parent)}">
+        </div>
+        """
+    html += '</div><p class="meta"><a href="index.html">← Strategy Report Index</a></p></body></html>'
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(html)
+    print(f"✅ Trend page generated: {output}")
+    return output
+
+
+# === CLI ===
+def _default_baseline(history, candidate):
+    same_machine = [r for r in history if r["fingerprint"] == candidate["fingerprint"]
+                    and r["run_id"] != candidate["run_id"]]
+    if not same_machine:
+        raise ValueError("No earlier run on this machine to compare against")
+    return same_machine[-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark history and regression report")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List recorded runs")
+    cmp_parser = sub.add_parser("compare", help="Flag slowdowns against a baseline run")
+    cmp_parser.add_argument("--baseline", help="Run id, git revision prefix, or history index (#N, -N, or up to 3 digits)")
+    cmp_parser.add_argument("--candidate", default="-1", help="Run to check (default: latest)")
+    cmp_parser.add_argument("--threshold", type=float, default=0.05, help="Minimum relative slowdown")
+    cmp_parser.add_argument("--alpha", type=float, default=0.05, help="Significance level")
+    sub.add_parser("trends", help="Render the HTML trend page only")
+    args = parser.parse_args(argv)
+
+    history = load_history(args.history)
+    if not history:
+        print(f"❌ No benchmark history at {args.history}. Run benchmark_suite.py first.")
+        return 1
+
+    if args.command == "list":
+        for i, run in enumerate(history):
+            dirty = "*" if run["git"].get("dirty") else ""
+            print(f"{i:>3}  {run['run_id']}{dirty}  {run['fingerprint']}  sizes={run['sizes']}")
+        return 0
+
+    if args.command == "trends":
+        render_trend_page(history)
+        return 0
+
+    candidate = select_run(history, args.candidate)
+    baseline = select_run(history, args.baseline) or _default_baseline(history, candidate)
+    if baseline["fingerprint"] != candidate["fingerprint"]:
+        print("⚠️ Baseline and candidate ran on different machines; timings may not be comparable.")
+
+    rows = compare_runs(baseline, candidate, threshold=args.threshold, alpha=args.alpha)
+    print(f"\n📊 {candidate['run_id']} vs baseline {baseline['run_id']}")
+    for row in rows:
+        flag = {"slower": "🔴", "faster": "🟢"}.get(row["status"], "  ")
+        print(f"{flag} {row['name']:<50} {row['bars']:>10,}  {row['leverage']}x  "
+              f"ratio {row['ratio']:.2f}  {row['status']}")
+    render_trend_page(history, rows, baseline, candidate)
+
+    untested = [r for r in rows if r["p_value"] is None]
+    if untested:
+        print(f"\n⚠️ {len(untested)} benchmark(s) have fewer than 2 samples in a run; judged on the "
+              f"median ratio alone (> {args.threshold:.0%}). Run benchmark_suite.py with --repeat 2 or more for a significance test.")
+
+    slowdowns = [r for r in rows if r["status"] == "slower"]
+    if slowdowns:
+        print(f"\n❌ {len(slowdowns)} slowdown(s) detected.")
+        return 2
+    print("\n✅ No significant slowdowns.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,274 @@
+# benchmark_suite.py
+# Purpose: Time the strategy engine, simulators, metrics and report generation on
+# reproducible synthetic minute bars and emit the results as JSON.
+#
+# Usage:
+#   python benchmark_suite.py                         # quick preset (10k, 100k bars)
+#   python benchmark_suite.py --preset full           # 10k .. 10M bars
+#   python benchmark_suite.py --sizes 50000 --only simulate_strategy_advanced
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import analysis_extras
+import backtest_scaling
+from benchmark_history import HISTORY_FILE, record_run
+from advanced_backtest import simulate_strategy_advanced
+from strategy_engine import REGISTRY, apply_indicators
+from synthetic_leverage import synthesize_leveraged
+
+PRESETS = {
+    "quick": [10_000, 100_000],
+    "full": [10_000, 100_000, 1_000_000, 10_000_000],
+}
+STRATEGIES = list(REGISTRY)
+LEVERAGES = [1, 2, 3]
+OUTPUT_DIR = Path("benchmarks")
+
+# SPY-like regular session: 390 one-minute bars, ~18% annualized volatility
+SESSION_OPEN = pd.Timedelta(hours=13, minutes=30)
+BARS_PER_DAY = 390
+ANNUAL_VOL = 0.18
+ANNUAL_DRIFT = 0.07
+
+
+# === Synthetic fixtures ===
+def make_minute_index(n_bars, start="2015-01-02"):
+    n_days = -(-n_bars // BARS_PER_DAY)
+    days = pd.bdate_range(start, periods=n_days, tz="UTC") + SESSION_OPEN
+    offsets = np.arange(BARS_PER_DAY, dtype="int64") * 60_000_000_000
+    stamps = (days.asi8[:, None] + offsets[None, :]).ravel()[:n_bars]
+    return pd.DatetimeIndex(pd.to_datetime(stamps, utc=True), name="timestamp")
+
+
+def make_synthetic_bars(n_bars, symbol="SYN", leverage=1, seed=42, start_price=400.0):
+    rng = np.random.default_rng(seed)
+    periods = 252 * BARS_PER_DAY
+    sigma = ANNUAL_VOL / np.sqrt(periods)
+    mu = ANNUAL_DRIFT / periods - 0.5 * sigma ** 2
+
+    # Fat-ish tails: Student-t shocks scaled to unit variance
+    shocks = rng.standard_t(df=5, size=n_bars) / np.sqrt(5 / 3)
+    returns = leverage * (mu + sigma * shocks)
+    close = start_price * np.exp(np.cumsum(returns))
+    open_ = np.empty_like(close)
+    open_[0] = start_price
+    open_[1:] = close[:-1]
+
+    wick = np.abs(rng.normal(0, leverage * sigma * 0.5, size=(2, n_bars)))
+    high = np.maximum(open_, close) * (1 + wick[0])
+    low = np.minimum(open_, close) * (1 - wick[1])
+    volume = rng.lognormal(mean=11, sigma=0.8, size=n_bars).round()
+    trade_count = np.maximum(volume // 75, 1)
+
+    df = pd.DataFrame({
+        "close": close,
+        "high": high,
+        "low": low,
+        "trade_count": trade_count.astype("int64"),
+        "open": open_,
+        "volume": volume,
+        "vwap": (high + low + close) / 3,
+        "symbol": pd.Categorical([symbol] * n_bars) if n_bars else pd.Categorical([]),
+    }, index=make_minute_index(n_bars))
+    return df
+
+
+def make_fixture_set(n_bars, seed=42):
+    # Underlying plus daily-reset 2x/3x series derived from it (synthetic_leverage)
+    names = {1: "SYN", 2: "SYN2X", 3: "SYN3X"}
+    underlying = make_synthetic_bars(n_bars, symbol=names[1], seed=seed)
+    fixtures = {1: underlying}
+    if not n_bars:
+        return {lev: underlying for lev in LEVERAGES}
+    derived = synthesize_leveraged(underlying, [lev for lev in LEVERAGES if lev != 1])
+    for lev, bars in derived.items():
+        df = bars[["close", "high", "low"]].assign(
+            trade_count=underlying["trade_count"],
+            open=bars["open"],
+            volume=underlying["volume"],
+        )
+        df["vwap"] = (df["high"] + df["low"] + df["close"]) / 3
+        df["symbol"] = pd.Categorical([names[lev]] * n_bars)
+        fixtures[lev] = df
+    return fixtures
+
+
+# === Timing helpers ===
+def _run_quiet(fn):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn()
+
+
+def measure(name, fn, bars, repeat=3, setup=None, **meta):
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        _run_quiet(lambda: fn(*args))
+        times.append(time.perf_counter() - start)
+
+    # Separate traced run so tracemalloc overhead never pollutes the timings
+    args = setup() if setup else ()
+    tracemalloc.start()
+    _run_quiet(lambda: fn(*args))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(times)
+    return {
+        "name": name,
+        "bars": bars,
+        **meta,
+        "repeat": repeat,
+        "times_sec": [round(t, 6) for t in times],
+        "best_sec": round(best, 6),
+        "median_sec": round(float(np.median(times)), 6),
+        "bars_per_sec": round(bars / best, 1) if best > 0 else None,
+        "peak_memory_mb": round(peak / 1024 ** 2, 3),
+    }
+
+
+def _report_generation(df, trades, equity, folder):
+    # visual_report pulls in WeasyPrint at import time
+    import visual_report
+    symbol = "SYN"
+    visual_report.plot_price_with_trades(df.copy(), trades, symbol, folder)
+    visual_report.plot_equity_curve(equity.copy(), symbol, folder)
+    stats = {
+        "final_equity": equity.iloc[-1]["equity"],
+        "total_return": (equity.iloc[-1]["equity"] - 100000) / 100000 * 100,
+        "max_drawdown": equity["drawdown"].min() * 100,
+        "sharpe": 0,
+        "win_rate": 0,
+        "avg_win": 0,
+        "avg_loss": 0,
+    }
+    visual_report.generate_html_report(symbol, trades, stats, folder)
+
+
+# === Benchmark suite ===
+def run_suite(sizes, repeat=3, seed=42, only=None):
+    results = []
+
+    def wanted(name):
+        return not only or any(name.startswith(o) for o in only)
+
+    for n_bars in sizes:
+        print(f"\n⏱️ Benchmarking {n_bars:,} bars...")
+        fixtures = make_fixture_set(n_bars, seed=seed)
+
+        for lev, df in fixtures.items():
+            for strategy in STRATEGIES:
+                name = f"apply_indicators[{strategy}]"
+                if wanted(name):
+                    results.append(measure(name, lambda: apply_indicators(df, strategy=strategy),
+                                           n_bars, repeat, leverage=lev))
+
+        df = fixtures[1]
+        if wanted("simulate_strategy_advanced"):
+            results.append(measure("simulate_strategy_advanced",
+                                   lambda: simulate_strategy_advanced(df, strategy="sma_ema"),
+                                   n_bars, repeat, leverage=1))
+
+        if wanted("backtest_scaling.simulate_strategy"):
+            scaling_df = backtest_scaling.apply_indicators(df[["close"]].copy())
+            results.append(measure("backtest_scaling.simulate_strategy",
+                                   lambda: backtest_scaling.simulate_strategy(scaling_df),
+                                   n_bars, repeat, leverage=1))
+            results.append(measure("backtest_scaling.simulate_strategy_loop",
+                                   lambda: backtest_scaling.simulate_strategy_loop(scaling_df),
+                                   n_bars, repeat, leverage=1))
+
+        metrics = {
+            "metrics.calculate_sharpe_ratio": lambda e: backtest_scaling.calculate_sharpe_ratio(e),
+            "metrics.calculate_max_drawdown": lambda e: backtest_scaling.calculate_max_drawdown(e),
+            "metrics.calculate_trade_stats": lambda e: backtest_scaling.calculate_trade_stats(trades),
+            "metrics.analysis_extras.calculate_sharpe_ratio": analysis_extras.calculate_sharpe_ratio,
+            "metrics.analysis_extras.calculate_volatility": analysis_extras.calculate_volatility,
+        }
+        if not any(wanted(n) for n in [*metrics, "report_generation"]):
+            continue
+        trades, equity = _run_quiet(lambda: simulate_strategy_advanced(df, strategy="sma_ema"))
+
+        for name, fn in metrics.items():
+            if wanted(name):
+                results.append(measure(name, fn, n_bars, repeat,
+                                       setup=lambda: (equity[["timestamp", "equity"]].copy(),),
+                                       leverage=1))
+
+        if wanted("report_generation"):
+            with tempfile.TemporaryDirectory() as tmp:
+                try:
+                    results.append(measure("report_generation",
+                                           lambda: _report_generation(df, trades, equity, Path(tmp)),
+                                           n_bars, 1, leverage=1))
+                except ImportError as e:
+                    results.append({"name": "report_generation", "bars": n_bars,
+                                    "skipped": f"missing dependency: {e.name}"})
+
+    return results
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fin-Toro benchmark suite")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--sizes", type=int, nargs="+", help="Bar counts (overrides --preset)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", help="Run only benchmarks whose name starts with these")
+    parser.add_argument("--output", type=Path, default=OUTPUT_DIR / "latest.json")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    parser.add_argument("--no-history", action="store_true", help="Do not append to the history file")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or PRESETS[args.preset]
+    results = run_suite(sizes, repeat=args.repeat, seed=args.seed, only=args.only)
+    payload = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "sizes": sizes,
+        "seed": args.seed,
+        "machine": machine_info(),
+        "results": results,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(payload, indent=2))
+    for r in results:
+        if "skipped" in r:
+            print(f"⚠️ {r['name']} @ {r['bars']:,}: skipped ({r['skipped']})")
+        else:
+            print(f"  {r['name']:<50} {r['bars']:>10,} bars  {r['best_sec']:>9.4f}s  "
+                  f"{r['bars_per_sec']:>14,.0f} bars/s  {r['peak_memory_mb']:>9.1f} MB")
+    print(f"\n💾 Results saved to {args.output}")
+    if not args.no_history:
+        run = record_run(payload, args.history)
+        print(f"🗂️ Recorded run {run['run_id']} in {args.history}")
+    return payload
+
+
+if __name__ == "__main__":
+    main()
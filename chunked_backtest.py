@@ -0,0 +1,169 @@
+# chunked_backtest.py
+# Purpose: Out-of-core version of simulate_strategy_advanced for multi-year minute
+# histories. Bars are streamed from disk in fixed-size blocks; rolling-window tails,
+# EMA state and the open DynamicPosition carry across block boundaries, and the
+# equity curve and trade log are appended to binary record logs (record_log) as
+# each block completes; --csv adds CSV copies.
+#
+# Usage:
+#   python chunked_backtest.py SPY_1Min_hist_1d.csv --strategy macd --chunk-size 100000
+#   python chunked_backtest.py SPY_1Min_hist_1d.csv --equity-runs     # equity change points only
+#   python chunked_backtest.py SPY_1Min_hist_1d.csv --mark-to-market  # intratrade drawdowns
+#   python record_log.py outputs/SPY/SPY_chunked_equity_curve.rec --tail 5 --follow   # watch a run
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from advanced_backtest import AdvancedBacktestState
+from bar_loader import load_bars
+from ledger import index_to_int64
+from record_log import BacktestRecorder
+from strategy_engine import KernelContext, apply_indicators, get_strategy
+
+
+# === Streaming indicators ===
+class StreamingIndicators:
+    # Runs a registered strategy kernel one block at a time. The last `warmup` input
+    # values are prepended to the next block so rolling windows straddle the boundary,
+    # and exponential series resume from the state KernelContext leaves behind.
+    def __init__(self, strategy="sma_ema", **kwargs):
+        self.spec = get_strategy(strategy)
+        self.params = self.spec.resolve(kwargs)
+        self.keep = self.spec.warmup(self.params)
+        self.tail = {name: np.empty(0) for name in self.spec.inputs}
+        self.state = {}
+        self.seen = 0
+
+    def update(self, chunk):
+        if chunk.empty:
+            return chunk
+        skip = len(next(iter(self.tail.values())))
+        ctx = KernelContext(chunk, tail=self.tail, state=self.state,
+                            start=self.seen - skip, keep=self.keep)
+        df = apply_indicators(chunk, self.spec, ctx=ctx, **self.params)
+        self.tail = {name: ctx.input(name)[-self.keep:] if self.keep else np.empty(0)
+                     for name in self.spec.inputs}
+        self.seen += len(chunk)
+        return df
+
+
+# === Chunked simulation ===
+def iter_csv_chunks(path, chunk_size):
+    # Each block's timestamps are parsed on their own (fixed layout, no format inference)
+    return load_bars(path, chunksize=chunk_size)
+
+
+def simulate_strategy_chunked(source, strategy="sma_ema", chunk_size=100_000,
+                              initial_capital=100000, stop_loss_pct=0.002,
+                              take_profit_pct=0.004, max_leverage=4,
+                              equity_path="chunked_equity_curve.rec",
+                              trades_path="chunked_trade_log.rec", csv=False,
+                              equity_runs=False, mark_to_market=False, symbol="", metrics=None,
+                              **indicator_params):
+    # `source` is a CSV path or any iterable of bar DataFrames indexed by timestamp.
+    # Records go to binary record logs (record_log); csv=True also writes .csv mirrors.
+    # equity_runs=True logs only the bars where equity changes (ledger.EquityRuns rows).
+    # mark_to_market=True includes the open position's unrealized PnL in equity.
+    if symbol:
+        print(f"\n🔍 Running chunked backtest for: {symbol}")
+    if isinstance(source, (str, Path)):
+        source = iter_csv_chunks(source, chunk_size)
+
+    indicators = StreamingIndicators(strategy, **indicator_params)
+    state = None
+    recorder = BacktestRecorder(equity_path, trades_path, csv=csv, block_rows=chunk_size,
+                                equity_runs=equity_runs)
+
+    running_max = None
+    max_drawdown = 0.0
+    last_bar = None
+    n_bars = n_trades = 0
+
+    for chunk in source:
+        df = indicators.update(chunk)
+        if df.empty:
+            continue
+
+        timestamps, tz = index_to_int64(df.index)
+        if state is None:
+            state = AdvancedBacktestState(initial_capital, stop_loss_pct, take_profit_pct,
+                                          max_leverage, tz=tz, metrics=metrics,
+                                          mark_to_market=mark_to_market)
+            recorder.open(tz)
+        closes = df['close'].to_numpy()
+        equity = np.empty(len(df))
+        state.run(timestamps, closes, df['signal'].to_numpy(), equity)
+
+        seed = equity[:1] if running_max is None else [running_max]
+        cum_max = np.maximum.accumulate(np.concatenate((seed, equity)))[1:]
+        running_max = cum_max[-1]
+        max_drawdown = min(max_drawdown, (equity / cum_max - 1).min())
+
+        recorder.write_equity(timestamps, equity)
+        n_trades += recorder.write_trades(state.trades)
+        n_bars += len(df)
+        last_bar = (timestamps[-1], closes[-1])
+
+    if state is None:
+        recorder.open(None)
+    elif state.position:
+        state.force_exit(*last_bar)
+        n_trades += recorder.write_trades(state.trades)
+    recorder.close()
+
+    return {
+        "bars": n_bars,
+        "trades": n_trades,
+        "final_equity": state.capital if state else initial_capital,
+        "max_drawdown": max_drawdown,
+        "equity_path": str(equity_path),
+        "trades_path": str(trades_path),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunked out-of-core advanced backtest")
+    parser.add_argument("csv", help="Bar history CSV with a timestamp column")
+    parser.add_argument("--strategy", default="sma_ema")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--capital", type=float, default=100000)
+    parser.add_argument("--stop-loss", type=float, default=0.002)
+    parser.add_argument("--take-profit", type=float, default=0.004)
+    parser.add_argument("--max-leverage", type=int, default=4)
+    parser.add_argument("--outdir", default="outputs")
+    parser.add_argument("--csv", dest="write_csv", action="store_true",
+                        help="Also write CSV copies of the record logs")
+    parser.add_argument("--equity-runs", action="store_true",
+                        help="Log only the bars where equity changes (run-length equity curve)")
+    parser.add_argument("--mark-to-market", action="store_true",
+                        help="Include unrealized PnL of open positions in equity")
+    args = parser.parse_args()
+
+    symbol = Path(args.csv).name.split("_")[0]
+    outdir = Path(args.outdir) / symbol
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    result = simulate_strategy_chunked(
+        args.csv,
+        strategy=args.strategy,
+        chunk_size=args.chunk_size,
+        initial_capital=args.capital,
+        stop_loss_pct=args.stop_loss,
+        take_profit_pct=args.take_profit,
+        max_leverage=args.max_leverage,
+        equity_path=outdir / f"{symbol}_chunked_equity_curve.rec",
+        trades_path=outdir / f"{symbol}_chunked_trade_log.rec",
+        csv=args.write_csv,
+        equity_runs=args.equity_runs,
+        mark_to_market=args.mark_to_market,
+        symbol=symbol,
+    )
+
+    print("\n📊 Chunked Backtest Summary:")
+    print(f" - Bars: {result['bars']:,}")
+    print(f" - Trades: {result['trades']}")
+    print(f" - Final Equity: ${result['final_equity']:.2f}")
+    print(f" - Max Drawdown: {result['max_drawdown']:.2%}")
+    print(f"💾 {result['equity_path']}\n💾 {result['trades_path']}")
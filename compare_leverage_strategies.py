@@ -8,15 +8,14 @@ import matplotlib.pyplot as plt
 from backtest_scaling import (
     apply_indicators,
     simulate_strategy,
-    load_price_data,
-    calculate_max_drawdown,
-    calculate_sharpe_ratio,
-    calculate_trade_stats
+    load_price_data
 )
+from metrics import compute_metrics
+from market_panel import MarketPanel
 
 def run_and_compare(symbol_files):
     results = []
-    equity_curves = []
+    equity_curves = {}
 
     for symbol, file in symbol_files.items():
         print(f"\n🚀 Running backtest for {symbol}...")
@@ -25,33 +24,32 @@ def run_and_compare(symbol_files):
         # === Save trade log for this symbol ===
         trades.to_csv(f"{symbol}_strategy_trades.csv", index=False)
         print(f"💾 Saved trade log: {symbol}_strategy_trades.csv")
-        final_equity = equity.iloc[-1]['equity']
-        total_return = (final_equity - 100000) / 100000
-        max_dd = calculate_max_drawdown(equity)
-        sharpe = calculate_sharpe_ratio(equity)
-        win_rate, avg_win, avg_loss = calculate_trade_stats(trades)
+        m = compute_metrics(equity, trades, periods_per_year=252, risk_free_rate=0.01 / 252,
+                            ddof=0, fill_first=True)
+        total_return = (m['final_equity'] - 100000) / 100000
 
         results.append({
             'Symbol': symbol,
-            'Final Equity': round(final_equity, 2),
+            'Final Equity': round(m['final_equity'], 2),
             'Total Return %': round(total_return * 100, 2),
-            'Max Drawdown %': round(max_dd * 100, 2),
-            'Sharpe Ratio': sharpe,
-            'Win Rate %': win_rate,
-            'Avg Win': avg_win,
-            'Avg Loss': avg_loss
+            'Max Drawdown %': round(m['max_drawdown'] * 100, 2),
+            'Sharpe Ratio': round(m['sharpe'], 2),
+            'Win Rate %': round(m['win_rate'] * 100, 2),
+            'Avg Win': round(m['avg_win'], 2),
+            'Avg Loss': round(m['avg_loss'], 2)
         })
 
-        equity['symbol'] = symbol
-        equity_curves.append(equity)
+        equity_curves[symbol] = equity.set_index('timestamp')
 
-    return pd.DataFrame(results), pd.concat(equity_curves)
+    # One (bars × symbols) equity array on the union calendar
+    return pd.DataFrame(results), MarketPanel.from_frames(equity_curves, fields=("equity",))
 
-def plot_all_equity_curves(equity_df):
+def plot_all_equity_curves(equity_panel):
     plt.figure(figsize=(12, 6))
-    for symbol in equity_df['symbol'].unique():
-        symbol_df = equity_df[equity_df['symbol'] == symbol]
-        plt.plot(symbol_df['timestamp'], symbol_df['equity'], label=symbol)
+    equity = equity_panel["equity"]
+    for j, symbol in enumerate(equity_panel.symbols):
+        present = equity_panel.mask[:, j]
+        plt.plot(equity_panel.calendar[present], equity[present, j], label=symbol)
 
     plt.title("Equity Curve Comparison")
     plt.xlabel("Time")
@@ -69,9 +67,13 @@ if __name__ == "__main__":
         "UPRO": "UPRO_5Min_strategy_2d.csv"
     }
 
-    comparison_df, equity_df = run_and_compare(symbol_files)
+    comparison_df, equity_panel = run_and_compare(symbol_files)
 
     print("\n📊 Strategy Performance Comparison:")
     print(comparison_df.to_string(index=False))
 
-    plot_all_equity_curves(equity_df)
+    price_panel = MarketPanel.from_csvs(symbol_files)
+    print("\n🔗 Return Correlation:")
+    print(price_panel.correlation().round(3).to_string())
+
+    plot_all_equity_curves(equity_panel)
@@ -0,0 +1,278 @@
+# cost_model.py
+# Purpose: Commissions, spread and slippage applied after a simulation, in batch.
+# The simulators record their fills (every entry leg plus the bar its position exits
+# at, in a ledger.LegLedger); a CostModel then prices all fills at once:
+#
+#   per_share   commission per share traded
+#   bps         fees in basis points of traded notional
+#   spread      fraction of the bar's high-low range taken as the quoted spread;
+#               every fill crosses half of it
+#   impact      volume-participation slippage, impact * (shares / bar volume) ** exponent
+#               as a fraction of the fill price (square-root law by default)
+#
+# Each component is linear in its coefficient, so the costs of all fills under many
+# models are one matrix product: components (fills x 4) @ coefficients (4 x models).
+# A cost-sensitivity sweep is one extra array operation per configuration instead of
+# one re-simulation per model.
+#
+# Costs are charged on the bar of each fill and do not feed back into sizing (bets
+# stay a fraction of gross capital), so a zero-cost model reproduces the gross run.
+#
+# Usage:
+#   trades, equity = simulate_strategy_advanced(df, strategy="macd", costs=CostModel(per_share=0.005))
+#   cost_sensitivity(fills, bars, trades["pnl"], len(bars), cost_grid())   # one row per model
+#   python cost_model.py SPY_5Min_strategy_2d.csv --strategy macd
+
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from ledger import LegLedger
+from metrics import FLAT_STD, INTRADAY_PERIODS
+
+FILL_DTYPE = np.dtype([("bar", "i8"), ("row", "i8"), ("trade", "i8"), ("exit", "?"),
+                       ("shares", "f8"), ("price", "f8")])
+COST_COLUMNS = ("high", "low", "volume")     # bar columns the spread and impact terms read
+COST_GRID = {
+    "per_share": [0.0, 0.005],
+    "bps": [0.0, 1.0],
+    "spread": [0.0, 0.5],
+    "impact": [0.0, 0.1],
+}
+METRIC_KEYS = ("total_return", "sharpe", "sortino", "max_drawdown", "total_trades", "win_rate",
+               "profit_factor")
+
+
+class CostModel:
+    FIELDS = ("per_share", "bps", "spread", "impact")
+
+    def __init__(self, per_share=0.0, bps=0.0, spread=0.0, impact=0.0, impact_exponent=0.5):
+        self.per_share = per_share
+        self.bps = bps
+        self.spread = spread
+        self.impact = impact
+        self.impact_exponent = impact_exponent
+
+    def coefficients(self):
+        return np.array([getattr(self, name) for name in self.FIELDS], dtype="float64")
+
+    def params(self):
+        return {**{name: getattr(self, name) for name in self.FIELDS}, "impact_exponent": self.impact_exponent}
+
+    def __repr__(self):
+        return "CostModel(" + ", ".join(f"{k}={v}" for k, v in self.params().items()) + ")"
+
+    def fill_costs(self, fills, bars):
+        return cost_matrix(fills, bars, [self])[:, 0]
+
+
+def cost_grid(grid=None, impact_exponent=0.5):
+    # Every combination of the grid's coefficient lists (COST_GRID by default)
+    grid = grid or COST_GRID
+    names = list(grid)
+    return [CostModel(**dict(zip(names, values)), impact_exponent=impact_exponent)
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+# === Fills ===
+def fill_arrays(legs, n_bars):
+    # Entry and exit fills of every leg (FILL_DTYPE). `trade` numbers the closed
+    # positions in exit order, matching the trade log rows; the legs of a position
+    # still open get the next number and no exit fill. `row` is the bar whose prices a
+    # fill uses; force exits settle at `bar` n_bars, after the last bar (as in the
+    # gross equity curve), at the last bar's prices.
+    legs = legs.records if isinstance(legs, LegLedger) else legs
+    closed = legs["stop"] >= 0
+    exit_ids = np.unique(legs["stop"][closed], return_inverse=True)[1].reshape(-1)
+    trade = np.full(len(legs), exit_ids.max() + 1 if len(exit_ids) else 0, dtype="int64")
+    trade[closed] = exit_ids
+    exits = legs[closed]
+
+    fills = np.empty(len(legs) + len(exits), dtype=FILL_DTYPE)
+    entry, exit_ = fills[:len(legs)], fills[len(legs):]
+    entry["bar"], entry["row"], entry["trade"], entry["exit"] = legs["start"], legs["start"], trade, False
+    entry["shares"], entry["price"] = legs["exposure"], legs["price"]
+    exit_["bar"], exit_["trade"], exit_["exit"] = exits["stop"], exit_ids, True
+    exit_["row"] = np.minimum(exits["stop"], n_bars - 1)
+    exit_["shares"] = exits["exposure"]
+    exit_["price"] = np.nan         # filled from the bar closes by _with_exit_prices
+    return fills
+
+
+def _column(bars, name):
+    if bars is None or name not in bars:
+        return None
+    column = bars[name]
+    return column.to_numpy(dtype="float64") if isinstance(column, pd.Series) else np.asarray(column, dtype="float64")
+
+
+def _with_exit_prices(fills, bars):
+    closes = _column(bars, "close")
+    exits = fills["exit"]
+    if exits.any():
+        if closes is None:
+            raise ValueError("exit fills are priced at the bar close; bars need a 'close' column")
+        fills = fills.copy()
+        fills["price"][exits] = closes[fills["row"][exits]]
+    return fills
+
+
+# === Pricing ===
+def components(fills, bars, impact_exponent=0.5):
+    # Per-fill cost of one unit of each coefficient: shares, notional / 10^4,
+    # shares * half the bar range, notional * participation ** exponent.
+    # Columns whose bar inputs are missing stay 0 (cost_matrix rejects using them).
+    shares = np.abs(fills["shares"])
+    notional = shares * fills["price"]
+    bar = fills["row"]
+    out = np.zeros((len(fills), 4))
+    out[:, 0] = shares
+    out[:, 1] = notional * 1e-4
+    high, low, volume = (_column(bars, name) for name in COST_COLUMNS)
+    if high is not None and low is not None:
+        out[:, 2] = shares * (high[bar] - low[bar]) / 2
+    if volume is not None:
+        # A fill can take at most the whole bar; zero-volume bars count as full participation
+        with np.errstate(divide="ignore", invalid="ignore"):
+            participation = np.where(volume[bar] > 0, shares / volume[bar], 1.0)
+        out[:, 3] = notional * np.minimum(participation, 1.0) ** impact_exponent
+    return out
+
+
+def cost_matrix(fills, bars, models):
+    # Dollar cost of every fill under every model (fills x models): one matrix
+    # product per distinct impact exponent
+    fills = _with_exit_prices(fills, bars)
+    coefficients = np.array([model.coefficients() for model in models]).reshape(len(models), 4).T
+    for j, columns in ((2, ("high", "low")), (3, ("volume",))):
+        missing = [name for name in columns if _column(bars, name) is None]
+        if missing and coefficients[j].any():
+            raise ValueError(f"{CostModel.FIELDS[j]} costs need bar columns {missing}")
+    exponents = np.array([model.impact_exponent for model in models], dtype="float64")
+    out = np.empty((len(fills), len(models)))
+    for exponent in np.unique(exponents):
+        selected = exponents == exponent
+        out[:, selected] = components(fills, bars, exponent) @ coefficients[:, selected]
+    return out
+
+
+# === Applying costs ===
+def apply_costs(trades, equity, legs, bars, model, first_bar=0):
+    # Net-of-cost copies of a run's trade log and per-bar equity curve. Trades gain
+    # gross_pnl and cost columns (pnl becomes net); equity is reduced by the costs
+    # paid up to each bar. `bars` are the simulated bars (close plus COST_COLUMNS);
+    # equity row 0 is bar first_bar (backtest_scaling starts its curve at bar 20).
+    if equity is not None and "bar" in equity:
+        raise ValueError("apply_costs needs a per-bar equity curve (run with equity_runs=False)")
+    n_bars = len(_column(bars, "close"))
+    fills = fill_arrays(legs, n_bars)
+    cost = cost_matrix(fills, bars, [model])[:, 0]
+
+    trades = trades.copy()
+    trade_cost = np.bincount(fills["trade"], weights=cost, minlength=len(trades) + 1)[:len(trades)]
+    trades["gross_pnl"] = trades["pnl"]
+    trades["cost"] = trade_cost
+    trades["pnl"] = trades["gross_pnl"] - trade_cost
+    if equity is None:
+        return trades, None
+
+    paid = np.cumsum(np.bincount(fills["bar"], weights=cost, minlength=n_bars + 1))
+    equity = equity.copy()
+    equity["equity"] = equity["equity"] - paid[first_bar:first_bar + len(equity)]
+    if "cum_max" in equity:
+        equity["cum_max"] = np.maximum.accumulate(equity["equity"].to_numpy())
+        equity["drawdown"] = equity["equity"] / equity["cum_max"] - 1
+    return trades, equity
+
+
+def cost_sensitivity(legs, bars, pnl, n_bars, models, initial_capital=100000,
+                     periods_per_year=INTRADAY_PERIODS, ddof=1):
+    # Net summary metrics (METRIC_KEYS, plus total_cost) of one realized-equity run
+    # under every model, one row per model. Realized equity only moves on fill bars,
+    # so returns and drawdowns are taken over those bars alone: the other n_bars
+    # returns are exactly 0 and only enter through the counts. With a zero-cost model
+    # the row matches online_metrics.RunningMetrics.summary() of the gross run.
+    fills = fill_arrays(legs, n_bars)
+    costs = cost_matrix(fills, bars, models)
+    pnl = np.asarray(pnl, dtype="float64")
+    n_trades, n_models = len(pnl), len(models)
+
+    trade_cost = np.zeros((n_trades + 1, n_models))
+    np.add.at(trade_cost, fills["trade"], costs)
+    net = pnl[:, None] - trade_cost[:n_trades]
+
+    # Equity at each fill bar: gross PnL lands on exit bars, costs on every fill bar;
+    # force exits (bar n_bars) count for the trades but fall after the curve
+    event_bars = np.unique(fills["bar"])
+    delta = np.zeros((len(event_bars), n_models))
+    np.add.at(delta, np.searchsorted(event_bars, fills["bar"]), -costs)
+    exits = fills[fills["exit"]]
+    exit_bar = np.zeros(n_trades, dtype="int64")
+    exit_bar[exits["trade"]] = exits["bar"]
+    np.add.at(delta, np.searchsorted(event_bars, exit_bar), pnl[:, None])
+    equity = (initial_capital + np.cumsum(delta, axis=0))[event_bars < n_bars]
+    event_bars = event_bars[event_bars < n_bars]
+
+    # Bar 0 has no return; its equity is the base for the first one
+    starts_at_zero = len(event_bars) and event_bars[0] == 0
+    base = equity[0] if starts_at_zero else np.full(n_models, float(initial_capital))
+    path = equity if starts_at_zero else np.vstack((base, equity))
+    returns = path[1:] / path[:-1] - 1
+    count = max(n_bars - 1, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = returns.sum(axis=0) / count if count else np.zeros(n_models)
+        variance = ((returns * returns).sum(axis=0) - count * mean * mean) / (count - ddof) \
+            if count > ddof else np.zeros(n_models)
+    std = np.sqrt(np.maximum(variance, 0.0))
+    downside = np.minimum(returns, 0.0)
+    downside_dev = np.sqrt((downside * downside).sum(axis=0) / count) if count else np.zeros(n_models)
+    scale = np.sqrt(periods_per_year)
+    max_drawdown = (path / np.maximum.accumulate(path, axis=0) - 1).min(axis=0)
+
+    gross_win = np.where(net > 0, net, 0.0).sum(axis=0)
+    gross_loss = np.where(net < 0, net, 0.0).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profit_factor = np.where(gross_loss < 0, gross_win / -gross_loss,
+                                 np.where(gross_win > 0, np.inf, 0.0))
+        sharpe = np.where(std > FLAT_STD, mean / std * scale, 0.0)
+        sortino = np.where(downside_dev > 0, mean / downside_dev * scale, 0.0)
+
+    rows = pd.DataFrame([model.params() for model in models])
+    rows["total_cost"] = costs.sum(axis=0)
+    rows["total_return"] = path[-1] / base - 1
+    rows["sharpe"] = sharpe
+    rows["sortino"] = sortino
+    rows["max_drawdown"] = max_drawdown
+    rows["total_trades"] = n_trades
+    rows["win_rate"] = (net > 0).sum(axis=0) / n_trades if n_trades else 0.0
+    rows["profit_factor"] = profit_factor
+    return rows
+
+
+if __name__ == "__main__":
+    from advanced_backtest import backtest_signals
+    from bar_loader import load_bars
+    from ledger import index_to_int64
+    from strategy_engine import apply_indicators
+
+    parser = argparse.ArgumentParser(description="Cost sensitivity of one advanced backtest")
+    parser.add_argument("csv", help="Bar CSV with close, high, low and volume columns")
+    parser.add_argument("--strategy", default="sma_ema")
+    parser.add_argument("--capital", type=float, default=100000)
+    parser.add_argument("--output", help="Write the per-model rows to this CSV")
+    args = parser.parse_args()
+
+    df = apply_indicators(load_bars(args.csv), strategy=args.strategy)
+    timestamps, tz = index_to_int64(df.index)
+    fills = LegLedger()
+    trades, _ = backtest_signals(timestamps, df["close"].to_numpy(), df["signal"].to_numpy(), tz,
+                                 initial_capital=args.capital, record_equity=False, verbose=False,
+                                 fills=fills)
+    table = cost_sensitivity(fills, df, trades["pnl"], len(df), cost_grid(), initial_capital=args.capital)
+    print(f"\n💸 Cost sensitivity: {args.strategy}, {len(trades)} trades, {len(table)} cost models")
+    print(table.to_string(index=False))
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"💾 {args.output}")
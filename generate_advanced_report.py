@@ -5,6 +5,10 @@ import pandas as pd
 from weasyprint import HTML
 from pathlib import Path
 
+from monte_carlo import run_monte_carlo, plot_fan_chart
+from rolling_analytics import DEFAULT_WINDOWS, plot_rolling_charts
+from walk_forward import walk_forward_section
+
 # === Load config ===
 with open("config.json") as f:
     config = json.load(f)
@@ -23,6 +27,39 @@ avg_pnl = trades['pnl'].mean() if total_trades else 0
 max_drawdown = equity['drawdown'].min() * 100
 final_equity = equity.iloc[-1]['equity']
 
+# === Rolling analytics ===
+rolling_windows = tuple(config.get("rolling_windows", DEFAULT_WINDOWS))
+rolling_charts = plot_rolling_charts(equity, symbol, outdir, rolling_windows)
+rolling_imgs = "\n    ".join(f'<img src="{path.name}" alt="{path.stem}">' for path in rolling_charts)
+
+# === Monte Carlo resampling ===
+mc_config = config.get("monte_carlo", {})
+mc_html = "<p>No trades to resample.</p>"
+if total_trades:
+    paths, mc = run_monte_carlo(
+        trades,
+        initial_capital=config["capital"],
+        n_paths=mc_config.get("paths", 10000),
+        method=mc_config.get("method", "bootstrap"),
+        floor_pct=mc_config.get("floor_pct", 0.95),
+        seed=mc_config.get("seed"),
+    )
+    fan_chart = plot_fan_chart(paths, symbol, outdir / f"{symbol}_advanced_monte_carlo_fan.png", floor=mc["floor"])
+    mc_html = f"""<table>
+        <tr><th>Paths</th><td>{mc['paths']:,} × {mc['trades_per_path']} trades ({mc_config.get("method", "bootstrap")})</td></tr>
+        <tr><th>Final Equity P5 / P50 / P95</th><td>${mc['final_p5']:.2f} / ${mc['final_p50']:.2f} / ${mc['final_p95']:.2f}</td></tr>
+        <tr><th>Max Drawdown P5 / P50 / P95</th><td>{mc['max_drawdown_p5']*100:.2f}% / {mc['max_drawdown_p50']*100:.2f}% / {mc['max_drawdown_p95']*100:.2f}%</td></tr>
+        <tr><th>Probability of Loss</th><td>{mc['prob_loss']*100:.2f}%</td></tr>
+        <tr><th>Probability of Hitting ${mc['floor']:.2f}</th><td>{mc['prob_floor']*100:.2f}%</td></tr>
+    </table>
+    <img src="{fan_chart.name}" alt="Monte Carlo fan chart">"""
+
+# === Walk-forward results (written by walk_forward.py) ===
+wf_folds_path = outdir / f"{symbol}_walk_forward_folds.csv"
+wf_html = ""
+if wf_folds_path.exists():
+    wf_html = walk_forward_section(pd.read_csv(wf_folds_path), f"{symbol}_walk_forward_equity.png")
+
 # === HTML content ===
 html = f"""
 <!DOCTYPE html>
@@ -64,6 +101,15 @@ html = f"""
     <img src="{symbol}_advanced_drawdown_chart.png" alt="Drawdown">
     <img src="{symbol}_advanced_pnl_histogram.png" alt="PnL">
 
+    <h2>📉 Rolling Analytics</h2>
+    <p>Windows: {", ".join(f"{w} bars" for w in rolling_windows)}</p>
+    {rolling_imgs}
+
+    <h2>🎲 Monte Carlo Trade Resampling</h2>
+    {mc_html}
+
+    {wf_html}
+
     <h2>🔗 Resources</h2>
     <ul>
         <li><a href="{config['repo_link']}">GitHub Repository</a></li>
@@ -76,7 +76,10 @@ def generate_index():
             </div>
             """
 
-    html += "</div></body></html>"
+    html += "</div>"
+    if (base_path / "benchmark_trends.html").exists():
+        html += "<p class='meta'><a href='benchmark_trends.html'>⏱️ Benchmark Trends</a></p>"
+    html += "</body></html>"
 
     index_path = base_path / "index.html"
     with open(index_path, "w") as f:
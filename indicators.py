@@ -0,0 +1,137 @@
+# indicators.py
+# Purpose: Wilder smoothing, RSI and ATR kernels in three forms that agree with each
+# other: single-period arrays, batches over many periods that share the differencing
+# / true-range work, and O(1) incremental updaters for live bars. All of them use the
+# engine's convention, ewm(alpha=1/n, adjust=False), seeded by the first value.
+#
+# Usage:
+#   rsi_14 = rsi(close, 14)
+#   table = rsi_batch(close, [7, 14, 21])          # {period: array}
+#   live = WilderRSI(14); value = live.update(price)
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+# === Shared building blocks ===
+def wilder_smooth(values, n):
+    return pd.Series(values).ewm(alpha=1 / n, adjust=False).mean().to_numpy()
+
+
+def gains_losses(close):
+    delta = np.diff(np.asarray(close, dtype="float64"), prepend=np.nan)
+    return np.clip(delta, 0, None), np.clip(-delta, 0, None)
+
+
+def rsi_from_averages(avg_gain, avg_loss):
+    total = avg_gain + avg_loss
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(total > 0, 100 * avg_gain / total, 50.0)
+    rsi[np.isnan(total)] = np.nan
+    return rsi
+
+
+def true_range(high, low, close):
+    high, low, close = (np.asarray(a, dtype="float64") for a in (high, low, close))
+    prev_close = np.concatenate(([np.nan], close[:-1]))
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return tr
+
+
+# === Array kernels ===
+def rsi(close, n=14):
+    # The first n bars are warm-up (NaN)
+    gain, loss = gains_losses(close)
+    out = rsi_from_averages(wilder_smooth(gain, n), wilder_smooth(loss, n))
+    out[:n] = np.nan
+    return out
+
+
+def atr(high, low, close, n=14):
+    # The first n - 1 bars are warm-up (NaN)
+    out = wilder_smooth(true_range(high, low, close), n)
+    out[:n - 1] = np.nan
+    return out
+
+
+def wilder_smooth_batch(values, periods):
+    # One C-level recursion per period over the shared input; returns {period: array}
+    series = pd.Series(np.asarray(values, dtype="float64"))
+    return {n: series.ewm(alpha=1 / n, adjust=False).mean().to_numpy() for n in periods}
+
+
+def rsi_batch(close, periods):
+    # Differencing is done once; gains and losses are smoothed together per period
+    gain, loss = gains_losses(close)
+    pair = pd.DataFrame({"gain": gain, "loss": loss})
+    out = {}
+    for n in periods:
+        smoothed = pair.ewm(alpha=1 / n, adjust=False).mean().to_numpy()
+        values = rsi_from_averages(smoothed[:, 0], smoothed[:, 1])
+        values[:n] = np.nan
+        out[n] = values
+    return out
+
+
+def atr_batch(high, low, close, periods):
+    tr = true_range(high, low, close)
+    out = wilder_smooth_batch(tr, periods)
+    for n, values in out.items():
+        values[:n - 1] = np.nan
+    return out
+
+
+# === Incremental (live) kernels ===
+class WilderSmoother:
+    def __init__(self, n):
+        self.alpha = 1 / n
+        self.value = math.nan
+
+    def update(self, x):
+        if math.isnan(self.value):
+            self.value = x
+        elif not math.isnan(x):
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class WilderRSI:
+    def __init__(self, n=14):
+        self.n = n
+        self.bars = 0
+        self.prev_close = None
+        self.gain = WilderSmoother(n)
+        self.loss = WilderSmoother(n)
+
+    def update(self, close):
+        self.bars += 1
+        if self.prev_close is None:
+            self.prev_close = close
+            return math.nan
+        delta = close - self.prev_close
+        self.prev_close = close
+        avg_gain = self.gain.update(max(delta, 0.0))
+        avg_loss = self.loss.update(max(-delta, 0.0))
+        if self.bars <= self.n:
+            return math.nan
+        total = avg_gain + avg_loss
+        return 100 * avg_gain / total if total > 0 else 50.0
+
+
+class WilderATR:
+    def __init__(self, n=14):
+        self.n = n
+        self.bars = 0
+        self.prev_close = None
+        self.smoother = WilderSmoother(n)
+
+    def update(self, high, low, close):
+        self.bars += 1
+        tr = high - low
+        if self.prev_close is not None:
+            tr = max(tr, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+        value = self.smoother.update(tr)
+        return value if self.bars >= self.n else math.nan
@@ -0,0 +1,145 @@
+# instrumentation.py
+# Purpose: Lightweight per-stage timing (wall, CPU) and peak-RSS tracking for the
+# batch report pipelines, with HTML table and JSON export.
+#
+# Usage:
+#   timer = StageTimer("SPY_sma_ema")
+#   with timer.stage("load"):
+#       df = pd.read_csv(...)
+#
+#   @timer.timed("chart")
+#   def plot(...): ...
+#
+#   html += timer.to_html_table()
+#   export_json([timer], "outputs/timings.json")
+
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+_STATUS = Path("/proc/self/status")
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+# === RSS probes ===
+def _status_kb(field):
+    try:
+        for line in _STATUS.read_text().splitlines():
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss():
+    return _status_kb("VmRSS") or 0
+
+
+def peak_rss():
+    peak = _status_kb("VmHWM")
+    if peak is not None:
+        return peak
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def reset_peak_rss():
+    # Linux >= 4.0 resets VmHWM when "5" is written to clear_refs; elsewhere the
+    # peak stays process-lifetime and stage peaks are upper bounds.
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# === Stage timer ===
+class StageTimer:
+    def __init__(self, config=""):
+        self.config = config
+        self.records = []
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        parent_peak = peak_rss()
+        reset_peak_rss()
+        frame = {"child_peak": 0}
+        self._stack.append(frame)
+        rss_start = current_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._stack.pop()
+            # A nested stage resets the high-water mark, so fold its peak back in
+            stage_peak = max(peak_rss(), frame["child_peak"])
+            if self._stack:
+                self._stack[-1]["child_peak"] = max(self._stack[-1]["child_peak"], stage_peak,
+                                                    parent_peak)
+            self.records.append({
+                "config": self.config,
+                "stage": name,
+                "depth": len(self._stack),
+                "wall_sec": round(wall, 6),
+                "cpu_sec": round(cpu, 6),
+                "peak_rss_mb": round(stage_peak / 1024 ** 2, 2),
+                "rss_delta_mb": round((current_rss() - rss_start) / 1024 ** 2, 2),
+            })
+
+    def timed(self, name=None):
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or fn.__name__):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def total(self, key="wall_sec"):
+        return sum(r[key] for r in self.records if r["depth"] == 0)
+
+    def to_html_table(self):
+        rows = "".join(
+            f"<tr><td>{'&nbsp;' * 4 * r['depth']}{r['stage']}</td><td>{r['wall_sec']:.3f}</td>"
+            f"<td>{r['cpu_sec']:.3f}</td><td>{r['peak_rss_mb']:.1f}</td></tr>"
+            for r in self.records
+        )
+        return f"""
+    <h2>⏱️ Pipeline Timing</h2>
+    <table border='1' cellpadding='6' cellspacing='0'>
+        <tr><th>Stage</th><th>Wall (s)</th><th>CPU (s)</th><th>Peak RSS (MB)</th></tr>
+        {rows}
+        <tr><th>Total</th><th>{self.total():.3f}</th><th>{self.total('cpu_sec'):.3f}</th><th></th></tr>
+    </table>
+    """
+
+    def print_summary(self):
+        for r in self.records:
+            indent = "  " * r["depth"]
+            print(f"   {indent}{r['stage']:<12} {r['wall_sec']:>8.3f}s wall  "
+                  f"{r['cpu_sec']:>8.3f}s cpu  {r['peak_rss_mb']:>8.1f} MB peak")
+
+
+def export_json(timers, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "pid": os.getpid(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "records": [r for t in timers for r in t.records],
+    }
+    path.write_text(json.dumps(payload, indent=2))
+    print(f"⏱️ Stage timings saved to {path}")
+    return path
@@ -0,0 +1,344 @@
+# ledger.py
+# Purpose: Compact, preallocated NumPy storage for the simulators' equity curve and
+# trade log. Replaces the list-of-dicts pattern (~300 bytes per bar plus a large
+# DataFrame conversion spike) with typed arrays (16 bytes per bar) that are turned
+# into DataFrames only when asked for. EquityRuns goes further for long runs with few
+# trades: it keeps only the bars where equity changes.
+
+import numpy as np
+import pandas as pd
+
+TRADE_DTYPE = np.dtype([
+    ("entry_time", "i8"),
+    ("exit_time", "i8"),
+    ("pnl", "f8"),
+    ("entry_count", "i4"),
+    ("avg_leverage", "f8"),
+])
+
+# backtest_scaling.simulate_strategy logs no entry time
+SCALING_TRADE_DTYPE = np.dtype([
+    ("exit_time", "i8"),
+    ("pnl", "f8"),
+    ("entry_count", "i4"),
+    ("avg_leverage", "f8"),
+])
+
+# EquityRuns change points: bar index, epoch-ns timestamp, equity from that bar on
+RUNS_DTYPE = np.dtype([
+    ("bar", "i8"),
+    ("timestamp", "i8"),
+    ("equity", "f8"),
+])
+
+# LegLedger rows: one per entry or scale-in of a position
+LEG_DTYPE = np.dtype([
+    ("start", "i8"),
+    ("stop", "i8"),
+    ("price", "f8"),
+    ("exposure", "f8"),
+])
+
+
+def index_to_int64(index):
+    # Returns epoch-nanosecond values and the timezone needed to rebuild the index
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8, index.tz
+    return np.asarray(index, dtype="int64"), None
+
+
+def int64_to_datetime(values, tz):
+    stamps = pd.DatetimeIndex(np.asarray(values).view("M8[ns]"))
+    return stamps.tz_localize("UTC").tz_convert(tz) if tz is not None else stamps
+
+
+_UTC_SUFFIX = np.frombuffer("+00:00".encode("utf-32-le"), dtype="uint32")
+
+
+def parse_timestamps(values):
+    # ISO timestamp strings -> (int64 epoch-ns, tz). The 'YYYY-MM-DD HH:MM:SS+00:00'
+    # strings pandas writes for UTC bars go through NumPy's datetime64 parser, several
+    # times faster than read_csv(parse_dates=...); other layouts fall back to pandas.
+    strings = np.asarray(values, dtype="U25")
+    if len(strings) and np.asarray(values).dtype.kind in "OU":
+        chars = strings.view("uint32").reshape(len(strings), 25)
+        if (chars[:, 19:] == _UTC_SUFFIX).all():
+            return strings.astype("U19").astype("M8[s]").astype("M8[ns]").view("int64"), "UTC"
+    return index_to_int64(pd.DatetimeIndex(pd.to_datetime(values, format="ISO8601")))
+
+
+def locate(timestamps, targets):
+    # Row of each target in a sorted int64 timestamp array, -1 where absent
+    timestamps, targets = np.asarray(timestamps, dtype="int64"), np.asarray(targets, dtype="int64")
+    if not len(timestamps):
+        return np.full(len(targets), -1)
+    rows = np.minimum(np.searchsorted(timestamps, targets), len(timestamps) - 1)
+    return np.where(timestamps[rows] == targets, rows, -1)
+
+
+class EquityLedger:
+    def __init__(self, capacity=1024, tz=None):
+        self.tz = tz
+        self._n = 0
+        self._ts = np.empty(max(capacity, 1), dtype="int64")
+        self._equity = np.empty(max(capacity, 1), dtype="float64")
+
+    def __len__(self):
+        return self._n
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self._ts))
+        self._ts = np.resize(self._ts, capacity)
+        self._equity = np.resize(self._equity, capacity)
+
+    def append(self, ts, equity):
+        n = self._n
+        if n == len(self._ts):
+            self._grow(n + 1)
+        self._ts[n] = ts
+        self._equity[n] = equity
+        self._n = n + 1
+
+    def extend(self, ts, equity):
+        n, k = self._n, len(ts)
+        if n + k > len(self._ts):
+            self._grow(n + k)
+        self._ts[n:n + k] = ts
+        self._equity[n:n + k] = equity
+        self._n = n + k
+
+    def clear(self):
+        self._n = 0
+
+    @property
+    def timestamps(self):
+        return self._ts[:self._n]
+
+    @property
+    def equity(self):
+        return self._equity[:self._n]
+
+    @property
+    def nbytes(self):
+        return self._ts.nbytes + self._equity.nbytes
+
+    def to_frame(self, drawdown=True, datetimes=True):
+        # Columns are views on the ledger's buffers; copy the frame before mutating it.
+        # datetimes=False keeps epoch-ns int64 timestamps for internal consumers.
+        equity = self.equity
+        timestamps = int64_to_datetime(self.timestamps, self.tz) if datetimes else self.timestamps
+        data = {"timestamp": timestamps, "equity": equity}
+        if drawdown:
+            cum_max = np.maximum.accumulate(equity)
+            data["cum_max"] = cum_max
+            data["drawdown"] = equity / cum_max - 1
+        return pd.DataFrame(data, copy=False)
+
+
+def expand_runs(bars, equity, n=None):
+    # Per-bar equity from change points: each value repeats until the next change
+    bars = np.asarray(bars, dtype="int64")
+    if not len(bars):
+        return np.empty(0)
+    n = bars[-1] + 1 if n is None else n
+    return np.repeat(np.asarray(equity, dtype="float64"), np.diff(bars, append=n))
+
+
+class EquityRuns:
+    # Run-length equity curve. Equity only moves when a trade closes, so only the bars
+    # where it changes are stored (bar index, timestamp, equity), 24 bytes per change
+    # instead of 16 per bar. A closing row for the last bar is added on output, so the
+    # last run's length and end time are known and the curve expands exactly.
+    def __init__(self, capacity=64, tz=None):
+        self.tz = tz
+        self.bars = 0               # bars seen, changed or not
+        self._n = 0
+        self._data = np.empty(max(capacity, 1), dtype=RUNS_DTYPE)
+        self._last = None           # (bar, timestamp, equity) of the latest bar
+        self._last_change = -1
+
+    def __len__(self):
+        return self._n
+
+    def _push(self, rows):
+        n, m = self._n, len(rows)
+        if n + m > len(self._data):
+            self._data = np.resize(self._data, max(n + m, 2 * len(self._data)))
+        self._data[n:n + m] = rows
+        self._n = n + m
+        if m:
+            self._last_change = rows["bar"][-1]
+
+    def extend(self, ts, equity):
+        # Blocks may be fed one after another; a run carries across block boundaries
+        equity = np.asarray(equity, dtype="float64")
+        k = len(equity)
+        if not k:
+            return
+        prev = self._last[2] if self._last is not None else np.nan
+        change = np.flatnonzero(equity != np.concatenate(([prev], equity[:-1])))
+        rows = np.empty(len(change), dtype=RUNS_DTYPE)
+        rows["bar"] = self.bars + change
+        rows["timestamp"] = np.asarray(ts)[change]
+        rows["equity"] = equity[change]
+        self._push(rows)
+        self.bars += k
+        self._last = (self.bars - 1, ts[-1], equity[-1])
+
+    def append(self, ts, equity):
+        self.extend([ts], [equity])
+
+    def clear(self):
+        # Drops stored change points (e.g. once written out); the open run is kept
+        self._n = 0
+
+    @property
+    def records(self):
+        return self._data[:self._n]
+
+    def closing_row(self):
+        # The last bar as a record, or an empty array if it is already a change point
+        if self._last is None or self._last_change == self.bars - 1:
+            return np.empty(0, dtype=RUNS_DTYPE)
+        return np.array([self._last], dtype=RUNS_DTYPE)
+
+    def seal(self):
+        # Stores the closing row, for writers that drain `records` block by block
+        self._push(self.closing_row())
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def sealed(self):
+        return np.concatenate((self.records, self.closing_row()))
+
+    def values(self):
+        # Expanded per-bar equity (needs every stored change point since the start)
+        records = self.sealed()
+        return expand_runs(records["bar"], records["equity"], self.bars)
+
+    def expand(self, timestamps):
+        # Full EquityLedger given the timestamps of all bars
+        ledger = EquityLedger(capacity=self.bars, tz=self.tz)
+        ledger.extend(np.asarray(timestamps)[:self.bars], self.values())
+        return ledger
+
+    def to_frame(self, drawdown=True, datetimes=True):
+        # Change points plus the closing row. Equity is flat between rows, so cum_max
+        # and drawdown are exact here too; plot with a post step (drawstyle="steps-post").
+        records = self.sealed()
+        equity = records["equity"]
+        timestamps = int64_to_datetime(records["timestamp"], self.tz) if datetimes else records["timestamp"]
+        data = {"bar": records["bar"], "timestamp": timestamps, "equity": equity}
+        if drawdown:
+            cum_max = np.maximum.accumulate(equity)
+            data["cum_max"] = cum_max
+            data["drawdown"] = equity / cum_max - 1
+        return pd.DataFrame(data, copy=False)
+
+    @classmethod
+    def from_frame(cls, frame, tz=None):
+        # From a compressed frame (with a "bar" column) or a per-bar equity curve
+        runs = cls(capacity=len(frame), tz=tz)
+        timestamps = frame["timestamp"]
+        if isinstance(timestamps.dtype, pd.DatetimeTZDtype) or timestamps.dtype.kind == "M":
+            timestamps, runs.tz = index_to_int64(pd.DatetimeIndex(timestamps))
+        timestamps = np.asarray(timestamps, dtype="int64")
+        if "bar" not in frame:
+            runs.extend(timestamps, frame["equity"].to_numpy())
+            return runs
+        rows = np.empty(len(frame), dtype=RUNS_DTYPE)
+        rows["bar"], rows["timestamp"] = frame["bar"].to_numpy(dtype="int64"), timestamps
+        rows["equity"] = frame["equity"].to_numpy(dtype="float64")
+        runs._push(rows)
+        if len(rows):
+            runs.bars = int(rows["bar"][-1]) + 1
+            runs._last = tuple(rows[-1])
+        return runs
+
+
+class LegLedger:
+    # Entry legs of open and recently closed positions (start bar, exit bar or -1 while
+    # open, entry price, size * leverage) for mark-to-market equity. The simulation loop
+    # only appends legs; unrealized PnL is filled in afterwards, one block at a time.
+    def __init__(self, capacity=64):
+        self._n = 0
+        self._open = 0              # legs from here on belong to the open position
+        self._data = np.empty(max(capacity, 1), dtype=LEG_DTYPE)
+
+    def __len__(self):
+        return self._n
+
+    def append(self, bar, price, exposure):
+        n = self._n
+        if n == len(self._data):
+            self._data = np.resize(self._data, 2 * n)
+        self._data[n] = (bar, -1, price, exposure)
+        self._n = n + 1
+
+    def close(self, bar):
+        # The position exits at `bar`; its PnL is realized there, so the legs count
+        # as unrealized up to the bar before
+        self._data["stop"][self._open:self._n] = bar
+        self._open = self._n
+
+    @property
+    def records(self):
+        return self._data[:self._n]
+
+    def unrealized(self, first_bar, closes):
+        # Open PnL per bar of the block starting at first_bar: sum over held legs of
+        # (price - entry) * size * leverage, i.e. (price - weighted entry) * exposure.
+        # The holding intervals are expanded with repeat and summed with bincount, so
+        # bars with no position get exactly 0.
+        legs, k = self.records, len(closes)
+        start = np.maximum(legs["start"] - first_bar, 0)
+        stop = np.where(legs["stop"] < 0, k, np.minimum(legs["stop"] - first_bar, k))
+        held = stop > start
+        start, lengths, legs = start[held], (stop - start)[held], legs[held]
+        if not len(legs):
+            return np.zeros(k)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        bars = np.repeat(start, lengths) + offsets
+        pnl = (np.asarray(closes)[bars] - np.repeat(legs["price"], lengths)) * np.repeat(legs["exposure"], lengths)
+        return np.bincount(bars, weights=pnl, minlength=k)
+
+    def prune(self):
+        # Drops closed legs once their blocks are marked; the open position's legs stay
+        open_legs = self._data[self._open:self._n].copy()
+        self._data[:len(open_legs)] = open_legs
+        self._n, self._open = len(open_legs), 0
+
+
+class TradeLedger:
+    def __init__(self, dtype=TRADE_DTYPE, capacity=64, tz=None):
+        self.dtype = np.dtype(dtype)
+        self.tz = tz
+        self._n = 0
+        self._data = np.empty(max(capacity, 1), dtype=self.dtype)
+
+    def __len__(self):
+        return self._n
+
+    def append(self, *values):
+        n = self._n
+        if n == len(self._data):
+            self._data = np.resize(self._data, 2 * n)
+        self._data[n] = values
+        self._n = n + 1
+
+    def clear(self):
+        self._n = 0
+
+    @property
+    def records(self):
+        return self._data[:self._n]
+
+    def to_frame(self, datetimes=True):
+        records = self.records
+        data = {}
+        for name in self.dtype.names:
+            column = records[name]
+            data[name] = int64_to_datetime(column, self.tz) if datetimes and name.endswith("_time") else column
+        return pd.DataFrame(data, copy=False)
@@ -0,0 +1,386 @@
+# market_data_server.py
+# Purpose: Local market data server. Each (symbol, timeframe) bar file is loaded once
+# into a multiprocessing.shared_memory block; clients ask for it by name over a
+# multiprocessing.connection socket and map the same pages as read-only NumPy views,
+# so N workers on one universe hold one copy of the data instead of N.
+#
+# The server refcounts datasets per client connection (a crashed client's references
+# are dropped when its socket closes) and unlinks unreferenced datasets in LRU order
+# once the configured capacity is exceeded.
+#
+# Usage:
+#   python market_data_server.py serve --data-dir . --capacity-mb 2048
+#   python market_data_server.py serve --compact                # float32 prices, about half the pages
+#   python market_data_server.py demo --workers 20          # server + 20 local consumers
+#
+#   with MarketDataClient() as client:
+#       bars = client.open("SPY", "5Min")
+#       close = bars["close"]            # read-only np.ndarray backed by shared memory
+#       df = bars.frame()                # zero-copy DataFrame with a tz-aware index
+
+import argparse
+import glob
+import os
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import Process, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bar_loader import COMPACT_DTYPES, load_bars
+from ledger import index_to_int64, int64_to_datetime
+
+ADDRESS = ("127.0.0.1", 6010)
+AUTHKEY = b"fin-toro-data"
+CAPACITY_MB = 2048
+COLUMNS = ("open", "high", "low", "close", "volume", "vwap", "trade_count")
+ALIGN = 64
+
+_created = set()        # segments this process created (and whose tracker entry it keeps)
+
+
+# === Shared-memory layout ===
+def _attach(name):
+    # Clients must not let their resource tracker unlink the server's segment at exit
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)       # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _created:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _pack(columns):
+    # columns: {name: 1-D array}; returns (segment, layout {name: (offset, dtype, length)})
+    layout, offset = {}, 0
+    for name, values in columns.items():
+        layout[name] = (offset, values.dtype.str, len(values))
+        offset += -(-values.nbytes // ALIGN) * ALIGN
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    _created.add(shm.name)
+    for name, values in columns.items():
+        start, dtype, n = layout[name]
+        np.ndarray(n, dtype=dtype, buffer=shm.buf, offset=start)[:] = values
+    return shm, layout
+
+
+def _release_segment(shm):
+    # Unlinking removes the name; clients that still map the pages keep them until they close
+    _created.discard(shm.name)
+    shm.close()
+    shm.unlink()
+
+
+class Dataset:
+    def __init__(self, key, path, shm, layout, tz):
+        self.key = key
+        self.path = path
+        self.shm = shm
+        self.layout = layout
+        self.tz = tz
+        self.refs = 0
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def describe(self):
+        return {"key": self.key, "path": self.path, "shm": self.shm.name,
+                "layout": self.layout, "tz": self.tz, "bytes": self.nbytes}
+
+
+# === Server ===
+class MarketDataServer:
+    def __init__(self, data_dir=".", address=ADDRESS, authkey=AUTHKEY, capacity_mb=CAPACITY_MB, compact=False):
+        self.data_dir = Path(data_dir)
+        self.compact = compact      # float32 prices (bar_loader.COMPACT_DTYPES)
+        self.address = address
+        self.authkey = authkey
+        self.capacity = capacity_mb * 1024 * 1024
+        self.datasets = OrderedDict()       # key -> Dataset, least recently used first
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def resolve(self, symbol, timeframe, path=None):
+        if path:
+            return os.path.abspath(path)
+        matches = sorted(glob.glob(str(self.data_dir / f"{symbol}_{timeframe}_*.csv")))
+        if not matches:
+            raise FileNotFoundError(f"No bar file for {symbol} {timeframe} in {self.data_dir}")
+        return os.path.abspath(matches[0])
+
+    def _load(self, key, path):
+        df = load_bars(path)
+        timestamps, tz = index_to_int64(df.index)
+        columns = {"timestamp": np.ascontiguousarray(timestamps, dtype="int64")}
+        for name in COLUMNS:
+            if name in df:
+                dtype = COMPACT_DTYPES.get(name, "float64") if self.compact else "float64"
+                columns[name] = df[name].to_numpy(dtype=dtype)
+        shm, layout = _pack(columns)
+        print(f"📦 Loaded {key[0]} {key[1]} ({len(df):,} bars, {shm.size / 1e6:.1f} MB) → {shm.name}")
+        return Dataset(key, path, shm, layout, str(tz) if tz is not None else None)
+
+    def _evict(self):
+        # Drop unreferenced datasets, least recently used first, until under capacity
+        total = sum(d.nbytes for d in self.datasets.values())
+        for key in list(self.datasets):
+            if total <= self.capacity:
+                break
+            dataset = self.datasets[key]
+            if dataset.refs:
+                continue
+            total -= dataset.nbytes
+            del self.datasets[key]
+            _release_segment(dataset.shm)
+            print(f"🧹 Evicted {key[0]} {key[1]}")
+
+    def acquire(self, symbol, timeframe, path=None):
+        # Datasets are keyed by their file, so a symbol's hist and strategy pulls stay apart
+        path = self.resolve(symbol, timeframe, path)
+        key = (symbol, timeframe, path)
+        with self.lock:
+            dataset = self.datasets.get(key)
+            if dataset is None:
+                dataset = self._load(key, path)
+                self.datasets[key] = dataset
+            self.datasets.move_to_end(key)
+            dataset.refs += 1
+            self._evict()
+            return dataset.describe()
+
+    def release(self, key):
+        key = tuple(key)
+        with self.lock:
+            dataset = self.datasets.get(key)
+            if dataset is not None and dataset.refs > 0:
+                dataset.refs -= 1
+            self._evict()
+
+    def stats(self):
+        with self.lock:
+            return [{"symbol": k[0], "timeframe": k[1], "path": k[2], "refs": d.refs, "bytes": d.nbytes}
+                    for k, d in self.datasets.items()]
+
+    def _handle(self, conn):
+        held = []
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    break
+                command = request[0]
+                try:
+                    if command == "acquire":
+                        reply = self.acquire(*request[1:])
+                        held.append(reply["key"])
+                    elif command == "release":
+                        key = tuple(request[1])
+                        if key in held:
+                            held.remove(key)
+                            self.release(key)
+                        reply = True
+                    elif command == "stats":
+                        reply = self.stats()
+                    elif command == "shutdown":
+                        reply = True
+                    else:
+                        raise ValueError(f"Unknown command '{command}'")
+                    conn.send(("ok", reply))
+                    if command == "shutdown":
+                        self._stop.set()
+                except Exception as exc:
+                    conn.send(("error", f"{type(exc).__name__}: {exc}"))
+        finally:
+            # A client that exits or crashes gives back everything it still holds
+            for key in held:
+                self.release(key)
+            conn.close()
+
+    def serve_forever(self):
+        listener = Listener(self.address, backlog=64, authkey=self.authkey)
+        print(f"🛰️ Market data server on {self.address[0]}:{self.address[1]} (capacity {self.capacity / 1e6:.0f} MB)")
+
+        def accept():
+            while not self._stop.is_set():
+                try:
+                    conn = listener.accept()
+                except OSError:
+                    break
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+        threading.Thread(target=accept, daemon=True).start()
+        try:
+            while not self._stop.wait(0.2):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            self.shutdown()
+
+    def shutdown(self):
+        with self.lock:
+            for dataset in self.datasets.values():
+                _release_segment(dataset.shm)
+            self.datasets.clear()
+        print("🛑 Market data server stopped")
+
+
+# === Client ===
+class SharedBars:
+    # Read-only views on one dataset; close() (or the client) releases the server ref
+    def __init__(self, client, info):
+        self.client = client
+        self.key = tuple(info["key"])
+        self.tz = info["tz"]
+        self._shm = _attach(info["shm"])
+        self.columns = {}
+        for name, (offset, dtype, n) in info["layout"].items():
+            view = np.ndarray(n, dtype=dtype, buffer=self._shm.buf, offset=offset)
+            view.flags.writeable = False
+            self.columns[name] = view
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns["timestamp"])
+
+    def frame(self):
+        data = {name: values for name, values in self.columns.items() if name != "timestamp"}
+        index = int64_to_datetime(self.columns["timestamp"], self.tz).rename("timestamp")
+        return pd.DataFrame(data, index=index, copy=False)
+
+    def close(self):
+        if self._shm is None:
+            return
+        self.columns = {}
+        try:
+            self._shm.close()
+        except BufferError:
+            pass        # a caller still holds a view; the mapping goes when it does
+        self._shm = None
+        self.client._request("release", self.key)
+
+
+class MarketDataClient:
+    def __init__(self, address=ADDRESS, authkey=AUTHKEY, retries=50):
+        for attempt in range(retries):
+            try:
+                self.conn = Client(address, authkey=authkey)
+                break
+            except ConnectionRefusedError:
+                if attempt == retries - 1:
+                    raise
+                time.sleep(0.1)
+        self.open_bars = []
+
+    def _request(self, *request):
+        self.conn.send(request)
+        status, reply = self.conn.recv()
+        if status == "error":
+            raise RuntimeError(reply)
+        return reply
+
+    def open(self, symbol, timeframe="5Min", path=None):
+        bars = SharedBars(self, self._request("acquire", symbol, timeframe, path))
+        self.open_bars.append(bars)
+        return bars
+
+    def stats(self):
+        return self._request("stats")
+
+    def shutdown_server(self):
+        return self._request("shutdown")
+
+    def close(self):
+        for bars in self.open_bars:
+            bars.close()
+        self.open_bars = []
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# === Demo: N consumers sharing one copy ===
+def _private_kb():
+    # Private (unshared) resident memory of this process, from smaps_rollup
+    try:
+        fields = dict(line.split(":", 1) for line in Path("/proc/self/smaps_rollup").read_text().splitlines()[1:])
+        return sum(int(fields[k].split()[0]) for k in ("Private_Clean", "Private_Dirty"))
+    except (OSError, KeyError):
+        return 0
+
+
+def _demo_worker(symbols, timeframe, address, results):
+    from strategy_engine import KernelContext, compute_signals
+
+    with MarketDataClient(address) as client:
+        before = _private_kb()
+        opened = [client.open(symbol, timeframe) for symbol in symbols]
+        checksum = sum(float(bars["close"].sum()) for bars in opened)     # touches every page
+        private = _private_kb() - before
+        longs = 0
+        for bars in opened:
+            signal, valid, _ = compute_signals(KernelContext(bars.frame()), "sma_ema")
+            longs += int((signal[valid] == 1).sum())
+        results.put((os.getpid(), longs, private, checksum))
+
+
+def run_demo(n_workers, symbols, timeframe, data_dir, address=ADDRESS):
+    from multiprocessing import Queue
+
+    server = Process(target=MarketDataServer(data_dir, address).serve_forever, daemon=True)
+    server.start()
+    results = Queue()
+    workers = [Process(target=_demo_worker, args=(symbols, timeframe, address, results)) for _ in range(n_workers)]
+    for w in workers:
+        w.start()
+    rows = [results.get() for _ in workers]
+    for w in workers:
+        w.join()
+
+    with MarketDataClient(address) as client:
+        stats = client.stats()
+        client.shutdown_server()
+    server.join(timeout=5)
+
+    shared = sum(s["bytes"] for s in stats)
+    print(f"\n📊 {n_workers} workers × {len(symbols)} symbols")
+    print(f" - Shared copy: {shared / 1e6:.2f} MB in {len(stats)} segment(s)")
+    print(f" - Private memory added per worker by mapping the data: {np.mean([r[2] for r in rows]) / 1024:.2f} MB (avg)")
+    print(f" - Long bars seen by each worker: {sorted({r[1] for r in rows})}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared-memory market data server")
+    sub = parser.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("serve")
+    s.add_argument("--data-dir", default=".")
+    s.add_argument("--port", type=int, default=ADDRESS[1])
+    s.add_argument("--capacity-mb", type=float, default=CAPACITY_MB)
+    s.add_argument("--compact", action="store_true", help="Store prices as float32")
+    d = sub.add_parser("demo")
+    d.add_argument("--workers", type=int, default=20)
+    d.add_argument("--symbols", nargs="+", default=["SPY", "SSO", "UPRO"])
+    d.add_argument("--timeframe", default="5Min")
+    d.add_argument("--data-dir", default=".")
+    d.add_argument("--port", type=int, default=ADDRESS[1])
+    args = parser.parse_args()
+
+    address = (ADDRESS[0], args.port)
+    if args.command == "serve":
+        MarketDataServer(args.data_dir, address, capacity_mb=args.capacity_mb, compact=args.compact).serve_forever()
+    else:
+        run_demo(args.workers, args.symbols, args.timeframe, args.data_dir, address)
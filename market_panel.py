@@ -0,0 +1,132 @@
+# market_panel.py
+# Purpose: Multi-symbol bar panel. Every field (close, volume, equity, ...) is one
+# (n_bars, n_symbols) float array on a shared calendar, with a boolean mask marking
+# which symbol actually printed a bar at each timestamp. Cross-symbol indicators,
+# returns, correlation and plotting work column-wise on these arrays instead of
+# filtering a long concatenated frame symbol by symbol.
+#
+# Usage:
+#   panel = MarketPanel.from_csvs({"SPY": "SPY_5Min_strategy_2d.csv", "SSO": "SSO_5Min_strategy_2d.csv"})
+#   panel.correlation()                 # close-to-close return correlation
+#   panel.rolling_mean("close", 20)     # (n_bars, n_symbols)
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bar_loader import load_bars
+from ledger import locate
+
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+
+
+# === Calendars ===
+def trading_calendar(start, end, freq="5min", session=("04:00", "20:00"), tz="America/New_York"):
+    # Weekday bars between the session open (inclusive) and close (exclusive), in UTC.
+    # The default session covers pre-market through after-hours, as the Alpaca pulls do.
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    days = pd.date_range(start.tz_convert(tz).normalize() if start.tzinfo else start.tz_localize(tz).normalize(),
+                         end.tz_convert(tz).normalize() if end.tzinfo else end.tz_localize(tz).normalize(),
+                         freq="B")
+    open_offset, close_offset = pd.Timedelta(f"{session[0]}:00"), pd.Timedelta(f"{session[1]}:00")
+    step = pd.Timedelta(freq)
+    per_day = np.arange(open_offset.value, close_offset.value, step.value, dtype="int64")
+    # Localize each day's midnight so DST shifts the session, then add intraday offsets
+    stamps = (days.tz_localize(None).tz_localize(tz).asi8[:, None] + per_day[None, :]).ravel()
+    calendar = pd.DatetimeIndex(stamps.view("M8[ns]")).tz_localize("UTC")
+    return calendar[(calendar >= start) & (calendar <= end)]
+
+
+class MarketPanel:
+    def __init__(self, calendar, symbols, fields, mask):
+        self.calendar = calendar        # DatetimeIndex, one row per bar
+        self.symbols = list(symbols)    # one column per symbol
+        self.fields = fields            # name -> (n_bars, n_symbols) float64 array, NaN where missing
+        self.mask = mask                # (n_bars, n_symbols) bool, True where a bar exists
+
+    # === Construction ===
+    @classmethod
+    def from_frames(cls, frames, fields=BAR_FIELDS, calendar=None):
+        # frames: {symbol: DataFrame indexed by timestamp}. calendar defaults to the
+        # sorted union of all timestamps; pass trading_calendar(...) (or any sorted
+        # index) for a fixed grid. Bars are matched on int64 epoch-ns by binary search.
+        symbols = list(frames)
+        if calendar is None:
+            stamps = np.unique(np.concatenate([frames[s].index.asi8 for s in symbols]))
+            tz = next((frames[s].index.tz for s in symbols if frames[s].index.tz is not None), None)
+            calendar = pd.DatetimeIndex(stamps.view("M8[ns]"))
+            calendar = calendar.tz_localize("UTC").tz_convert(tz) if tz is not None else calendar
+        fields = [f for f in fields if any(f in frames[s] for s in symbols)]
+
+        shape = (len(calendar), len(symbols))
+        arrays = {f: np.full(shape, np.nan) for f in fields}
+        mask = np.zeros(shape, dtype=bool)
+        for j, symbol in enumerate(symbols):
+            df = frames[symbol]
+            rows = locate(calendar.asi8, df.index.asi8)
+            found = rows >= 0           # bars outside the calendar are dropped
+            rows = rows[found]
+            mask[rows, j] = True
+            for f in fields:
+                if f in df:
+                    arrays[f][rows, j] = df[f].to_numpy(dtype="float64")[found]
+        return cls(calendar, symbols, arrays, mask)
+
+    @classmethod
+    def from_csvs(cls, paths, fields=BAR_FIELDS, calendar=None):
+        # paths: {symbol: csv path} or a list of paths named like SPY_5Min_...csv
+        if not isinstance(paths, dict):
+            paths = {Path(p).name.split("_")[0]: p for p in paths}
+        frames = {s: load_bars(p) for s, p in paths.items()}
+        return cls.from_frames(frames, fields, calendar)
+
+    # === Access ===
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def column(self, symbol, field="close", present_only=True):
+        j = self.symbols.index(symbol)
+        values = self.fields[field][:, j]
+        return pd.Series(values[self.mask[:, j]] if present_only else values,
+                         index=self.calendar[self.mask[:, j]] if present_only else self.calendar,
+                         name=symbol)
+
+    def to_frame(self, field="close"):
+        return pd.DataFrame(self.fields[field], index=self.calendar, columns=self.symbols)
+
+    def coverage(self):
+        return pd.Series(self.mask.mean(axis=0), index=self.symbols, name="coverage")
+
+    # === Column-wise transforms ===
+    def ffill(self, field="close"):
+        # Carries each symbol's last printed value over its missing bars
+        values = self.fields[field]
+        rows = np.where(self.mask, np.arange(len(values))[:, None], 0)
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        filled = values[rows, np.arange(values.shape[1])]
+        filled[~np.maximum.accumulate(self.mask, axis=0)] = np.nan    # before the first bar
+        return filled
+
+    def returns(self, field="close", fill=True):
+        # Bar-to-bar returns per symbol; with fill=False a missing bar breaks the chain
+        values = self.ffill(field) if fill else self.fields[field]
+        out = np.full(values.shape, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[1:] = values[1:] / values[:-1] - 1
+        out[~self.mask] = np.nan
+        return out
+
+    def rolling_mean(self, field, window, fill=True):
+        values = self.ffill(field) if fill else self.fields[field]
+        return pd.DataFrame(values).rolling(window).mean().to_numpy()
+
+    def correlation(self, field="close", min_periods=2):
+        # Pairwise correlation of returns over bars where both symbols printed
+        return pd.DataFrame(self.returns(field), columns=self.symbols).corr(min_periods=min_periods)
+
+    def normalized(self, field="close"):
+        # Each symbol rebased to 1.0 at its first printed bar
+        filled = self.ffill(field)
+        first = np.argmax(self.mask, axis=0)
+        return filled / filled[first, np.arange(filled.shape[1])]
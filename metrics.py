@@ -0,0 +1,165 @@
+# metrics.py
+# Purpose: One vectorized pass over an equity curve (and optional trade log) that
+# yields returns, Sharpe, Sortino, volatility, max drawdown and its duration, and
+# win/loss statistics. Results are memoized by the content of the equity curve and
+# trade PnL, so several report sections asking for metrics of the same run share one
+# computation, and curves edited in place are recomputed.
+#
+# The legacy helpers (backtest_scaling.calculate_*, analysis_extras.calculate_*)
+# delegate here with their historical conventions via the keyword arguments.
+
+import hashlib
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ledger import EquityRuns, expand_runs
+
+INTRADAY_PERIODS = 252 * 78   # 5-minute bars per trading year
+CACHE_SIZE = 32
+FLAT_STD = 1e-15   # below this a return series is numerically flat (Sharpe reported as 0)
+
+_cache = OrderedDict()
+
+
+# === Input helpers ===
+def equity_values(equity):
+    # Run-length curves (EquityRuns or its frames, which carry a "bar" column) are
+    # expanded back to one value per bar, so returns and Sharpe are per bar either way
+    if isinstance(equity, EquityRuns):
+        return equity.values()
+    if isinstance(equity, pd.DataFrame) and "bar" in equity:
+        return expand_runs(equity["bar"].to_numpy(), equity["equity"].to_numpy())
+    if isinstance(equity, pd.DataFrame):
+        equity = equity["equity"]
+    if isinstance(equity, pd.Series):
+        return equity.to_numpy(dtype="float64")
+    return np.asarray(equity, dtype="float64")
+
+
+def pnl_values(trades):
+    if trades is None:
+        return None
+    if isinstance(trades, pd.DataFrame):
+        if "pnl" not in trades:
+            return np.empty(0)
+        trades = trades["pnl"]
+    if isinstance(trades, pd.Series):
+        return trades.to_numpy(dtype="float64")
+    trades = np.asarray(trades)
+    if trades.dtype.names and "pnl" in trades.dtype.names:
+        trades = trades["pnl"]
+    return trades.astype("float64", copy=False)
+
+
+def simple_returns(equity, fill_first=False):
+    e = equity_values(equity)
+    if len(e) < 2:
+        return np.zeros(len(e)) if fill_first else np.empty(0)
+    r = np.empty(len(e) if fill_first else len(e) - 1)
+    body = r[1:] if fill_first else r
+    np.divide(e[1:], e[:-1], out=body)
+    body -= 1
+    if fill_first:
+        r[0] = 0.0
+    return r
+
+
+def _fingerprint(values):
+    # Content hash; hashing is a small fraction of the cost of the metrics themselves
+    if values is None:
+        return None
+    values = np.ascontiguousarray(values, dtype="float64")
+    return len(values), hashlib.blake2b(values.view(np.uint8), digest_size=16).digest()
+
+
+# === Core computations ===
+def drawdown_stats(e):
+    if not len(e):
+        return 0.0, 0
+    cum_max = np.maximum.accumulate(e)
+    max_dd = float((e / cum_max - 1).min())
+    # Bars since the last running peak; the longest stretch is the duration
+    idx = np.arange(len(e))
+    last_peak = np.maximum.accumulate(np.where(e >= cum_max, idx, 0))
+    return max_dd, int((idx - last_peak).max())
+
+
+def trade_stats(pnl):
+    n = len(pnl) if pnl is not None else 0
+    if not n:
+        return {"total_trades": 0, "win_rate": 0.0, "avg_win": 0.0, "avg_loss": 0.0,
+                "avg_pnl": 0.0, "total_pnl": 0.0, "profit_factor": 0.0}
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+    gross_win, gross_loss = wins.sum(), losses.sum()
+    return {
+        "total_trades": n,
+        "win_rate": len(wins) / n,
+        "avg_win": float(wins.mean()) if len(wins) else 0.0,
+        "avg_loss": float(losses.mean()) if len(losses) else 0.0,
+        "avg_pnl": float(pnl.mean()),
+        "total_pnl": float(pnl.sum()),
+        "profit_factor": float(gross_win / -gross_loss) if gross_loss else float("inf") if gross_win else 0.0,
+    }
+
+
+def _compute(e, pnl, periods_per_year, risk_free_rate, ddof, fill_first):
+    returns = simple_returns(e, fill_first=fill_first)
+    excess = returns - risk_free_rate
+    n = len(excess)
+
+    mean = float(excess.mean()) if n else 0.0
+    std = float(excess.std(ddof=ddof)) if n > ddof else 0.0
+    downside = np.minimum(excess, 0.0)
+    downside_dev = float(np.sqrt((downside * downside).mean())) if n else 0.0
+    scale = float(np.sqrt(periods_per_year))
+
+    max_dd, dd_duration = drawdown_stats(e)
+    result = {
+        "bars": len(e),
+        "initial_equity": float(e[0]) if len(e) else 0.0,
+        "final_equity": float(e[-1]) if len(e) else 0.0,
+        "total_return": float(e[-1] / e[0] - 1) if len(e) else 0.0,
+        "mean_return": mean,
+        "volatility": std,
+        "annual_volatility": std * scale,
+        "sharpe": mean / std * scale if std > FLAT_STD else 0.0,
+        "sortino": mean / downside_dev * scale if downside_dev > 0 else 0.0,
+        "max_drawdown": max_dd,
+        "max_drawdown_duration": dd_duration,
+    }
+    result.update(trade_stats(pnl))
+    return result
+
+
+def compute_metrics(equity, trades=None, periods_per_year=INTRADAY_PERIODS,
+                    risk_free_rate=0.0, ddof=1, fill_first=False):
+    # risk_free_rate is per period; fill_first counts the first bar as a 0% return
+    e = equity_values(equity)
+    pnl = pnl_values(trades)
+    params = (periods_per_year, risk_free_rate, ddof, fill_first)
+
+    # Memo key: the equity and PnL contents, so in-place edits (e.g. rescaled trade
+    # PnL) never return stale results
+    key = (_fingerprint(e), _fingerprint(pnl), params)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return dict(_cache[key])
+
+    result = _compute(e, pnl, *params)
+    try:
+        weakref.finalize(equity, _cache.pop, key, None)
+        if trades is not None:
+            weakref.finalize(trades, _cache.pop, key, None)
+    except TypeError:
+        return result     # plain lists etc. cannot be tracked, so skip the cache
+    _cache[key] = result
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return dict(result)
+
+
+def clear_cache():
+    _cache.clear()
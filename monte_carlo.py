@@ -0,0 +1,144 @@
+# monte_carlo.py
+# Purpose: Monte Carlo resampling of a backtest's trade sequence. Trade returns are
+# bootstrapped (with replacement) or permuted into an (n_paths, n_trades + 1) equity
+# matrix in one vectorized pass, giving distributions of final equity and max
+# drawdown and the probability of touching a capital floor.
+#
+# Usage:
+#   python monte_carlo.py SSO_advanced_trade_log.csv --paths 100000 --floor 0.95
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from metrics import pnl_values
+
+FAN_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+# === Path generation ===
+def trade_returns(trades, initial_capital=100000):
+    # Each trade's PnL as a fraction of the capital it was opened with
+    pnl = pnl_values(trades)
+    capital_before = initial_capital + np.concatenate(([0.0], np.cumsum(pnl)[:-1]))
+    return pnl / capital_before
+
+
+def simulate_paths(returns, n_paths=10000, n_trades=None, method="bootstrap",
+                   initial_capital=100000, seed=None, dtype="float64"):
+    returns = np.asarray(returns, dtype=dtype)
+    n_trades = len(returns) if n_trades is None else n_trades
+    rng = np.random.default_rng(seed)
+
+    if method == "bootstrap":
+        growth = 1 + returns[rng.integers(0, len(returns), size=(n_paths, n_trades))]
+    elif method == "permute":
+        if n_trades != len(returns):
+            raise ValueError("Permutation paths must have exactly one step per trade.")
+        growth = rng.permuted(np.broadcast_to(1 + returns, (n_paths, n_trades)), axis=1)
+    else:
+        raise ValueError(f"Method '{method}' not recognized.")
+
+    paths = np.empty((n_paths, n_trades + 1), dtype=dtype)
+    paths[:, 0] = initial_capital
+    np.cumprod(growth, axis=1, out=paths[:, 1:])
+    paths[:, 1:] *= initial_capital
+    return paths
+
+
+# === Statistics ===
+def path_max_drawdowns(paths):
+    peaks = np.maximum.accumulate(paths, axis=1)
+    return (paths / peaks - 1).min(axis=1)
+
+
+def summarize_paths(paths, floor_pct=0.95):
+    initial = paths[0, 0]
+    final = paths[:, -1]
+    max_dd = path_max_drawdowns(paths)
+    floor = initial * floor_pct
+    q = [5, 50, 95]
+    final_q = np.percentile(final, q)
+    dd_q = np.percentile(max_dd, q)
+    return {
+        "paths": len(paths),
+        "trades_per_path": paths.shape[1] - 1,
+        "floor": floor,
+        "prob_floor": float((paths.min(axis=1) <= floor).mean()),
+        "prob_loss": float((final < initial).mean()),
+        "final_mean": float(final.mean()),
+        "final_p5": float(final_q[0]),
+        "final_p50": float(final_q[1]),
+        "final_p95": float(final_q[2]),
+        "max_drawdown_p5": float(dd_q[0]),
+        "max_drawdown_p50": float(dd_q[1]),
+        "max_drawdown_p95": float(dd_q[2]),
+    }
+
+
+def run_monte_carlo(trades, initial_capital=100000, n_paths=10000, method="bootstrap",
+                    floor_pct=0.95, seed=None):
+    paths = simulate_paths(trade_returns(trades, initial_capital), n_paths,
+                           method=method, initial_capital=initial_capital, seed=seed)
+    return paths, summarize_paths(paths, floor_pct)
+
+
+# === Charts ===
+def plot_fan_chart(paths, symbol, outpath, floor=None, percentiles=FAN_PERCENTILES):
+    bands = np.percentile(paths, percentiles, axis=0)
+    steps = np.arange(paths.shape[1])
+
+    plt.figure(figsize=(12, 5))
+    half = len(percentiles) // 2
+    for k in range(half):
+        alpha = 0.15 + 0.2 * k
+        plt.fill_between(steps, bands[k], bands[-1 - k], color="steelblue", alpha=alpha,
+                         label=f"P{percentiles[k]}–P{percentiles[-1 - k]}")
+    plt.plot(steps, bands[half], color="navy", linewidth=1.5, label=f"P{percentiles[half]}")
+    if floor is not None:
+        plt.axhline(floor, color="red", linestyle="--", label="Capital floor")
+    plt.title(f"{symbol} Monte Carlo Equity Fan ({len(paths):,} paths)")
+    plt.xlabel("Trade #")
+    plt.ylabel("Equity")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(outpath)
+    plt.close()
+    return outpath
+
+
+def print_summary(summary):
+    print("\n🎲 Monte Carlo Summary:")
+    print(f" - Paths: {summary['paths']:,} × {summary['trades_per_path']} trades")
+    print(f" - Final Equity P5/P50/P95: ${summary['final_p5']:.2f} / ${summary['final_p50']:.2f} / ${summary['final_p95']:.2f}")
+    print(f" - Max Drawdown P5/P50/P95: {summary['max_drawdown_p5']:.2%} / {summary['max_drawdown_p50']:.2%} / {summary['max_drawdown_p95']:.2%}")
+    print(f" - P(loss): {summary['prob_loss']:.2%}")
+    print(f" - P(hit ${summary['floor']:.2f} floor): {summary['prob_floor']:.2%}")
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Monte Carlo trade resampling")
+    parser.add_argument("trade_log", help="Trade log CSV with a pnl column")
+    parser.add_argument("--capital", type=float, default=100000)
+    parser.add_argument("--paths", type=int, default=10000)
+    parser.add_argument("--method", choices=["bootstrap", "permute"], default="bootstrap")
+    parser.add_argument("--floor", type=float, default=0.95, help="Capital floor as a fraction of initial capital")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--chart", help="Optional fan chart output path")
+    args = parser.parse_args()
+
+    trades = pd.read_csv(args.trade_log)
+    if trades.empty:
+        raise SystemExit("⚠️ Trade log is empty; nothing to resample.")
+    paths, summary = run_monte_carlo(trades, args.capital, args.paths, args.method, args.floor, args.seed)
+    print_summary(summary)
+
+    if args.chart:
+        symbol = Path(args.trade_log).name.split("_")[0]
+        plot_fan_chart(paths, symbol, args.chart, floor=summary["floor"])
+        print(f"💾 {args.chart}")
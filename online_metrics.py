@@ -0,0 +1,138 @@
+# online_metrics.py
+# Purpose: Streaming performance accumulators the simulators update bar by bar and
+# trade by trade, so sweeps and live runs can report final metrics without keeping
+# the equity curve. summary() returns the same keys as metrics.compute_metrics.
+#
+# Usage:
+#   acc = RunningMetrics()
+#   trades, _ = simulate_strategy_advanced(df, metrics=acc, record_equity=False)
+#   print(acc.summary()["sharpe"])
+
+import math
+
+from metrics import INTRADAY_PERIODS, FLAT_STD
+
+
+class RunningMetrics:
+    def __init__(self, risk_free_rate=0.0):
+        # risk_free_rate is per bar, as in metrics.compute_metrics
+        self.risk_free_rate = risk_free_rate
+        self.bars = 0
+        self.initial = None
+        self.last = None
+
+        # Welford mean / sum of squared deviations of excess returns
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.downside_sq = 0.0
+        self._flat = 0
+
+        self.peak = None
+        self.peak_bar = 0
+        self.max_drawdown = 0.0
+        self.max_drawdown_duration = 0
+
+        self.n_trades = 0
+        self.n_wins = 0
+        self.n_losses = 0
+        self.gross_win = 0.0
+        self.gross_loss = 0.0
+
+    # === Returns ===
+    def _merge(self, n, mean, m2):
+        # Chan et al. pairwise merge of (n, mean, m2) into the running moments
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    def _fold_flat(self):
+        # Bars where equity did not move all carry the same excess return (-rf)
+        k, self._flat = self._flat, 0
+        if k:
+            r = -self.risk_free_rate
+            self._merge(k, r, 0.0)
+            if r < 0:
+                self.downside_sq += k * r * r
+
+    def update(self, equity, bars=1):
+        # bars > 1 feeds the same equity for that many consecutive bars (a flat run)
+        idx = self.bars
+        end = idx + bars - 1
+        self.bars += bars
+        if self.last is None:
+            self.initial = self.last = self.peak = equity
+            self.peak_bar = end
+            self._flat += bars - 1
+            return
+
+        if equity == self.last:
+            self._flat += bars
+        else:
+            self._fold_flat()
+            r = equity / self.last - 1 - self.risk_free_rate
+            self.count += 1
+            delta = r - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (r - self.mean)
+            if r < 0:
+                self.downside_sq += r * r
+            self.last = equity
+            self._flat += bars - 1
+
+        if equity >= self.peak:
+            self.peak = equity
+            self.peak_bar = end
+        else:
+            dd = equity / self.peak - 1
+            if dd < self.max_drawdown:
+                self.max_drawdown = dd
+            if end - self.peak_bar > self.max_drawdown_duration:
+                self.max_drawdown_duration = end - self.peak_bar
+
+    # === Trades ===
+    def record_trade(self, pnl):
+        self.n_trades += 1
+        if pnl > 0:
+            self.n_wins += 1
+            self.gross_win += pnl
+        elif pnl < 0:
+            self.n_losses += 1
+            self.gross_loss += pnl
+
+    # === Results ===
+    def variance(self, ddof=1):
+        self._fold_flat()
+        return self.m2 / (self.count - ddof) if self.count > ddof else 0.0
+
+    def summary(self, periods_per_year=INTRADAY_PERIODS, ddof=1):
+        std = math.sqrt(self.variance(ddof))
+        downside_dev = math.sqrt(self.downside_sq / self.count) if self.count else 0.0
+        scale = math.sqrt(periods_per_year)
+        n = self.n_trades
+        total_pnl = self.gross_win + self.gross_loss
+        has_equity = self.initial is not None
+
+        return {
+            "bars": self.bars,
+            "initial_equity": float(self.initial) if has_equity else 0.0,
+            "final_equity": float(self.last) if has_equity else 0.0,
+            "total_return": float(self.last / self.initial - 1) if has_equity else 0.0,
+            "mean_return": self.mean,
+            "volatility": std,
+            "annual_volatility": std * scale,
+            "sharpe": self.mean / std * scale if std > FLAT_STD else 0.0,
+            "sortino": self.mean / downside_dev * scale if downside_dev > 0 else 0.0,
+            "max_drawdown": self.max_drawdown,
+            "max_drawdown_duration": self.max_drawdown_duration,
+            "total_trades": n,
+            "win_rate": self.n_wins / n if n else 0.0,
+            "avg_win": self.gross_win / self.n_wins if self.n_wins else 0.0,
+            "avg_loss": self.gross_loss / self.n_losses if self.n_losses else 0.0,
+            "avg_pnl": total_pnl / n if n else 0.0,
+            "total_pnl": total_pnl,
+            "profit_factor": (self.gross_win / -self.gross_loss if self.gross_loss
+                              else float("inf") if self.gross_win else 0.0),
+        }
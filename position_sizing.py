@@ -0,0 +1,171 @@
+# position_sizing.py
+# Purpose: Pluggable entry sizing for the advanced simulator. A sizer turns a run's
+# bars into two per-bar arrays before the loop starts. bet_risk is the fraction of
+# capital committed and leverage is its multiplier, so an entry at bar i takes
+# capital * bet_risk[i] * leverage[i] of exposure. Inside the loop each sizing
+# decision is then an array lookup, and because sizers are named, sweeps can vary
+# them like any other parameter (the "sizing" key in walk_forward.RISK_PARAMS).
+#
+#   legacy       the original bar-index pattern: bet_risk 1-5%, leverage 1..max_leverage
+#   fixed        constant bet_risk and leverage
+#   vol_target   exposure chosen so that one ATR move is `target` of capital
+#   kelly        fractional Kelly from rolling win statistics of past entries
+#
+# Until a sizer's estimate is ready (ATR warm-up, too few resolved signals) it takes
+# its base bet_risk at 1x. Scale-ins keep their fixed 1% at 3x. Every sizer only
+# looks back, so the arrays for a prefix of the bars equal the prefix of the arrays.
+#
+# Usage:
+#   simulate_strategy_advanced(df, strategy="macd", sizing="vol_target")
+#   backtest_signals(timestamps, closes, signals, sizing=Kelly(fraction=0.25), bars={"high": h, "low": l})
+#   python sweep_coordinator.py run --queue sweeps/q1 --bars SSO_5Min_hist_2d.csv --sizing legacy kelly
+
+import numpy as np
+import pandas as pd
+
+from strategy_engine import KernelContext
+
+
+def _arrays(bet_risk, leverage):
+    return np.asarray(bet_risk), np.asarray(leverage)
+
+
+def _target_leverage(exposure, bet_risk, max_leverage):
+    # Leverage that turns bet_risk into the wanted exposure, capped at max_leverage;
+    # bars without an estimate fall back to 1x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        leverage = np.clip(exposure / bet_risk, 0.0, max_leverage)
+    return np.where(np.isfinite(leverage), leverage, 1.0)
+
+
+# === Sizers ===
+class Legacy:
+    # bet_risk 0.01 + 0.01 * (i % 5) and leverage min(1 + i % max_leverage, max_leverage)
+    name = "legacy"
+
+    def arrays(self, closes, signals, bars=None, stop_loss_pct=0.002, take_profit_pct=0.004, max_leverage=4):
+        i = np.arange(len(closes))
+        return _arrays(0.01 + 0.01 * (i % 5), np.minimum(1 + i % max_leverage, max_leverage))
+
+
+class FixedFraction:
+    name = "fixed"
+
+    def __init__(self, bet_risk=0.02, leverage=1):
+        self.bet_risk = bet_risk
+        self.leverage = leverage
+
+    def arrays(self, closes, signals, bars=None, stop_loss_pct=0.002, take_profit_pct=0.004, max_leverage=4):
+        n = len(closes)
+        return _arrays(np.full(n, self.bet_risk), np.full(n, min(self.leverage, max_leverage)))
+
+
+class VolatilityTarget:
+    # Exposure = target / (ATR / close): a one-ATR move changes equity by `target` of
+    # capital. Without high/low columns the true range is the close-to-close move.
+    name = "vol_target"
+
+    def __init__(self, target=0.0001, window=14, bet_risk=0.05):
+        self.target = target
+        self.window = window
+        self.bet_risk = bet_risk
+
+    def arrays(self, closes, signals, bars=None, stop_loss_pct=0.002, take_profit_pct=0.004, max_leverage=4):
+        closes = np.asarray(closes, dtype="float64")
+        bars = {} if bars is None else bars
+        frame = pd.DataFrame({"high": np.asarray(bars.get("high", closes), dtype="float64"),
+                              "low": np.asarray(bars.get("low", closes), dtype="float64"),
+                              "close": closes})
+        atr = KernelContext(frame).atr(self.window)
+        leverage = _target_leverage(self.target * closes / atr, self.bet_risk, max_leverage)
+        return _arrays(np.full(len(closes), self.bet_risk), leverage)
+
+
+class Kelly:
+    # Labels the bars where the simulator would enter (signal 1 while flat) with the
+    # outcome its exit rule gives them: the first later close at or beyond the
+    # take-profit or stop-loss level within `horizon` bars. The next entry is the first
+    # signal-1 bar from that exit on (or from `horizon` bars later if unresolved), so
+    # signals inside an open trade are not counted as trades of their own. A label only
+    # counts from the bar it resolves on. Over the labels resolved in the last `window`
+    # bars, p = win rate, b = average win / average loss, and the Kelly fraction
+    # p - (1 - p) / b is the share of capital to expose: leverage = fraction * kelly /
+    # bet_risk, capped at max_leverage. A negative Kelly fraction means no entry.
+    name = "kelly"
+
+    def __init__(self, fraction=0.5, window=2000, min_trades=30, horizon=78, bet_risk=0.05):
+        self.fraction = fraction
+        self.window = window
+        self.min_trades = min_trades
+        self.horizon = horizon
+        self.bet_risk = bet_risk
+
+    def outcomes(self, closes, signals, stop_loss_pct, take_profit_pct, block=4096):
+        # (resolution bar, return) of every resolved entry
+        closes = np.asarray(closes, dtype="float64")
+        padded = np.concatenate((closes, np.full(self.horizon, np.nan)))
+        paths = np.lib.stride_tricks.sliding_window_view(padded, self.horizon + 1)
+        signal_bars = np.flatnonzero(np.asarray(signals) == 1)
+        # Exit bar of a trade opened on each signal-1 bar, in blocks of bars; 0 = unresolved
+        offsets = []
+        for start in range(0, len(signal_bars), block):
+            j = signal_bars[start:start + block]
+            entry, later = closes[j, None], paths[j, 1:]
+            hit = (later <= entry * (1 - stop_loss_pct)) | (later >= entry * (1 + take_profit_pct))
+            offsets.append(np.where(hit.any(axis=1), hit.argmax(axis=1) + 1, 0))
+        offset = np.concatenate(offsets) if offsets else np.empty(0, dtype="int64")
+        exit_at = signal_bars + np.where(offset > 0, offset, self.horizon)
+
+        # Walk the trades: the position is flat again from its exit bar on
+        taken, pos = [], 0
+        while pos < len(signal_bars):
+            taken.append(pos)
+            pos = int(np.searchsorted(signal_bars, exit_at[pos]))
+        taken = np.asarray(taken, dtype="int64")
+        taken = taken[offset[taken] > 0]
+        j = signal_bars[taken]
+        resolved_at = j + offset[taken]
+        return resolved_at, closes[resolved_at] / closes[j] - 1
+
+    def arrays(self, closes, signals, bars=None, stop_loss_pct=0.002, take_profit_pct=0.004, max_leverage=4):
+        n = len(closes)
+        resolved_at, returns = self.outcomes(closes, signals, stop_loss_pct, take_profit_pct)
+        wins = returns > 0
+
+        def trailing(weights):
+            # Sum over labels resolved in the last `window` bars, up to and including bar i
+            total = np.cumsum(np.bincount(resolved_at, weights=weights, minlength=n))
+            total[self.window:] = total[self.window:] - total[:-self.window].copy()
+            return total
+
+        n_win, n_loss = trailing(wins.astype("float64")), trailing((~wins).astype("float64"))
+        win_sum, loss_sum = trailing(np.where(wins, returns, 0.0)), trailing(np.where(wins, 0.0, -returns))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = n_win / (n_win + n_loss)
+            avg_win, avg_loss = win_sum / n_win, loss_sum / n_loss
+            kelly = p - (1 - p) / (avg_win / avg_loss)
+            exposure = np.maximum(self.fraction * kelly, 0.0)
+        ready = (n_win + n_loss >= self.min_trades) & (n_win > 0) & (n_loss > 0) & (avg_loss > 0)
+        leverage = _target_leverage(np.where(ready, exposure, np.nan), self.bet_risk, max_leverage)
+        return _arrays(np.full(n, self.bet_risk), leverage)
+
+
+SIZERS = {cls.name: cls for cls in (Legacy, FixedFraction, VolatilityTarget, Kelly)}
+
+
+def make_sizer(sizing, **params):
+    # A sizer object, or a SIZERS name built with its defaults (or params)
+    if isinstance(sizing, str):
+        if sizing not in SIZERS:
+            raise ValueError(f"Unknown sizing '{sizing}'. Available: {', '.join(SIZERS)}")
+        return SIZERS[sizing](**params)
+    return sizing
+
+
+def sizing_arrays(sizing, closes, signals, bars=None, stop_loss_pct=0.002, take_profit_pct=0.004,
+                  max_leverage=4):
+    # (bet_risk, leverage) per bar from a sizer, a SIZERS name, or arrays already built
+    if isinstance(sizing, tuple):
+        return _arrays(*sizing)
+    return make_sizer(sizing).arrays(closes, signals, bars, stop_loss_pct=stop_loss_pct,
+                                     take_profit_pct=take_profit_pct, max_leverage=max_leverage)
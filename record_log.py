@@ -0,0 +1,287 @@
+# record_log.py
+# Purpose: Append-only binary logs for equity and trade records. Simulators hand
+# records to a buffered writer, which flushes them to disk block by block. A run
+# therefore never holds its full equity curve or trade log, and never pays for one
+# big to_csv at the end. Readers memory-map the file. They can slice it, tail it,
+# or follow it while a run is still writing, so charts and reports can stream from
+# disk. An optional CSV mirror is appended in the same blocks for tools that
+# expect the old files.
+#
+# File layout: MAGIC, a 4-byte header length, a JSON header (record dtype, tz, kind)
+# padded to 64 bytes, then fixed-width little-endian records back to back.
+#
+# Usage:
+#   recorder = BacktestRecorder.for_prefix("outputs/SPY/SPY_advanced", csv=True)
+#   simulate_strategy_advanced(df, recorder=recorder)
+#   equity = RecordReader("outputs/SPY/SPY_advanced_equity_curve.rec").to_frame()
+#   python record_log.py outputs/SPY/SPY_advanced_equity_curve.rec --tail 5 [--follow]
+#   BacktestRecorder.for_prefix(..., equity_runs=True)   # equity change points only
+
+import argparse
+import json
+import struct
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ledger import RUNS_DTYPE, TRADE_DTYPE, EquityRuns, int64_to_datetime
+
+MAGIC = b"FTREC1\n"
+ALIGN = 64
+BLOCK_ROWS = 65536
+EQUITY_DTYPE = np.dtype([("timestamp", "<i8"), ("equity", "<f8")])
+EQUITY_KINDS = ("equity", "equity_runs")     # per-bar rows / ledger.EquityRuns change points
+
+
+def _tz_name(tz):
+    return None if tz is None else str(tz)
+
+
+def _records_frame(records, kind, tz, datetimes=True, running_max=None):
+    # Structured records -> DataFrame; equity logs gain cum_max/drawdown like EquityLedger
+    data = {}
+    for name in records.dtype.names:
+        column = records[name]
+        is_time = name == "timestamp" or name.endswith("_time")
+        data[name] = int64_to_datetime(column, tz) if datetimes and is_time else column
+    if kind in EQUITY_KINDS:
+        equity = records["equity"]
+        seed = [] if running_max is None else [running_max]
+        cum_max = np.maximum.accumulate(np.concatenate((seed, equity)))[len(seed):]
+        data["cum_max"] = cum_max
+        data["drawdown"] = equity / cum_max - 1
+    return pd.DataFrame(data, copy=False)
+
+
+# === Writer ===
+class RecordWriter:
+    # Buffers records and writes them in blocks of block_rows. The header goes out
+    # with the first flush, so tz may be set after construction.
+    def __init__(self, path, dtype, kind="records", tz=None, block_rows=BLOCK_ROWS, csv_path=None):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.kind = kind
+        self.tz = tz
+        self.csv_path = Path(csv_path) if csv_path else None
+        self.rows = 0
+        self._buf = np.empty(max(block_rows, 1), dtype=self.dtype)
+        self._n = 0
+        self._file = None
+        self._csv_max = None        # running peak carried across CSV blocks (equity)
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        header = json.dumps({"dtype": self.dtype.descr, "tz": _tz_name(self.tz), "kind": self.kind}).encode()
+        pad = -(len(MAGIC) + 4 + len(header)) % ALIGN
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC + struct.pack("<I", len(header) + pad) + header + b" " * pad)
+        if self.csv_path:
+            self._write_csv(np.empty(0, dtype=self.dtype), header=True)
+
+    def _write_csv(self, records, header=False):
+        frame = _records_frame(records, self.kind, self.tz, running_max=self._csv_max)
+        if self.kind in EQUITY_KINDS and len(records):
+            self._csv_max = frame["cum_max"].iloc[-1]
+        frame.to_csv(self.csv_path, mode="w" if header else "a", header=header, index=False)
+
+    def append(self, *values):
+        if self._n == len(self._buf):
+            self.flush()
+        self._buf[self._n] = values
+        self._n += 1
+
+    def extend(self, *columns):
+        # Column arrays in dtype field order; large batches bypass the buffer
+        k = len(columns[0])
+        if self._n + k > len(self._buf):
+            self.flush()
+        if k >= len(self._buf):
+            block = np.empty(k, dtype=self.dtype)
+            for name, column in zip(self.dtype.names, columns):
+                block[name] = column
+            self._write(block)
+            return
+        rows = slice(self._n, self._n + k)
+        for name, column in zip(self.dtype.names, columns):
+            self._buf[name][rows] = column
+        self._n += k
+
+    def write_records(self, records):
+        # Structured array with the same field names (e.g. TradeLedger.records)
+        self.extend(*(records[name] for name in self.dtype.names))
+
+    def _write(self, block):
+        if self._file is None:
+            self._open()
+        self._file.write(block.tobytes())
+        self._file.flush()          # readers tailing the file see whole blocks
+        if self.csv_path:
+            self._write_csv(block)
+        self.rows += len(block)
+
+    def flush(self):
+        if self._n or self._file is None:
+            self._write(self._buf[:self._n].copy() if self._n else self._buf[:0])
+            self._n = 0
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# === Reader ===
+class RecordReader:
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a record log")
+            (size,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(size))
+        self.dtype = np.dtype([tuple(field) for field in header["dtype"]])
+        self.tz = header["tz"]
+        self.kind = header["kind"]
+        self.offset = len(MAGIC) + 4 + size
+
+    def __len__(self):
+        # Whole records only; a block being written may be partially on disk
+        return max(self.path.stat().st_size - self.offset, 0) // self.dtype.itemsize
+
+    def read(self, start=0, stop=None):
+        n = len(self)
+        start, stop, _ = slice(start, stop).indices(n)
+        if stop <= start:
+            return np.empty(0, dtype=self.dtype)
+        mm = np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.offset, shape=(n,))
+        return np.array(mm[start:stop])
+
+    def tail(self, n):
+        return self.read(max(len(self) - n, 0))
+
+    def to_frame(self, start=0, stop=None, datetimes=True):
+        return _records_frame(self.read(start, stop), self.kind, self.tz, datetimes)
+
+    def iter_frames(self, block_rows=BLOCK_ROWS, datetimes=True, overlap=0):
+        # Block-sized frames; equity drawdown is measured against the peak so far.
+        # overlap repeats the previous block's last rows (1 keeps plotted lines joined).
+        running_max = None
+        for start in range(0, len(self), block_rows):
+            frame = _records_frame(self.read(max(start - overlap, 0), start + block_rows), self.kind,
+                                   self.tz, datetimes, running_max)
+            if self.kind in EQUITY_KINDS and len(frame):
+                running_max = frame["cum_max"].iloc[-1]
+            yield frame
+
+    def follow(self, start=0, poll=0.5, idle_timeout=None):
+        # Yields new record blocks as a writer flushes them; stops after idle_timeout
+        # seconds without growth (None: follow until interrupted)
+        position, idle = start, 0.0
+        while idle_timeout is None or idle < idle_timeout:
+            n = len(self)
+            if n > position:
+                yield self.read(position, n)
+                position, idle = n, 0.0
+            else:
+                time.sleep(poll)
+                idle += poll
+
+
+# === Simulator sink ===
+class BacktestRecorder:
+    # Equity and trade writers for one run. Simulators call open(tz), then
+    # write_equity / write_trades per block, then close(). With equity_runs=True the
+    # equity log holds only change points (ledger.EquityRuns rows: bar, timestamp,
+    # equity) plus the last bar, instead of one row per bar.
+    def __init__(self, equity_path, trades_path, csv=False, block_rows=BLOCK_ROWS, equity_runs=False):
+        self.equity_path = Path(equity_path)
+        self.trades_path = Path(trades_path)
+        self.csv = csv
+        self.block_rows = block_rows
+        self.equity_runs = equity_runs
+        self.equity = None
+        self.trades = None
+        self._runs = None
+
+    @classmethod
+    def for_prefix(cls, prefix, csv=False, block_rows=BLOCK_ROWS, equity_runs=False):
+        # <prefix>_equity_curve.rec / <prefix>_trade_log.rec, CSV mirrors beside them
+        return cls(f"{prefix}_equity_curve.rec", f"{prefix}_trade_log.rec", csv, block_rows, equity_runs)
+
+    def open(self, tz, trade_dtype=TRADE_DTYPE):
+        csv = (lambda p: p.with_suffix(".csv")) if self.csv else (lambda p: None)
+        if self.equity_runs:
+            self._runs = EquityRuns(tz=tz)
+            self.equity = RecordWriter(self.equity_path, RUNS_DTYPE, "equity_runs", tz, self.block_rows,
+                                       csv(self.equity_path))
+        else:
+            self.equity = RecordWriter(self.equity_path, EQUITY_DTYPE, "equity", tz, self.block_rows,
+                                       csv(self.equity_path))
+        self.trades = RecordWriter(self.trades_path, trade_dtype, "trades", tz, self.block_rows,
+                                   csv(self.trades_path))
+        return self
+
+    def write_equity(self, timestamps, equity):
+        if self._runs is None:
+            self.equity.extend(timestamps, equity)
+            return
+        self._runs.extend(timestamps, equity)
+        self._drain_runs()
+
+    def _drain_runs(self):
+        if len(self._runs):
+            self.equity.write_records(self._runs.records)
+            self._runs.clear()
+
+    def write_trades(self, ledger):
+        # Drains a TradeLedger; returns the number of trades written
+        n = len(ledger)
+        if n:
+            self.trades.write_records(ledger.records)
+            ledger.clear()
+        return n
+
+    def close(self):
+        if self._runs is not None and self.equity is not None:
+            self._runs.seal()
+            self._drain_runs()
+        for writer in (self.equity, self.trades):
+            if writer is not None:
+                writer.close()
+
+    def readers(self):
+        return RecordReader(self.trades_path), RecordReader(self.equity_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or tail a binary record log")
+    parser.add_argument("path")
+    parser.add_argument("--tail", type=int, default=10)
+    parser.add_argument("--follow", action="store_true", help="Keep printing records as they are written")
+    parser.add_argument("--csv", help="Convert the whole log to this CSV path")
+    args = parser.parse_args()
+
+    reader = RecordReader(args.path)
+    if args.csv:
+        reader.to_frame(0, 0).to_csv(args.csv, index=False)          # header only
+        for frame in reader.iter_frames():
+            frame.to_csv(args.csv, mode="a", header=False, index=False)
+        print(f"💾 {len(reader):,} {reader.kind} records → {args.csv}")
+    else:
+        print(f"📄 {args.path}: {len(reader):,} {reader.kind} records ({reader.dtype.itemsize} B each, tz {reader.tz})")
+        start = max(len(reader) - args.tail, 0)
+        print(reader.to_frame(start).to_string(index=False))
+        if args.follow:
+            try:
+                for block in reader.follow(len(reader)):
+                    print(_records_frame(block, reader.kind, reader.tz).to_string(index=False, header=False))
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,137 @@
+# rolling_analytics.py
+# Purpose: Vectorized O(n) rolling Sharpe, annualized volatility and drawdown over
+# equity curves, plus the chart helper used by generate_advanced_report.py.
+#
+# Rolling moments come from prefix sums; rolling max/min use the van Herk /
+# Gil-Werman block decomposition, the array form of the monotonic-deque algorithm
+# (three comparisons per element, independent of window length).
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from metrics import INTRADAY_PERIODS, FLAT_STD, equity_values, simple_returns
+
+DEFAULT_WINDOWS = (20, 78)   # ~100 minutes and one session of 5-minute bars
+
+
+# === Rolling primitives ===
+def rolling_max(x, window, min_periods=None):
+    x = np.asarray(x, dtype="float64")
+    n = len(x)
+    min_periods = window if min_periods is None else min_periods
+    if n == 0:
+        return x.copy()
+    w = min(window, n)
+
+    pad = (-n) % w
+    blocks = np.concatenate((x, np.full(pad, -np.inf))).reshape(-1, w)
+    prefix = np.maximum.accumulate(blocks, axis=1).ravel()[:n]
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()[:n]
+
+    out = np.empty(n)
+    # Windows that fit inside the series: max of the suffix of the first block and
+    # the prefix of the last block they touch
+    out[w - 1:] = np.maximum(suffix[:n - w + 1], prefix[w - 1:])
+    out[:w - 1] = np.maximum.accumulate(x[:w - 1])
+    if window > n:
+        out[:] = np.maximum.accumulate(x)
+    if min_periods > 1:
+        out[:min(min_periods - 1, n)] = np.nan
+    return out
+
+
+def rolling_min(x, window, min_periods=None):
+    return -rolling_max(-np.asarray(x, dtype="float64"), window, min_periods)
+
+
+def rolling_sum(x, window):
+    x = np.asarray(x, dtype="float64")
+    csum = np.concatenate(([0.0], np.cumsum(x)))
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        out[window - 1:] = csum[window:] - csum[:-window]
+    return out
+
+
+def rolling_mean_std(x, window, ddof=1):
+    x = np.asarray(x, dtype="float64")
+    # Centre on the global mean so the prefix sums of squares do not cancel badly
+    centred = x - (x.mean() if len(x) else 0.0)
+    s1 = rolling_sum(centred, window)
+    s2 = rolling_sum(centred * centred, window)
+    mean = s1 / window
+    var = np.maximum(s2 - s1 * mean, 0.0) / (window - ddof)
+    return mean + (x.mean() if len(x) else 0.0), np.sqrt(var)
+
+
+# === Equity-curve analytics ===
+def rolling_volatility(returns, window, periods_per_year=INTRADAY_PERIODS):
+    _, std = rolling_mean_std(returns, window)
+    return std * np.sqrt(periods_per_year)
+
+
+def rolling_sharpe(returns, window, periods_per_year=INTRADAY_PERIODS, risk_free_rate=0.0):
+    mean, std = rolling_mean_std(np.asarray(returns) - risk_free_rate, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(std > FLAT_STD, mean / std, 0.0) * np.sqrt(periods_per_year)
+    sharpe[np.isnan(mean)] = np.nan
+    return sharpe
+
+
+def rolling_drawdown(equity, window):
+    # Drawdown from the highest equity of the trailing `window` bars
+    e = equity_values(equity)
+    return e / rolling_max(e, window, min_periods=1) - 1
+
+
+def rolling_max_drawdown(equity, window):
+    # Worst trailing-peak drawdown seen within each window
+    return rolling_min(rolling_drawdown(equity, window), window, min_periods=1)
+
+
+def rolling_analytics(equity_df, windows=DEFAULT_WINDOWS, periods_per_year=INTRADAY_PERIODS):
+    e = equity_values(equity_df)
+    returns = simple_returns(e, fill_first=True)
+    out = {}
+    for w in windows:
+        out[f"sharpe_{w}"] = rolling_sharpe(returns, w, periods_per_year)
+        out[f"volatility_{w}"] = rolling_volatility(returns, w, periods_per_year)
+        out[f"max_drawdown_{w}"] = rolling_max_drawdown(e, w)
+    index = equity_df["timestamp"] if isinstance(equity_df, pd.DataFrame) and "timestamp" in equity_df else None
+    frame = pd.DataFrame(out)
+    if index is not None:
+        frame.index = pd.Index(index)
+    return frame
+
+
+# === Charts ===
+def plot_rolling_charts(equity_df, symbol, outdir, windows=DEFAULT_WINDOWS,
+                        periods_per_year=INTRADAY_PERIODS, prefix="advanced"):
+    outdir = Path(outdir)
+    frame = rolling_analytics(equity_df, windows, periods_per_year)
+    charts = []
+    panels = [
+        ("sharpe", "Rolling Sharpe Ratio", "Sharpe"),
+        ("volatility", "Rolling Annualized Volatility", "Volatility"),
+        ("max_drawdown", "Rolling Max Drawdown", "Drawdown"),
+    ]
+    for key, title, ylabel in panels:
+        plt.figure(figsize=(12, 4))
+        for w in windows:
+            plt.plot(frame.index, frame[f"{key}_{w}"], label=f"{w} bars", linewidth=1.2)
+        if key == "max_drawdown":
+            plt.fill_between(frame.index, frame[f"{key}_{windows[-1]}"], 0, color="red", alpha=0.15)
+        plt.title(f"{symbol} {title}")
+        plt.xlabel("Time")
+        plt.ylabel(ylabel)
+        plt.grid(True)
+        plt.legend()
+        plt.tight_layout()
+        path = outdir / f"{symbol}_{prefix}_rolling_{key}.png"
+        plt.savefig(path)
+        plt.close()
+        charts.append(path)
+    return charts
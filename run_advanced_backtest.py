@@ -3,6 +3,8 @@
 import pandas as pd
 from advanced_backtest import simulate_strategy_advanced
 from strategy_engine import apply_indicators
+from bar_loader import load_bars
+from record_log import BacktestRecorder
 
 # === Test configuration ===
 config = {
@@ -17,29 +19,28 @@ config = {
 symbol = config["symbol"]
 
 # === Load price data ===
-df = pd.read_csv(f"{symbol}_5Min_strategy_2d.csv", parse_dates=['timestamp'], index_col='timestamp')
+df = load_bars(f"{symbol}_5Min_strategy_2d.csv")
 df = apply_indicators(df, strategy=config["strategy"])
 
-# === Simulate strategy ===
-trades, equity = simulate_strategy_advanced(
+# === Simulate strategy (records stream to disk as .rec logs plus CSV copies) ===
+recorder = BacktestRecorder.for_prefix(f"{symbol}_advanced", csv=True)
+simulate_strategy_advanced(
     df,
     strategy=config["strategy"],
     initial_capital=config["capital"],
     stop_loss_pct=config["stop_loss_pct"],
     take_profit_pct=config["take_profit_pct"],
-    max_leverage=config["max_leverage"]
+    max_leverage=config["max_leverage"],
+    recorder=recorder
 )
-
-# === Save outputs ===
-trades.to_csv(f"{symbol}_advanced_trade_log.csv", index=False)
-equity.to_csv(f"{symbol}_advanced_equity_curve.csv", index=False)
+trade_log, equity_log = recorder.readers()
 
 print("\n📊 Sample Trades:")
-print(trades.head())
+print(trade_log.to_frame(0, 5))
 
 print("\n📈 Final Equity:")
-print(equity.tail(1))
+print(equity_log.to_frame(-1)[["timestamp", "equity"]])
 
 print("\n💾 Exported:")
-print(f" - {symbol}_advanced_trade_log.csv")
-print(f" - {symbol}_advanced_equity_curve.csv")
+for path in (recorder.trades_path, recorder.equity_path):
+    print(f" - {path} (+ {path.with_suffix('.csv').name})")
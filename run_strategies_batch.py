@@ -5,7 +5,11 @@ import json
 import pandas as pd
 from pathlib import Path
 from strategy_engine import apply_indicators
+from bar_loader import load_bars
 from advanced_backtest import simulate_strategy_advanced
+from instrumentation import StageTimer, export_json
+from online_metrics import RunningMetrics
+from record_log import BacktestRecorder
 import matplotlib.pyplot as plt
 from weasyprint import HTML
 
@@ -13,75 +17,96 @@ CONFIG_DIR = Path("configs")
 OUTPUT_DIR = Path("outputs")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-def process_strategy(config_path):
+def process_strategy(config_path, timer=None):
     with open(config_path) as f:
         config = json.load(f)
 
     symbol = config["symbol"]
     print(f"\n➡️ Running strategy for {symbol}")
+    timer = timer or StageTimer(f"{symbol}_{config['strategy']}")
 
     # Load data
     data_file = f"{symbol}_5Min_strategy_2d.csv"
-    df = pd.read_csv(data_file, parse_dates=['timestamp'], index_col='timestamp')
+    with timer.stage("load"):
+        df = load_bars(data_file)
 
     # Apply indicators
-    df = apply_indicators(df, strategy=config['strategy'], **config.get("indicators", {}))
-
-    # Backtest
-    trades, equity = simulate_strategy_advanced(
-        df,
-        strategy=config['strategy'],
-        initial_capital=config['capital'],
-        stop_loss_pct=config['stop_loss_pct'],
-        take_profit_pct=config['take_profit_pct'],
-        max_leverage=config['max_leverage']
-    )
+    with timer.stage("indicators"):
+        df = apply_indicators(df, strategy=config['strategy'], **config.get("indicators", {}))
 
     # Output paths
     symbol_dir = OUTPUT_DIR / symbol
     symbol_dir.mkdir(exist_ok=True)
 
-    # Save data
-    trades.to_csv(symbol_dir / f"{symbol}_advanced_trade_log.csv", index=False)
-    equity.to_csv(symbol_dir / f"{symbol}_advanced_equity_curve.csv", index=False)
-
-    # Chart 1 – Equity Curve
-    plt.figure(figsize=(12, 6))
-    plt.plot(equity['timestamp'], equity['equity'], label='Equity')
-    plt.title(f"{symbol} Equity Curve")
-    plt.grid(True)
-    plt.tight_layout()
-    equity_chart = symbol_dir / f"{symbol}_equity_chart.png"
-    plt.savefig(equity_chart)
-    plt.close()
-
-    # Chart 2 – Drawdown
-    plt.figure(figsize=(12, 4))
-    plt.plot(equity['timestamp'], equity['drawdown'], label='Drawdown', color='red')
-    plt.fill_between(equity['timestamp'], equity['drawdown'], 0, color='red', alpha=0.3)
-    plt.title(f"{symbol} Drawdown Curve")
-    plt.tight_layout()
-    dd_chart = symbol_dir / f"{symbol}_drawdown_chart.png"
-    plt.savefig(dd_chart)
-    plt.close()
-
-    # Chart 3 – PnL Histogram
-    plt.figure(figsize=(8, 5))
-    trades['pnl'].hist(bins=20, edgecolor='black')
-    plt.title(f"{symbol} PnL Distribution")
-    plt.tight_layout()
-    pnl_chart = symbol_dir / f"{symbol}_pnl_histogram.png"
-    plt.savefig(pnl_chart)
-    plt.close()
+    # Backtest: trade and equity records stream to binary logs (plus the CSV files
+    # the report scripts read) while the run progresses. "equity_runs": true in the
+    # config keeps only the bars where equity changes (bar, timestamp, equity rows).
+    recorder = BacktestRecorder.for_prefix(symbol_dir / f"{symbol}_advanced", csv=True,
+                                           equity_runs=config.get("equity_runs", False))
+    acc = RunningMetrics()
+    with timer.stage("simulate"):
+        simulate_strategy_advanced(
+            df,
+            strategy=config['strategy'],
+            initial_capital=config['capital'],
+            stop_loss_pct=config['stop_loss_pct'],
+            take_profit_pct=config['take_profit_pct'],
+            max_leverage=config['max_leverage'],
+            metrics=acc,
+            recorder=recorder,
+            **config.get("indicators", {})
+        )
+    trade_log, equity_log = recorder.readers()
+    trades = trade_log.to_frame()
+
+    with timer.stage("chart"):
+        # Charts 1 and 2 are drawn block by block from the equity log; change-point
+        # logs are drawn as post steps (equity holds its value until the next row)
+        step = "post" if equity_log.kind == "equity_runs" else None
+        drawstyle = "steps-post" if step else "default"
+        equity_fig = plt.figure(figsize=(12, 6))
+        dd_fig = plt.figure(figsize=(12, 4))
+        for equity in equity_log.iter_frames(overlap=1):
+            equity_fig.gca().plot(equity['timestamp'], equity['equity'], color='C0', drawstyle=drawstyle)
+            dd_fig.gca().plot(equity['timestamp'], equity['drawdown'], color='red', drawstyle=drawstyle)
+            dd_fig.gca().fill_between(equity['timestamp'], equity['drawdown'], 0, color='red', alpha=0.3,
+                                      step=step)
+
+        # Chart 1 – Equity Curve
+        plt.figure(equity_fig.number)
+        plt.title(f"{symbol} Equity Curve")
+        plt.grid(True)
+        plt.tight_layout()
+        equity_chart = symbol_dir / f"{symbol}_equity_chart.png"
+        plt.savefig(equity_chart)
+        plt.close()
+
+        # Chart 2 – Drawdown
+        plt.figure(dd_fig.number)
+        plt.title(f"{symbol} Drawdown Curve")
+        plt.tight_layout()
+        dd_chart = symbol_dir / f"{symbol}_drawdown_chart.png"
+        plt.savefig(dd_chart)
+        plt.close()
+
+        # Chart 3 – PnL Histogram
+        plt.figure(figsize=(8, 5))
+        trades['pnl'].hist(bins=20, edgecolor='black')
+        plt.title(f"{symbol} PnL Distribution")
+        plt.tight_layout()
+        pnl_chart = symbol_dir / f"{symbol}_pnl_histogram.png"
+        plt.savefig(pnl_chart)
+        plt.close()
 
     # HTML Summary Report
-    win_trades = trades[trades['pnl'] > 0]
-    win_rate = (len(win_trades) / len(trades)) * 100 if len(trades) else 0
-    avg_pnl = trades['pnl'].mean()
-    max_drawdown = equity['drawdown'].min() * 100
-    final_equity = equity.iloc[-1]['equity']
-
-    html = f"""
+    metrics = acc.summary()
+    win_rate = metrics['win_rate'] * 100
+    avg_pnl = metrics['avg_pnl']
+    max_drawdown = metrics['max_drawdown'] * 100
+    final_equity = metrics['final_equity']
+
+    def render_html():
+        return f"""
     <html>
     <head><meta charset='UTF-8'><title>{symbol} Report</title></head>
     <body>
@@ -103,22 +128,32 @@ def process_strategy(config_path):
     <img src="{equity_chart.name}">
     <img src="{dd_chart.name}">
     <img src="{pnl_chart.name}">
+    {timer.to_html_table()}
     </body>
     </html>
     """
 
     html_path = symbol_dir / f"{symbol}_report.html"
     pdf_path = symbol_dir / f"{symbol}_report.pdf"
+    with timer.stage("html"):
+        with open(html_path, "w") as f:
+            f.write(render_html())
+    with timer.stage("pdf"):
+        HTML(str(html_path)).write_pdf(str(pdf_path))
+    # Re-render so the HTML report also carries the PDF stage timing
     with open(html_path, "w") as f:
-        f.write(html)
-    HTML(str(html_path)).write_pdf(str(pdf_path))
+        f.write(render_html())
 
+    timer.print_summary()
     print(f"✅ Report complete for {symbol}: {pdf_path.name}")
+    return timer
 
 # === MAIN ===
 def main():
+    timers = []
     for file in CONFIG_DIR.glob("*.json"):
-        process_strategy(file)
+        timers.append(process_strategy(file))
+    export_json(timers, OUTPUT_DIR / "timings.json")
 
 if __name__ == "__main__":
     main()
@@ -1,42 +1,243 @@
 # strategy_engine.py
+# Purpose: Strategy registry and vectorized signal kernels. Each strategy declares
+# the input columns it reads, its warm-up length and a kernel that returns an int8
+# signal array plus its indicator columns. Kernels pull derived series (SMA, EMA,
+# rolling std, RSI) from a shared KernelContext, so strategies or parameter combos
+# that need the same series compute it once.
+#
+# Adding a strategy:
+#   @register_strategy("my_strategy", inputs=("close",), warmup=lambda p: p["n"] - 1, n=20)
+#   def my_strategy(ctx, n):
+#       line = ctx.sma("close", n)
+#       return signal_array(ctx.input("close") > line, ctx.input("close") < line), {"line": line}
 
+import numpy as np
 import pandas as pd
 
+# Wilder/RSI/ATR kernels, re-exported so strategy code has one import point
+from indicators import (WilderATR, WilderRSI, WilderSmoother, atr, atr_batch, gains_losses,
+                        rsi, rsi_batch, rsi_from_averages, true_range, wilder_smooth,
+                        wilder_smooth_batch)
 
-def apply_indicators(df, strategy="sma_ema", **kwargs):
-    df = df.copy()
-    df['signal'] = 0
-
-    if strategy == "sma_ema":
-        sma = kwargs.get("sma", 20)
-        ema = kwargs.get("ema", 20)
-        df['sma'] = df['close'].rolling(window=sma).mean()
-        df['ema'] = df['close'].ewm(span=ema, adjust=False).mean()
-        df.loc[df['ema'] > df['sma'], 'signal'] = 1
-        df.loc[df['ema'] < df['sma'], 'signal'] = -1
-
-    elif strategy == "macd":
-        fast = kwargs.get("fast", 12)
-        slow = kwargs.get("slow", 26)
-        signal = kwargs.get("signal", 9)
-        df['ema_fast'] = df['close'].ewm(span=fast, adjust=False).mean()
-        df['ema_slow'] = df['close'].ewm(span=slow, adjust=False).mean()
-        df['macd'] = df['ema_fast'] - df['ema_slow']
-        df['macd_signal'] = df['macd'].ewm(span=signal, adjust=False).mean()
-        df.loc[df['macd'] > df['macd_signal'], 'signal'] = 1
-        df.loc[df['macd'] < df['macd_signal'], 'signal'] = -1
-
-    elif strategy == "bollinger":
-        period = kwargs.get("sma", 20)
-        stddev = kwargs.get("stddev", 2)
-        df['sma'] = df['close'].rolling(window=period).mean()
-        df['std'] = df['close'].rolling(window=period).std()
-        df['upper'] = df['sma'] + stddev * df['std']
-        df['lower'] = df['sma'] - stddev * df['std']
-        df.loc[df['close'] < df['lower'], 'signal'] = 1
-        df.loc[df['close'] > df['upper'], 'signal'] = -1
-
-    else:
-        raise ValueError(f"Strategy '{strategy}' not recognized.")
-
-    return df.dropna()
+REGISTRY = {}
+
+
+class StrategySpec:
+    def __init__(self, name, kernel, inputs, warmup, defaults):
+        self.name = name
+        self.kernel = kernel
+        self.inputs = tuple(inputs)
+        self.warmup = warmup        # callable: resolved params -> bars of history needed
+        self.defaults = defaults
+
+    def resolve(self, params):
+        # Unknown keys are ignored, as the old if/elif chain did with **kwargs
+        resolved = dict(self.defaults)
+        resolved.update({k: v for k, v in params.items() if k in self.defaults})
+        return resolved
+
+
+def register_strategy(name, inputs=("close",), warmup=lambda params: 0, **defaults):
+    def decorator(kernel):
+        REGISTRY[name] = StrategySpec(name, kernel, inputs, warmup, defaults)
+        return kernel
+    return decorator
+
+
+def get_strategy(name):
+    if isinstance(name, StrategySpec):
+        return name
+    if name not in REGISTRY:
+        raise ValueError(f"Strategy '{name}' not recognized.")
+    return REGISTRY[name]
+
+
+def signal_array(long_mask, short_mask):
+    # Same precedence as the original .loc assignments: short overrides long
+    signal = np.zeros(len(long_mask), dtype="int8")
+    signal[long_mask] = 1
+    signal[short_mask] = -1
+    return signal
+
+
+# === Kernel context ===
+def _frame_float(df):
+    # Prices set the width; compact frames keep volume in float64
+    return np.dtype("float32") if "close" in df and df["close"].dtype == np.float32 else np.dtype("float64")
+
+
+class KernelContext:
+    # Input arrays and derived series for one frame, memoized by (kind, source, params).
+    # Streaming mode (chunked_backtest): `tail` holds the previous block's last bars,
+    # which are prepended to every input; `state` carries exponential series across
+    # blocks; `start` is the global bar number of the first array element; `keep` is
+    # how many trailing values the next block will need. `dtype` is the float width of
+    # inputs and stored series; by default it follows the frame, so compact (float32)
+    # bars from bar_loader keep every derived series in float32.
+    def __init__(self, df, tail=None, state=None, start=0, keep=0, dtype=None):
+        self.df = df
+        self.dtype = np.dtype(dtype) if dtype is not None else _frame_float(df)
+        self.tail = tail or {}
+        self.skip = len(next(iter(self.tail.values()))) if self.tail else 0
+        self.state = state
+        self.start = start
+        self.keep = keep
+        self._cache = {}
+        self._row_valid = None
+
+    def _memo(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def input(self, name):
+        def load():
+            values = self.df[name].to_numpy(dtype=self.dtype)
+            if self.skip:
+                values = np.concatenate((self.tail[name], values))
+            return values
+        return self._memo(("input", name), load)
+
+    def row_valid(self):
+        # Rows with no missing input values (the old whole-frame dropna)
+        if self._row_valid is None:
+            valid = np.ones(len(self.df), dtype=bool)
+            for column in self.df.columns:
+                series = self.df[column]
+                if series.hasnans:
+                    valid &= series.notna().to_numpy()
+            self._row_valid = valid
+        return self._row_valid
+
+    def global_index(self):
+        return self._memo(("index",), lambda: self.start + np.arange(self.skip + len(self.df)))
+
+    # === Rolling series ===
+    # pandas computes windows and recursions in float64; results are stored at ctx.dtype
+    def sma(self, src, n):
+        return self._memo(("sma", src, n), lambda: pd.Series(self.input(src)).rolling(window=n).mean()
+                          .to_numpy(dtype=self.dtype))
+
+    def rolling_std(self, src, n):
+        return self._memo(("std", src, n), lambda: pd.Series(self.input(src)).rolling(window=n).std()
+                          .to_numpy(dtype=self.dtype))
+
+    # === Exponential series ===
+    def ewm(self, key, values, **decay):
+        # ewm(adjust=False) is a first-order recursion: in streaming mode the block
+        # resumes from the previous block's last value and the tail reuses its outputs
+        def compute():
+            prev = self.state.get(key) if self.state is not None else None
+            if prev is None:
+                out = pd.Series(values).ewm(adjust=False, **decay).mean().to_numpy(dtype=self.dtype)
+            else:
+                seeded = np.concatenate((prev[-1:], values[self.skip:]))
+                resumed = pd.Series(seeded).ewm(adjust=False, **decay).mean().to_numpy(dtype=self.dtype)[1:]
+                out = np.concatenate((prev[len(prev) - self.skip:], resumed))
+            if self.state is not None and len(out):
+                self.state[key] = out[-max(self.keep, 1):]
+            return out
+        return self._memo(("ewm", key), compute)
+
+    def ema(self, src, span, values=None):
+        values = self.input(src) if values is None else values
+        return self.ewm(("ema", src, span), values, span=span)
+
+    # === Wilder series (same math as indicators.rsi / indicators.atr) ===
+    def wilder(self, key, values, n):
+        return self.ewm(("wilder", key, n), values, alpha=1 / n)
+
+    def rsi(self, src, n):
+        # Gains/losses are differenced once per source and shared by every period;
+        # the first n bars are warm-up and left as NaN
+        def compute():
+            gain, loss = self._memo(("gains", src), lambda: gains_losses(self.input(src)))
+            out = rsi_from_averages(self.wilder(f"gain_{src}", gain, n), self.wilder(f"loss_{src}", loss, n))
+            out[self.global_index() < n] = np.nan
+            return out
+        return self._memo(("rsi", src, n), compute)
+
+    def atr(self, n):
+        # Needs high/low/close inputs; the first n - 1 bars are warm-up
+        def compute():
+            tr = self._memo(("tr",), lambda: true_range(self.input("high"), self.input("low"), self.input("close")))
+            out = self.wilder("tr", tr, n)
+            return np.where(self.global_index() < n - 1, np.nan, out)
+        return self._memo(("atr", n), compute)
+
+
+# === Registered strategies ===
+@register_strategy("sma_ema", warmup=lambda p: p["sma"] - 1, sma=20, ema=20)
+def sma_ema_kernel(ctx, sma, ema):
+    sma_line = ctx.sma("close", sma)
+    ema_line = ctx.ema("close", ema)
+    return signal_array(ema_line > sma_line, ema_line < sma_line), {"sma": sma_line, "ema": ema_line}
+
+
+@register_strategy("macd", fast=12, slow=26, signal=9)
+def macd_kernel(ctx, fast, slow, signal):
+    ema_fast = ctx.ema("close", fast)
+    ema_slow = ctx.ema("close", slow)
+    macd = ema_fast - ema_slow
+    macd_signal = ctx.ema(f"macd_{fast}_{slow}", signal, values=macd)
+    columns = {"ema_fast": ema_fast, "ema_slow": ema_slow, "macd": macd, "macd_signal": macd_signal}
+    return signal_array(macd > macd_signal, macd < macd_signal), columns
+
+
+def _bands(ctx, period, stddev):
+    sma = ctx.sma("close", period)
+    std = ctx.rolling_std("close", period)
+    return {"sma": sma, "std": std, "upper": sma + stddev * std, "lower": sma - stddev * std}
+
+
+@register_strategy("bollinger", warmup=lambda p: p["sma"] - 1, sma=20, stddev=2)
+def bollinger_kernel(ctx, sma, stddev):
+    # Mean reversion: buy below the lower band, sell above the upper band
+    bands = _bands(ctx, sma, stddev)
+    close = ctx.input("close")
+    return signal_array(close < bands["lower"], close > bands["upper"]), bands
+
+
+@register_strategy("bollinger_breakout", warmup=lambda p: p["bb"] - 1, bb=20, stddev=2)
+def bollinger_breakout_kernel(ctx, bb, stddev):
+    # Momentum: buy a close above the upper band, sell a close below the lower band
+    bands = _bands(ctx, bb, stddev)
+    close = ctx.input("close")
+    return signal_array(close > bands["upper"], close < bands["lower"]), bands
+
+
+@register_strategy("rsi_sma_combo", warmup=lambda p: max(p["sma"] - 1, p["rsi"]),
+                   sma=14, rsi=14, overbought=70, oversold=30)
+def rsi_sma_combo_kernel(ctx, sma, rsi, overbought, oversold):
+    # Long in an uptrend that is not overbought; short in a downtrend that is not oversold
+    close = ctx.input("close")
+    sma_line = ctx.sma("close", sma)
+    rsi_line = ctx.rsi("close", rsi)
+    long_mask = (close > sma_line) & (rsi_line < overbought)
+    short_mask = (close < sma_line) & (rsi_line > oversold)
+    return signal_array(long_mask, short_mask), {"sma": sma_line, "rsi": rsi_line}
+
+
+# === Engine ===
+def compute_signals(ctx, strategy, params=None):
+    # Signal and validity mask for ctx.df's rows, without building a frame
+    spec = get_strategy(strategy)
+    signal, columns = spec.kernel(ctx, **spec.resolve(params or {}))
+    skip = ctx.skip
+    valid = ctx.row_valid().copy()
+    for values in columns.values():
+        valid &= ~np.isnan(values[skip:])
+    return signal[skip:], valid, {name: values[skip:] for name, values in columns.items()}
+
+
+def apply_indicators(df, strategy="sma_ema", ctx=None, **kwargs):
+    # Returns the valid rows of df with 'signal' (int8) and the indicator columns.
+    # Only the surviving rows are copied; pass a shared ctx to reuse derived series.
+    ctx = ctx or KernelContext(df)
+    signal, valid, columns = compute_signals(ctx, strategy, kwargs)
+    rows = np.flatnonzero(valid)
+    out = df.take(rows)
+    out['signal'] = signal[rows]
+    for name, values in columns.items():
+        out[name] = values[rows]
+    return out
@@ -0,0 +1,186 @@
+# successive_halving.py
+# Purpose: Successive-halving search over indicator windows and risk parameters.
+# Every candidate is backtested on a short prefix of the history; the best 1/eta
+# survive and are extended to an eta-times longer horizon, until the survivors run
+# on the full history. Survivors resume from their saved simulator state rather than
+# restarting, and runs whose drawdown passes the kill threshold stop early.
+#
+# Usage:
+#   python successive_halving.py UPRO_5Min_strategy_2d.csv --strategy sma_ema --kill-drawdown 0.02
+#   python successive_halving.py --synthetic 100000 --compare-grid
+
+import argparse
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from advanced_backtest import AdvancedBacktestState
+from bar_loader import load_bars
+from online_metrics import RunningMetrics
+from position_sizing import sizing_arrays
+from walk_forward import PARAM_GRIDS, RISK_PARAMS, expand_grid, precompute_signals, window_arrays, window_bars
+
+RISK_GRID = {
+    "stop_loss_pct": [0.001, 0.002, 0.003, 0.005],
+    "take_profit_pct": [0.002, 0.004, 0.006, 0.01],
+    "max_leverage": [1, 2, 3, 4],
+}
+
+
+# === Candidate runs ===
+class Candidate:
+    # One parameter combination with a resumable simulator and its running metrics
+    def __init__(self, k, combo, sim_params, tz, kill_drawdown):
+        params = dict(sim_params)
+        params.update({name: combo[name] for name in RISK_PARAMS if name in combo})
+        self.sizing = params.pop("sizing", None)
+        self.k = k
+        self.combo = combo
+        self.metrics = RunningMetrics()
+        self.state = AdvancedBacktestState(tz=tz, metrics=self.metrics, verbose=False,
+                                           kill_drawdown=kill_drawdown, **params)
+        self.horizon = 0
+
+    def advance(self, precomputed, horizon):
+        # Feeds bars [self.horizon, horizon); returns how many were simulated
+        if self.state.killed or horizon <= self.horizon:
+            return 0
+        timestamps, closes, signals = window_arrays(precomputed, self.k, self.horizon, horizon)
+        if self.sizing is not None:
+            # Sizers only look back, so sizing the prefix up to this horizon gives the
+            # same arrays a full-history pass would; only the new bars are kept
+            _, prefix_closes, prefix_signals = window_arrays(precomputed, self.k, 0, horizon)
+            state = self.state
+            bet_risk, leverage = sizing_arrays(self.sizing, prefix_closes, prefix_signals,
+                                               window_bars(precomputed, self.k, 0, horizon),
+                                               state.stop_loss_pct, state.take_profit_pct, state.max_leverage)
+            first = state.bar_index
+            state.size_with(bet_risk[first:], leverage[first:], first)
+        self.horizon = horizon
+        return self.state.run(timestamps, closes, signals)
+
+    def score(self, objective):
+        if self.state.killed:
+            return -math.inf
+        value = self.metrics.summary()[objective]
+        return value if np.isfinite(value) else -math.inf
+
+
+def make_horizons(n_bars, min_bars, eta):
+    # Geometric horizons ending exactly at the full history
+    rungs = max(0, int(math.log(n_bars / min_bars, eta) + 1e-9)) if min_bars < n_bars else 0
+    return [round(n_bars / eta ** j) for j in range(rungs, -1, -1)]
+
+
+def successive_halving(df, strategy="sma_ema", grid=None, eta=3, rungs=4, min_bars=None,
+                       objective="sharpe", kill_drawdown=None, initial_capital=100000,
+                       stop_loss_pct=0.002, take_profit_pct=0.004, max_leverage=4):
+    grid = grid or {**PARAM_GRIDS[strategy], **RISK_GRID}
+    combos = expand_grid(grid)
+    n_bars = len(df)
+    # `rungs` halvings before the full horizon unless min_bars pins the first prefix
+    min_bars = min_bars or max(50, n_bars // eta ** rungs)
+    horizons = make_horizons(n_bars, min_bars, eta)
+    sim_params = {"initial_capital": initial_capital, "stop_loss_pct": stop_loss_pct,
+                  "take_profit_pct": take_profit_pct, "max_leverage": max_leverage}
+
+    precomputed = precompute_signals(df, strategy, combos)
+    alive = [Candidate(k, combo, sim_params, precomputed["tz"], kill_drawdown)
+             for k, combo in enumerate(combos)]
+    print(f"✂️ Successive halving: {len(combos)} candidates, eta={eta}, horizons={horizons}")
+
+    rows, bar_evals = [], 0
+    for rung, horizon in enumerate(horizons):
+        bar_evals += sum(c.advance(precomputed, horizon) for c in alive)
+        alive.sort(key=lambda c: c.score(objective), reverse=True)
+        killed = sum(c.state.killed for c in alive)
+        keep = len(alive) if rung == len(horizons) - 1 else max(1, len(alive) // eta)
+        keep = max(1, min(keep, len(alive) - killed))   # killed runs never advance
+        rows.append({
+            "rung": rung,
+            "horizon_bars": horizon,
+            "candidates": len(alive),
+            "killed": killed,
+            "kept": keep,
+            "best_score": alive[0].score(objective),
+            "best_params": alive[0].combo,
+            "bar_evaluations": bar_evals,
+        })
+        alive = alive[:keep]
+
+    best = alive[0]
+    return {
+        "best_params": best.combo,
+        "best_score": best.score(objective),
+        "best_metrics": best.metrics.summary(),
+        "rungs": pd.DataFrame(rows),
+        "bar_evaluations": bar_evals,
+        "grid_bar_evaluations": int(sum(mask.sum() for mask in precomputed["masks"])),
+    }
+
+
+def grid_search(df, strategy="sma_ema", grid=None, objective="sharpe", kill_drawdown=None,
+                initial_capital=100000, stop_loss_pct=0.002, take_profit_pct=0.004, max_leverage=4):
+    # Exhaustive baseline: every candidate on the full history
+    grid = grid or {**PARAM_GRIDS[strategy], **RISK_GRID}
+    combos = expand_grid(grid)
+    sim_params = {"initial_capital": initial_capital, "stop_loss_pct": stop_loss_pct,
+                  "take_profit_pct": take_profit_pct, "max_leverage": max_leverage}
+    precomputed = precompute_signals(df, strategy, combos)
+    candidates = [Candidate(k, combo, sim_params, precomputed["tz"], kill_drawdown)
+                  for k, combo in enumerate(combos)]
+    bar_evals = sum(c.advance(precomputed, len(df)) for c in candidates)
+    scores = np.array([c.score(objective) for c in candidates])
+    order = np.argsort(-scores, kind="stable")
+    best = candidates[order[0]]
+    return {"best_params": best.combo, "best_score": best.score(objective),
+            "scores": scores, "rank_of": {k: r for r, k in enumerate(order)},
+            "bar_evaluations": bar_evals}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive-halving parameter search")
+    parser.add_argument("csv", nargs="?", help="Bar history CSV with timestamp and close columns")
+    parser.add_argument("--synthetic", type=int, help="Use N synthetic minute bars instead of a CSV")
+    parser.add_argument("--strategy", default="sma_ema", choices=sorted(PARAM_GRIDS))
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--rungs", type=int, default=4, help="Number of halvings before the full horizon")
+    parser.add_argument("--min-bars", type=int)
+    parser.add_argument("--objective", default="sharpe")
+    parser.add_argument("--compact", action="store_true", help="Load float32 bars projected to the strategy inputs")
+    parser.add_argument("--kill-drawdown", type=float, help="Stop a run once it is this far below its peak (e.g. 0.05)")
+    parser.add_argument("--compare-grid", action="store_true", help="Also run the exhaustive grid for comparison")
+    parser.add_argument("--sizing", nargs="+", help="Also search over these position_sizing sizers (e.g. legacy kelly)")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from benchmark_suite import make_synthetic_bars
+        bars, label = make_synthetic_bars(args.synthetic), f"synthetic {args.synthetic:,} bars"
+    elif args.csv:
+        bars = load_bars(args.csv, strategies=[args.strategy] if args.compact else None, compact=args.compact)
+        label = Path(args.csv).name
+    else:
+        parser.error("pass a CSV path or --synthetic N")
+
+    search_grid = {**PARAM_GRIDS[args.strategy], **RISK_GRID}
+    if args.sizing:
+        search_grid["sizing"] = args.sizing
+    result = successive_halving(bars, args.strategy, grid=search_grid, eta=args.eta, rungs=args.rungs, min_bars=args.min_bars,
+                                objective=args.objective, kill_drawdown=args.kill_drawdown)
+    print(f"\n📊 Rungs ({label}):")
+    print(result["rungs"].to_string(index=False))
+    print(f"\n🏆 Best: {result['best_params']} → {args.objective} {result['best_score']:.4f}")
+    print(f"⚡ Bar evaluations: {result['bar_evaluations']:,} "
+          f"(full grid {result['grid_bar_evaluations']:,}, "
+          f"{result['grid_bar_evaluations'] / max(result['bar_evaluations'], 1):.1f}x fewer)")
+
+    if args.compare_grid:
+        grid = grid_search(bars, args.strategy, grid=search_grid, objective=args.objective,
+                           kill_drawdown=args.kill_drawdown)
+        combos = expand_grid(search_grid)
+        k = combos.index(result["best_params"])
+        print(f"\n🔎 Grid best: {grid['best_params']} → {args.objective} {grid['best_score']:.4f}")
+        print(f" - Halving pick ranks #{grid['rank_of'][k] + 1} of {len(combos)} on the full grid")
+        print(f" - Grid bar evaluations: {grid['bar_evaluations']:,}")
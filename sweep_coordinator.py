@@ -0,0 +1,414 @@
+# sweep_coordinator.py
+# Purpose: Coordinator/worker mode for parameter sweeps that outgrow one machine.
+# The work queue is a directory on a shared filesystem (NFS, SMB, a synced volume):
+#
+#   <queue>/pending/<task>.json   waiting tasks (symbol, strategy, bar file, param chunk)
+#   <queue>/leased/<task>.json    claimed by a worker; the file's mtime is its heartbeat
+#   <queue>/done/<task>.json      finished task records
+#   <queue>/failed/<task>.json    tasks that raised on every attempt, with the last traceback
+#   <queue>/results/<task>.csv    one result row per parameter combination
+#
+# Claims are atomic renames, so exactly one worker wins each task, and the winner
+# writes a claim token into the lease. Leases whose heartbeat is older than the
+# timeout go back to pending (a crashed worker's task is retried); a worker only
+# moves a lease on if it still carries its token, so a stale worker never finishes a
+# task another worker has re-claimed. A task that raises goes back to pending with
+# its attempt count, and to failed/ after max_attempts. Results are written to a temp
+# file then os.replace'd under the task id, so a task finished twice leaves one
+# identical result file.
+#
+# Usage:
+#   python sweep_coordinator.py submit --queue sweeps/q1 --bars SSO_5Min_hist_2d.csv UPRO_5Min_hist_2d.csv
+#   python sweep_coordinator.py worker --queue sweeps/q1          # on every node
+#   python sweep_coordinator.py status --queue sweeps/q1         # counts, plus failed tasks' errors
+#   python sweep_coordinator.py collect --queue sweeps/q1 --output sweep_results.csv
+#   python sweep_coordinator.py run --queue sweeps/q1 --bars SSO_5Min_hist_2d.csv --workers 4   # all local
+#   python sweep_coordinator.py run ... --cost-grid   # one row per combo and cost_model.COST_GRID model
+#   python sweep_coordinator.py run ... --sizing legacy vol_target kelly   # position sizing as a grid axis
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import bar_loader
+from advanced_backtest import backtest_signals
+from cost_model import COST_COLUMNS, METRIC_KEYS, CostModel, cost_grid, cost_sensitivity
+from ledger import LegLedger
+from online_metrics import RunningMetrics
+from walk_forward import (PARAM_GRIDS, RISK_PARAMS, SIZING_COLUMNS, expand_grid, precompute_signals,
+                          window_arrays, window_bars)
+
+STATES = ("pending", "leased", "done", "failed", "results")
+LEASE_TIMEOUT = 60      # seconds without a heartbeat before a lease is requeued
+HEARTBEAT = 10          # seconds between lease touches
+CHUNK_SIZE = 8          # parameter combinations per task
+MAX_ATTEMPTS = 3        # failed runs of a task before it is moved to failed/
+
+
+# === Queue layout ===
+def queue_dirs(queue):
+    queue = Path(queue)
+    dirs = {state: queue / state for state in STATES}
+    for path in dirs.values():
+        path.mkdir(parents=True, exist_ok=True)
+    return dirs
+
+
+def _write_atomic(path, text):
+    # Temp name is unique per writer, so concurrent writers never share a temp file
+    tmp = path.with_name(f".{path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _task_files(directory):
+    return sorted(p for p in directory.glob("*.json") if not p.name.startswith("."))
+
+
+# === Coordinator side ===
+def make_tasks(bar_files, strategies, grid=None, chunk_size=CHUNK_SIZE, costs=None, sizing=None):
+    # costs: cost_model.CostModel list; every task then reports each combo under each model.
+    # sizing: position_sizing.SIZERS names added to the grid as the "sizing" axis
+    costs = [model.params() for model in costs] if costs else None
+    tasks = []
+    for bars in bar_files:
+        symbol = Path(bars).name.split("_")[0]
+        for strategy in strategies:
+            combos = expand_grid({**(grid or PARAM_GRIDS[strategy]), **({"sizing": sizing} if sizing else {})})
+            for start in range(0, len(combos), chunk_size):
+                tasks.append({
+                    "task_id": f"{symbol}-{strategy}-{start // chunk_size:04d}",
+                    "symbol": symbol,
+                    "strategy": strategy,
+                    "bars": str(bars),
+                    "combos": combos[start:start + chunk_size],
+                    **({"costs": costs} if costs else {}),
+                })
+    return tasks
+
+
+def submit(queue, tasks):
+    # Re-submitting is a no-op for tasks already anywhere in the queue
+    dirs = queue_dirs(queue)
+    added = 0
+    for task in tasks:
+        name = f"{task['task_id']}.json"
+        if any((dirs[state] / name).exists() for state in ("pending", "leased", "done", "failed")):
+            continue
+        _write_atomic(dirs["pending"] / name, json.dumps(task))
+        added += 1
+    return added
+
+
+def requeue_expired(queue, lease_timeout=LEASE_TIMEOUT):
+    dirs = queue_dirs(queue)
+    now = time.time()
+    requeued = []
+    for lease in _task_files(dirs["leased"]):
+        try:
+            if now - lease.stat().st_mtime < lease_timeout:
+                continue
+            os.rename(lease, dirs["pending"] / lease.name)
+            requeued.append(lease.stem)
+        except FileNotFoundError:
+            continue    # finished or requeued by someone else in the meantime
+    return requeued
+
+
+def status(queue):
+    dirs = queue_dirs(queue)
+    return {state: len(_task_files(dirs[state])) if state != "results"
+            else len(list(dirs[state].glob("*.csv"))) for state in STATES}
+
+
+def failures(queue):
+    # task_id -> last line of the traceback of each task in failed/
+    failed = {}
+    for path in _task_files(queue_dirs(queue)["failed"]):
+        task = json.loads(path.read_text())
+        lines = task.get("error", "").strip().splitlines()
+        failed[task["task_id"]] = lines[-1] if lines else ""
+    return failed
+
+
+def collect(queue):
+    files = sorted(queue_dirs(queue)["results"].glob("*.csv"))
+    frames = [pd.read_csv(f) for f in files if not f.name.startswith(".")]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# === Worker side ===
+class Heartbeat:
+    # Touches the lease file periodically while the task runs
+    def __init__(self, path, interval=HEARTBEAT):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(self.interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return      # lease was requeued; the result write stays idempotent
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def claim(queue):
+    # (lease path, task with its claim token) of the next pending task, or (None, None)
+    dirs = queue_dirs(queue)
+    for task in _task_files(dirs["pending"]):
+        lease = dirs["leased"] / task.name
+        try:
+            # Freshen the mtime before the rename: it survives the rename, so the new
+            # lease never looks expired to another node's requeue_expired
+            os.utime(task)
+            os.rename(task, lease)
+            claimed = json.loads(lease.read_text())
+        except FileNotFoundError:
+            continue    # another worker won this one
+        claimed["lease_token"] = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        _write_atomic(lease, json.dumps(claimed))
+        return lease, claimed
+    return None, None
+
+
+def _owns(lease, task):
+    # True while the lease still carries this claim's token
+    try:
+        return json.loads(lease.read_text()).get("lease_token") == task["lease_token"]
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+
+
+def release(queue, lease, task, state):
+    # Moves a lease this worker still owns to pending/, done/ or failed/; False if it
+    # expired and was requeued or re-claimed in the meantime
+    if not _owns(lease, task):
+        return False
+    record = {k: v for k, v in task.items() if k != "lease_token"}
+    _write_atomic(lease, json.dumps(record))
+    try:
+        os.replace(lease, queue_dirs(queue)[state] / lease.name)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def fail(queue, lease, task, error, max_attempts=MAX_ATTEMPTS):
+    # Records a failed attempt; the task is retried until max_attempts, then parked in
+    # failed/ with its traceback so the rest of the sweep carries on. Returns the state
+    attempts = task.get("attempts", 0) + 1
+    state = "failed" if attempts >= max_attempts else "pending"
+    release(queue, lease, {**task, "attempts": attempts, "error": error}, state)
+    return state
+
+
+_bar_cache = {}
+_data_client = None
+
+
+def use_data_server(address):
+    # Read bars through a local market_data_server instead of private copies
+    global _data_client
+    from market_data_server import MarketDataClient
+    host, port = address.rsplit(":", 1)
+    _data_client = MarketDataClient((host, int(port)))
+
+
+def load_bars(path, strategy=None, compact=False, costs=False, sizing=False):
+    # Bars are read once per worker and reused by every task on the same file.
+    # compact: float32 prices projected to the strategy's inputs (bar_loader), plus
+    # the high/low/volume columns cost models read when costs=True and the high/low
+    # columns sizers read when sizing=True
+    key = (path, strategy if compact else None, costs and compact, sizing and compact)
+    if key not in _bar_cache:
+        if _data_client is not None:
+            symbol, timeframe = Path(path).name.split("_")[:2]
+            _bar_cache[key] = _data_client.open(symbol, timeframe, path=os.path.abspath(path)).frame()
+        elif compact:
+            columns = bar_loader.strategy_columns([strategy])
+            extra = (COST_COLUMNS if costs else ()) + (SIZING_COLUMNS if sizing else ())
+            if extra:
+                header = pd.read_csv(path, nrows=0).columns
+                columns += [c for c in dict.fromkeys(extra) if c in header and c not in columns]
+            _bar_cache[key] = bar_loader.load_bars(path, columns=columns, compact=True)
+        else:
+            _bar_cache[key] = bar_loader.load_bars(path)
+    return _bar_cache[key]
+
+
+def run_task(task, initial_capital=100000, stop_loss_pct=0.002, take_profit_pct=0.004, max_leverage=4,
+             compact=False):
+    models = [CostModel(**params) for params in task.get("costs", [])]
+    sized = any("sizing" in combo for combo in task["combos"])
+    df = load_bars(task["bars"], task["strategy"], compact, costs=bool(models), sizing=sized)
+    combos = task["combos"]
+    precomputed = precompute_signals(df, task["strategy"], combos)
+    cost_bars = {name: df[name].to_numpy(dtype="float64") for name in COST_COLUMNS if name in df}
+    rows = []
+    for k, combo in enumerate(combos):
+        params = {"initial_capital": initial_capital, "stop_loss_pct": stop_loss_pct,
+                  "take_profit_pct": take_profit_pct, "max_leverage": max_leverage}
+        params.update({name: combo[name] for name in RISK_PARAMS if name in combo})
+        acc = RunningMetrics()
+        fills = LegLedger() if models else None
+        timestamps, closes, signals = window_arrays(precomputed, k, 0, len(df))
+        trades, _ = backtest_signals(timestamps, closes, signals, precomputed["tz"], metrics=acc,
+                                     record_equity=False, verbose=False, datetimes=False, fills=fills,
+                                     bars=window_bars(precomputed, k, 0, len(df)), **params)
+        key = {"task_id": task["task_id"], "symbol": task["symbol"], "strategy": task["strategy"], **combo}
+        if not models:
+            summary = acc.summary()
+            rows.append({**key, **{name: summary[name] for name in METRIC_KEYS}})
+            continue
+        # Every cost model at once; bar columns are mapped onto the combo's unmasked rows
+        kept = np.flatnonzero(precomputed["masks"][k])
+        bars = {"close": closes, **{name: column[kept] for name, column in cost_bars.items()}}
+        table = cost_sensitivity(fills, bars, trades["pnl"], len(closes), models, initial_capital)
+        rows.extend({**key, **row} for row in table.to_dict("records"))
+    return pd.DataFrame(rows)
+
+
+def worker(queue, lease_timeout=LEASE_TIMEOUT, heartbeat=HEARTBEAT, max_tasks=None, idle_exit=True,
+           compact=False, max_attempts=MAX_ATTEMPTS):
+    dirs = queue_dirs(queue)
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    completed = 0
+    while max_tasks is None or completed < max_tasks:
+        lease, task = claim(queue)
+        if lease is None:
+            # Nothing pending: reclaim crashed workers' tasks, otherwise stop or wait
+            if requeue_expired(queue, lease_timeout):
+                continue
+            if idle_exit and not _task_files(dirs["leased"]):
+                break
+            time.sleep(min(heartbeat, 1.0))
+            continue
+
+        try:
+            with Heartbeat(lease, heartbeat):
+                result = run_task(task, compact=compact)
+        except Exception:
+            state = fail(queue, lease, task, traceback.format_exc(), max_attempts)
+            print(f"❌ [{name}] {task['task_id']} raised (attempt {task.get('attempts', 0) + 1}/{max_attempts}"
+                  f"{', moved to failed/' if state == 'failed' else ''})")
+            continue
+        _write_atomic(dirs["results"] / f"{task['task_id']}.csv", result.to_csv(index=False))
+        # A lease that expired was requeued (or re-claimed); the rerun rewrites the same result
+        release(queue, lease, task, "done")
+        completed += 1
+        print(f"✅ [{name}] {task['task_id']} ({len(task['combos'])} combos, {len(result)} rows)")
+    return completed
+
+
+# === Local multi-worker mode ===
+def run_local(queue, n_workers, lease_timeout=LEASE_TIMEOUT, heartbeat=HEARTBEAT, poll=1.0, data_server=None,
+              compact=False, max_attempts=MAX_ATTEMPTS):
+    # Spawns worker processes on this box and supervises the queue until it drains
+    cmd = [sys.executable, str(Path(__file__).resolve()), "worker", "--queue", str(queue),
+           "--lease-timeout", str(lease_timeout), "--heartbeat", str(heartbeat),
+           "--max-attempts", str(max_attempts)]
+    if data_server:
+        cmd += ["--data-server", data_server]
+    if compact:
+        cmd += ["--compact"]
+    procs = [subprocess.Popen(cmd) for _ in range(n_workers)]
+    try:
+        while any(p.poll() is None for p in procs):
+            for task_id in requeue_expired(queue, lease_timeout):
+                print(f"♻️ Lease expired, requeued {task_id}")
+            time.sleep(poll)
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.terminate()
+    # Workers that died early may leave work behind; finish it in-process
+    if status(queue)["pending"] or status(queue)["leased"]:
+        worker(queue, lease_timeout, heartbeat, compact=compact, max_attempts=max_attempts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filesystem work-queue sweep coordinator")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_queue(p):
+        p.add_argument("--queue", required=True, help="Queue directory on a filesystem shared by all nodes")
+        return p
+
+    def add_tasks(p):
+        p.add_argument("--bars", nargs="+", required=True, help="Bar CSVs in the shared bar store")
+        p.add_argument("--strategies", nargs="+", default=sorted(PARAM_GRIDS))
+        p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        p.add_argument("--sizing", nargs="+", help="position_sizing sizers to sweep (e.g. legacy vol_target kelly)")
+        p.add_argument("--cost-grid", action="store_true",
+                       help="Report every combo under each cost_model.COST_GRID cost model")
+
+    def add_lease(p):
+        p.add_argument("--lease-timeout", type=float, default=LEASE_TIMEOUT)
+        p.add_argument("--heartbeat", type=float, default=HEARTBEAT)
+        p.add_argument("--data-server", help="HOST:PORT of a market_data_server to share bars through")
+        p.add_argument("--compact", action="store_true", help="Load float32 bars projected to the strategy inputs")
+        p.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                       help="Failed runs of a task before it is moved to failed/")
+
+    add_tasks(add_queue(sub.add_parser("submit", help="Add sweep tasks to the queue")))
+    w = add_queue(sub.add_parser("worker", help="Process tasks until the queue drains"))
+    add_lease(w)
+    w.add_argument("--max-tasks", type=int)
+    w.add_argument("--wait", action="store_true", help="Keep polling when the queue is empty")
+    add_queue(sub.add_parser("status", help="Count tasks per state"))
+    c = add_queue(sub.add_parser("collect", help="Merge result rows"))
+    c.add_argument("--output", default="sweep_results.csv")
+    r = add_queue(sub.add_parser("run", help="Submit, run N local workers, and collect"))
+    add_tasks(r)
+    add_lease(r)
+    r.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    r.add_argument("--output", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    if args.command in ("submit", "run"):
+        tasks = make_tasks(args.bars, args.strategies, chunk_size=args.chunk_size,
+                           costs=cost_grid() if args.cost_grid else None, sizing=args.sizing)
+        print(f"📥 Submitted {submit(args.queue, tasks)} of {len(tasks)} tasks")
+
+    if args.command == "worker":
+        if args.data_server:
+            use_data_server(args.data_server)
+        n = worker(args.queue, args.lease_timeout, args.heartbeat, args.max_tasks, idle_exit=not args.wait,
+                   compact=args.compact, max_attempts=args.max_attempts)
+        print(f"🏁 Worker finished {n} task(s)")
+    elif args.command == "run":
+        run_local(args.queue, args.workers, args.lease_timeout, args.heartbeat, data_server=args.data_server,
+                  compact=args.compact, max_attempts=args.max_attempts)
+
+    if args.command in ("collect", "run"):
+        results = collect(args.queue)
+        results.to_csv(args.output, index=False)
+        print(f"💾 {len(results)} result rows → {args.output}")
+    if args.command in ("status", "run"):
+        print("📊 Queue: " + ", ".join(f"{k}={v}" for k, v in status(args.queue).items()))
+        for task_id, error in failures(args.queue).items():
+            print(f"⚠️ Failed: {task_id}: {error}")
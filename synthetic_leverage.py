@@ -0,0 +1,204 @@
+# synthetic_leverage.py
+# Purpose: Derive daily-reset leveraged-ETF bars (SSO-style 2x, UPRO-style 3x, or
+# inverse) from an underlying's intraday bars in one vectorized pass, with expense
+# drag and optional tracking error, and compare the result against real ETF bars.
+#
+# Each "leverage day" runs from one 16:00 New York close to the next, so pre- and
+# after-hours bars move with the day they trade into. Within a day the ETF moves L
+# times the underlying's return since the last reset close; at each reset the daily
+# expense (expense_ratio / 252) and a tracking-error shock are applied.
+#
+# Usage:
+#   python synthetic_leverage.py                       # SPY → SSO (2x) / UPRO (3x) comparison report
+#   python synthetic_leverage.py --underlying SPY_5Min_strategy_2d.csv --compare SSO=2:SSO_5Min_strategy_2d.csv
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from bar_loader import load_bars
+from market_panel import MarketPanel
+from metrics import INTRADAY_PERIODS
+
+RESET_TIME = "16:00"
+RESET_TZ = "America/New_York"
+EXPENSE_RATIOS = {2: 0.0089, 3: 0.0091}     # SSO, UPRO
+TRADING_DAYS = 252
+
+
+# === Derivation ===
+def leverage_days(index, reset_time=RESET_TIME, tz=RESET_TZ):
+    # Bucket id per bar: bars at or after the reset time belong to the next day
+    local = index.tz_convert(tz) if index.tz is not None else index.tz_localize("UTC").tz_convert(tz)
+    shifted = (local - pd.Timedelta(f"{reset_time}:00")).normalize()
+    keys = shifted.asi8
+    starts = np.concatenate(([True], keys[1:] != keys[:-1]))
+    return np.cumsum(starts) - 1
+
+
+def synthesize_leveraged(bars, leverages=(2, 3), expense_ratio=None, tracking_error=0.0,
+                         start_price=None, seed=None, reset_time=RESET_TIME, tz=RESET_TZ):
+    # Returns {leverage: DataFrame(open, high, low, close)} on the underlying's index.
+    # expense_ratio: annual, per leverage via EXPENSE_RATIOS when None.
+    # tracking_error: annualized stdev of the daily reset shock.
+    leverages = np.atleast_1d(np.asarray(leverages, dtype="float64"))
+    close = bars['close'].to_numpy(dtype="float64")
+    first_ref = bars['open'].iloc[0] if 'open' in bars else close[0]
+
+    day = leverage_days(bars.index, reset_time, tz)
+    n_days = day[-1] + 1 if len(day) else 0
+    day_close = close[np.flatnonzero(np.concatenate((day[1:] != day[:-1], [True])))]
+    ref = np.concatenate(([first_ref], day_close[:-1]))          # underlying at each reset
+
+    if expense_ratio is None:
+        expense = np.array([EXPENSE_RATIOS.get(int(lev), 0.0) for lev in leverages])
+    else:
+        expense = np.broadcast_to(np.asarray(expense_ratio, dtype="float64"), leverages.shape)
+    rng = np.random.default_rng(seed)
+    shocks = rng.normal(0.0, tracking_error / np.sqrt(TRADING_DAYS), size=(len(leverages), n_days))
+
+    # (n_leverages, n_days) growth from one reset to the next, then the ETF level at each reset
+    L = leverages[:, None]
+    growth = (1 + L * (day_close / ref - 1)) * (1 - expense[:, None] / TRADING_DAYS) * (1 + shocks)
+    growth = np.maximum(growth, 0.0)
+    level = np.ones((len(leverages), n_days))
+    np.cumprod(growth[:, :-1], axis=1, out=level[:, 1:])
+    level *= close[0] if start_price is None else start_price / (1 + leverages[:, None] * (close[0] / first_ref - 1))
+
+    out = {}
+    bar_level, bar_ref = level[:, day], ref[day]
+    for i, lev in enumerate(leverages):
+        mapped = {}
+        for field in ("open", "high", "low", "close"):
+            if field in bars:
+                x = bars[field].to_numpy(dtype="float64")
+                mapped[field] = np.maximum(bar_level[i] * (1 + lev * (x / bar_ref - 1)), 0.0)
+        if lev < 0 and "high" in mapped and "low" in mapped:
+            mapped["high"], mapped["low"] = mapped["low"], mapped["high"]
+        key = int(lev) if float(lev).is_integer() else float(lev)
+        out[key] = pd.DataFrame(mapped, index=bars.index)
+    return out
+
+
+# === Comparison with real ETF bars ===
+def compare_series(synthetic, real, periods_per_year=INTRADAY_PERIODS):
+    # Aligns on common bars and rebases the synthetic series to the real first price
+    panel = MarketPanel.from_frames({"synthetic": synthetic, "real": real}, fields=("close",))
+    both = panel.mask.all(axis=1)
+    if both.sum() < 2:
+        return None
+    close = panel["close"][both]
+    close[:, 0] *= close[0, 1] / close[0, 0]
+    returns = close[1:] / close[:-1] - 1
+    diff = returns[:, 0] - returns[:, 1]
+    return {
+        "bars": int(both.sum()),
+        "correlation": float(np.corrcoef(returns[:, 0], returns[:, 1])[0, 1]),
+        "tracking_error": float(diff.std(ddof=1) * np.sqrt(periods_per_year)),
+        "synthetic_return": float(close[-1, 0] / close[0, 0] - 1),
+        "real_return": float(close[-1, 1] / close[0, 1] - 1),
+        "mean_abs_gap_pct": float(np.abs(close[:, 0] / close[:, 1] - 1).mean() * 100),
+        "timestamps": panel.calendar[both],
+        "synthetic": close[:, 0],
+        "real": close[:, 1],
+    }
+
+
+def plot_comparison(result, symbol, leverage, outpath):
+    plt.figure(figsize=(12, 5))
+    plt.plot(result["timestamps"], result["real"], label=f"{symbol} (real)", linewidth=1.5)
+    plt.plot(result["timestamps"], result["synthetic"], label=f"{leverage}x synthetic", linestyle="--")
+    plt.title(f"{symbol}: Real vs Synthetic {leverage}x")
+    plt.xlabel("Time")
+    plt.ylabel("Price")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(outpath)
+    plt.close()
+    return outpath
+
+
+def write_report(underlying_symbol, rows, output):
+    output = Path(output)
+    table = "\n".join(
+        f"<tr><td>{r['symbol']}</td><td>{r['leverage']}x</td><td>{r['bars']}</td>"
+        f"<td>{r['correlation']:.4f}</td><td>{r['tracking_error'] * 100:.2f}%</td>"
+        f"<td>{r['synthetic_return'] * 100:.2f}%</td><td>{r['real_return'] * 100:.2f}%</td>"
+        f"<td>{r['mean_abs_gap_pct']:.3f}%</td></tr>" for r in rows)
+    charts = "\n    ".join(f'<img src="{r["chart"]}" alt="{r["symbol"]}">' for r in rows)
+    html = f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Synthetic Leveraged Series vs Real</title>
+    <style>
+        body {{ font-family: Arial; margin: 40px; }}
+        h1 {{ color: #2c3e50; }}
+        table {{ border-collapse: collapse; }}
+        th, td {{ border: 1px solid #ccc; padding: 8px; text-align: right; }}
+        img {{ width: 100%; max-width: 900px; margin: 20px 0; }}
+    </style>
+</head>
+<body>
+    <h1>🧪 Synthetic Leveraged Series vs Real ({underlying_symbol} underlying)</h1>
+    <p>Daily reset at {RESET_TIME} New York time; expense drag applied at each reset.</p>
+    <table>
+        <tr><th>ETF</th><th>Leverage</th><th>Common Bars</th><th>Return Corr.</th><th>Tracking Error (ann.)</th>
+            <th>Synthetic Return</th><th>Real Return</th><th>Mean |Price Gap|</th></tr>
+        {table}
+    </table>
+    {charts}
+</body>
+</html>"""
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(html)
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic daily-reset leveraged ETF series")
+    parser.add_argument("--underlying", default="SPY_5Min_strategy_2d.csv")
+    parser.add_argument("--compare", nargs="*", default=["SSO=2:SSO_5Min_strategy_2d.csv", "UPRO=3:UPRO_5Min_strategy_2d.csv"],
+                        help="SYMBOL=LEVERAGE:CSV pairs of real ETF bars to compare against")
+    parser.add_argument("--tracking-error", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--save", action="store_true", help="Also write the synthetic bars as CSV")
+    parser.add_argument("--output", default="reports/synthetic_leverage.html")
+    args = parser.parse_args()
+
+    underlying = load_bars(args.underlying)
+    underlying_symbol = Path(args.underlying).name.split("_")[0]
+    pairs = []
+    for spec in args.compare:
+        symbol, rest = spec.split("=", 1)
+        leverage, path = rest.split(":", 1)
+        pairs.append((symbol, float(leverage), path))
+
+    synthetic = synthesize_leveraged(underlying, [lev for _, lev, _ in pairs],
+                                     tracking_error=args.tracking_error, seed=args.seed)
+    output = Path(args.output)
+    rows = []
+    for symbol, leverage, path in pairs:
+        key = int(leverage) if leverage.is_integer() else leverage
+        series = synthetic[key]
+        if args.save:
+            series.to_csv(f"{underlying_symbol}_{key}x_synthetic.csv", index_label="timestamp")
+        real = load_bars(path)
+        result = compare_series(series, real)
+        if result is None:
+            print(f"⚠️ {symbol}: no overlapping bars with {underlying_symbol}")
+            continue
+        chart = output.parent / f"synthetic_{symbol}_{key}x.png"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        plot_comparison(result, symbol, key, chart)
+        rows.append({"symbol": symbol, "leverage": key, "chart": chart.name,
+                     **{k: v for k, v in result.items() if k not in ("timestamps", "synthetic", "real")}})
+        print(f"📈 {symbol} vs {key}x synthetic: corr {result['correlation']:.3f}, "
+              f"tracking error {result['tracking_error']:.2%}, gap {result['mean_abs_gap_pct']:.3f}%")
+
+    if rows:
+        print(f"✅ Report: {write_report(underlying_symbol, rows, output)}")
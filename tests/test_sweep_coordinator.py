@@ -0,0 +1,64 @@
+# test_sweep_coordinator.py
+# Purpose: Queue protocol checks for sweep_coordinator: a queue drains to one result
+# per combo, a task that always raises ends in failed/ without blocking the others,
+# and a stale worker cannot finish a lease another worker has re-claimed.
+#
+# Usage:
+#   python -m pytest -q tests/test_sweep_coordinator.py
+
+import json
+import os
+
+import pytest
+
+import sweep_coordinator as sc
+from benchmark_suite import make_synthetic_bars
+
+GRID = {"sma": [10, 20], "ema": [5], "stop_loss_pct": [0.002], "take_profit_pct": [0.004], "max_leverage": [2]}
+
+
+@pytest.fixture
+def bar_file(tmp_path):
+    path = tmp_path / "SYN_5Min_hist_2d.csv"
+    make_synthetic_bars(600).reset_index().to_csv(path, index=False)
+    return path
+
+
+def test_worker_drains_queue(tmp_path, bar_file):
+    queue = tmp_path / "queue"
+    tasks = sc.make_tasks([bar_file], ["sma_ema"], grid=GRID, chunk_size=1)
+    assert sc.submit(queue, tasks) == 2
+
+    assert sc.worker(queue, heartbeat=0.1) == 2
+    assert sc.status(queue) == {"pending": 0, "leased": 0, "done": 2, "failed": 0, "results": 2}
+    results = sc.collect(queue)
+    assert sorted(results["sma"]) == [10, 20]
+    assert sc.submit(queue, tasks) == 0       # finished tasks are not resubmitted
+
+
+def test_failing_task_is_parked(tmp_path, bar_file):
+    queue = tmp_path / "queue"
+    good = sc.make_tasks([bar_file], ["sma_ema"], grid=GRID, chunk_size=2)
+    bad = sc.make_tasks([tmp_path / "MISSING_5Min_hist_2d.csv"], ["sma_ema"], grid=GRID, chunk_size=2)
+    sc.submit(queue, bad + good)
+
+    assert sc.worker(queue, heartbeat=0.1, max_attempts=2) == 1
+    assert sc.status(queue) == {"pending": 0, "leased": 0, "done": 1, "failed": 1, "results": 1}
+    record = json.loads((queue / "failed" / f"{bad[0]['task_id']}.json").read_text())
+    assert record["attempts"] == 2
+    assert "FileNotFoundError" in sc.failures(queue)[bad[0]["task_id"]]
+
+
+def test_stale_worker_keeps_off_reclaimed_lease(tmp_path, bar_file):
+    queue = tmp_path / "queue"
+    sc.submit(queue, sc.make_tasks([bar_file], ["sma_ema"], grid=GRID, chunk_size=2))
+
+    stale_lease, stale = sc.claim(queue)
+    os.utime(stale_lease, (0, 0))             # heartbeat stopped long ago
+    assert sc.requeue_expired(queue) == [stale["task_id"]]
+    lease, fresh = sc.claim(queue)
+
+    assert not sc.release(queue, stale_lease, stale, "done")
+    assert sc.status(queue)["leased"] == 1
+    assert sc.release(queue, lease, fresh, "done")
+    assert sc.status(queue)["done"] == 1
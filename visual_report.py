@@ -7,13 +7,13 @@ from weasyprint import HTML
 from backtest_scaling import (
     apply_indicators,
     simulate_strategy,
-    load_price_data,
-    calculate_max_drawdown,
-    calculate_sharpe_ratio,
-    calculate_trade_stats
+    load_price_data
 )
 import matplotlib.pyplot as plt
 import pandas as pd
+from instrumentation import StageTimer, export_json
+from metrics import compute_metrics
+from ledger import locate
 
 def plot_price_with_trades(df, trades, symbol, folder):
     df['sma_20'] = df['close'].rolling(20).mean()
@@ -24,13 +24,13 @@ def plot_price_with_trades(df, trades, symbol, folder):
     plt.plot(df['sma_20'], label='SMA 20', linestyle='--')
     plt.plot(df['ema_20'], label='EMA 20', linestyle='-.')
 
-    for _, row in trades.iterrows():
-        time = row['exit_time']
-        if time in df.index:
-            price = df.loc[time, 'close']
-            color = 'green' if row['pnl'] > 0 else 'red'
-            marker = '^' if row['pnl'] > 0 else 'v'
-            plt.scatter(time, price, color=color, marker=marker, s=100)
+    # Exit bars are found by binary search on epoch-ns values, not per-trade index lookups
+    rows = locate(df.index.asi8, pd.DatetimeIndex(trades['exit_time']).asi8)
+    found = rows >= 0
+    wins = trades['pnl'].to_numpy()[found] > 0
+    times, prices = df.index[rows[found]], df['close'].to_numpy()[rows[found]]
+    plt.scatter(times[wins], prices[wins], color='green', marker='^', s=100)
+    plt.scatter(times[~wins], prices[~wins], color='red', marker='v', s=100)
 
     plt.title(f"{symbol} – Price Chart & Trades")
     plt.xlabel("Time")
@@ -61,7 +61,8 @@ def plot_equity_curve(equity, symbol, folder):
     plt.close()
     print(f"✅ Saved curve: {filename.name}")
 
-def generate_html_report(symbol, trades, stats, folder):
+def generate_html_report(symbol, trades, stats, folder, timer=None):
+    timer = timer or StageTimer(symbol)
     html_path = folder / f"{symbol}_report.html"
     pdf_path = folder / f"{symbol}_report.pdf"
 
@@ -95,55 +96,78 @@ def generate_html_report(symbol, trades, stats, folder):
         <img src="{symbol}_equity_curve.png">
         <h2>📋 Trade Log</h2>
         {trades.to_html(index=False)}
+        {{timing}}
     </body>
     </html>
     """
 
-    with open(html_path, "w") as f:
-        f.write(html)
+    with timer.stage("html"):
+        with open(html_path, "w") as f:
+            f.write(html.replace("{timing}", timer.to_html_table()))
     print(f"✅ HTML report: {html_path.name}")
 
     try:
-        HTML(string=html, base_url=str(folder)).write_pdf(pdf_path)
+        with timer.stage("pdf"):
+            HTML(string=html.replace("{timing}", timer.to_html_table()),
+                 base_url=str(folder)).write_pdf(pdf_path)
         print(f"📄 PDF report: {pdf_path.name}")
     except Exception as e:
         print(f"⚠️ PDF generation failed: {e}")
 
+    # Re-render so the HTML report also carries the PDF stage timing
+    with open(html_path, "w") as f:
+        f.write(html.replace("{timing}", timer.to_html_table()))
+
 def process_symbol(symbol, timeframe='5Min', days='2'):
     strategy_file = f"{symbol}_{timeframe}_strategy_{days}d.csv"
     folder = Path(f"reports/{symbol}")
     folder.mkdir(parents=True, exist_ok=True)
+    timer = StageTimer(symbol)
 
     try:
-        df = apply_indicators(load_price_data(strategy_file))
+        with timer.stage("load"):
+            df = load_price_data(strategy_file)
+        with timer.stage("indicators"):
+            df = apply_indicators(df)
     except Exception as e:
         print(f"❌ Could not process {symbol}: {e}")
         return
 
-    trades, equity = simulate_strategy(df)
+    with timer.stage("simulate"):
+        trades, equity = simulate_strategy(df)
 
+    # One metrics pass, using backtest_scaling's Sharpe convention
+    m = compute_metrics(equity, trades, periods_per_year=252, risk_free_rate=0.01 / 252,
+                        ddof=0, fill_first=True)
     stats = {
-        "final_equity": equity.iloc[-1]['equity'],
-        "total_return": (equity.iloc[-1]['equity'] - 100000) / 100000 * 100,
-        "max_drawdown": calculate_max_drawdown(equity) * 100,
-        "sharpe": calculate_sharpe_ratio(equity),
-        "win_rate": calculate_trade_stats(trades)[0],
-        "avg_win": calculate_trade_stats(trades)[1],
-        "avg_loss": calculate_trade_stats(trades)[2]
+        "final_equity": m['final_equity'],
+        "total_return": (m['final_equity'] - 100000) / 100000 * 100,
+        "max_drawdown": m['max_drawdown'] * 100,
+        "sharpe": round(m['sharpe'], 2),
+        "win_rate": round(m['win_rate'] * 100, 2),
+        "avg_win": round(m['avg_win'], 2),
+        "avg_loss": round(m['avg_loss'], 2)
     }
 
     trades.to_csv(folder / f"{symbol}_strategy_trades.csv", index=False)
     print(f"💾 Saved trade log: {symbol}_strategy_trades.csv")
 
-    plot_price_with_trades(df, trades, symbol, folder)
-    plot_equity_curve(equity, symbol, folder)
-    generate_html_report(symbol, trades, stats, folder)
+    with timer.stage("chart"):
+        plot_price_with_trades(df, trades, symbol, folder)
+        plot_equity_curve(equity, symbol, folder)
+    generate_html_report(symbol, trades, stats, folder, timer)
+    timer.print_summary()
+    return timer
 
 def run_batch(symbols):
     print("\n📊 Starting Batch Strategy Reporting...")
+    timers = []
     for symbol in symbols:
         print(f"\n➡️ Processing {symbol}...")
-        process_symbol(symbol)
+        timer = process_symbol(symbol)
+        if timer:
+            timers.append(timer)
+    export_json(timers, "reports/timings.json")
     print("\n✅ All reports generated.")
 
 if __name__ == "__main__":
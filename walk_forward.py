@@ -0,0 +1,293 @@
+# walk_forward.py
+# Purpose: Walk-forward optimization. Bar history is cut into rolling train/test
+# windows; each fold sweeps the parameter grid on its train window, keeps the best
+# combination and trades it on the following test window. Folds run concurrently
+# across processes, and indicators are computed once per combination on the full
+# history and then sliced per window (they are causal, so no look-ahead leaks in).
+# The out-of-sample test curves are chained into one stitched equity curve.
+#
+# Usage:
+#   python walk_forward.py UPRO_5Min_strategy_2d.csv --strategy sma_ema --train-bars 150 --test-bars 50
+#   python walk_forward.py UPRO_5Min_strategy_2d.csv --compact            # float32 bars, strategy columns only
+
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from advanced_backtest import backtest_signals
+from bar_loader import load_bars
+from ledger import index_to_int64, int64_to_datetime
+from metrics import compute_metrics
+from position_sizing import sizing_arrays
+from strategy_engine import KernelContext, compute_signals
+
+PARAM_GRIDS = {
+    "sma_ema": {"sma": [10, 20, 30, 50], "ema": [5, 10, 20]},
+    "macd": {"fast": [8, 12], "slow": [21, 26], "signal": [5, 9]},
+    "bollinger": {"sma": [14, 20, 30], "stddev": [1.5, 2, 2.5]},
+    "bollinger_breakout": {"bb": [14, 20, 30], "stddev": [1.5, 2, 2.5]},
+    "rsi_sma_combo": {"sma": [10, 14, 20], "rsi": [7, 14, 21]},
+}
+RISK_PARAMS = ("stop_loss_pct", "take_profit_pct", "max_leverage", "sizing")   # "sizing": position_sizing name
+SIZING_COLUMNS = ("high", "low")     # bar columns sizers may read (vol_target's ATR)
+
+# Per-process cache filled by _init_worker (or directly for in-process runs)
+_PRECOMPUTED = {}
+
+
+# === Grid & folds ===
+def expand_grid(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def make_folds(n_bars, train_bars, test_bars, step=None, anchored=False):
+    # Returns (train_start, train_end, test_end) bar offsets; test windows do not overlap
+    step = step or test_bars
+    folds = []
+    start = 0
+    while start + train_bars + test_bars <= n_bars:
+        train_start = 0 if anchored else start
+        folds.append((train_start, start + train_bars, start + train_bars + test_bars))
+        start += step
+    return folds
+
+
+# === Indicator precomputation ===
+def precompute_signals(df, strategy, combos):
+    # One kernel pass per indicator combination over the whole history, sharing
+    # derived series between combos. Warm-up rows are masked out rather than dropped
+    # so every combo shares offsets.
+    ctx = KernelContext(df)
+    timestamps, tz = index_to_int64(df.index)
+    closes = df['close'].to_numpy(dtype="float64")
+    bars = {name: df[name].to_numpy(dtype="float64") for name in SIZING_COLUMNS if name in df}
+    signals, masks, seen = [], [], {}
+    for combo in combos:
+        indicator_params = {k: v for k, v in combo.items() if k not in RISK_PARAMS}
+        key = tuple(sorted(indicator_params.items()))
+        if key not in seen:
+            signal, valid, _ = compute_signals(ctx, strategy, indicator_params)
+            seen[key] = (np.where(valid, signal, 0).astype("int8"), valid)
+        signal, valid = seen[key]
+        signals.append(signal)
+        masks.append(valid)
+    return {"timestamps": timestamps, "tz": tz, "closes": closes, "bars": bars,
+            "signals": signals, "masks": masks, "combos": combos}
+
+
+def _init_worker(precomputed):
+    _PRECOMPUTED.update(precomputed)
+
+
+# === Fold evaluation ===
+def window_arrays(precomputed, k, start, end):
+    # Bars [start, end) of combo k with its indicator warm-up rows removed
+    p = precomputed
+    mask = p["masks"][k][start:end]
+    return (p["timestamps"][start:end][mask], p["closes"][start:end][mask],
+            p["signals"][k][start:end][mask])
+
+
+def window_bars(precomputed, k, start, end):
+    # The same rows of the extra bar columns (high/low) for sizers
+    mask = precomputed["masks"][k][start:end]
+    return {name: column[start:end][mask] for name, column in precomputed["bars"].items()}
+
+
+def _run(k, start, end, sim_params, record_equity):
+    combo = _PRECOMPUTED["combos"][k]
+    params = dict(sim_params)
+    params.update({name: combo[name] for name in RISK_PARAMS if name in combo})
+    timestamps, closes, signals = window_arrays(_PRECOMPUTED, k, start, end)
+    if params.get("sizing") is not None:
+        # Size over the whole history up to the window's end, as Candidate.advance does, so
+        # a sizer's warm-up (ATR, Kelly's trade window) is not restarted in every window
+        _, prefix_closes, prefix_signals = window_arrays(_PRECOMPUTED, k, 0, end)
+        bet_risk, leverage = sizing_arrays(params["sizing"], prefix_closes, prefix_signals,
+                                           window_bars(_PRECOMPUTED, k, 0, end), params["stop_loss_pct"],
+                                           params["take_profit_pct"], params["max_leverage"])
+        first = len(prefix_closes) - len(closes)
+        params["sizing"] = (bet_risk[first:], leverage[first:])
+    trades, equity = backtest_signals(timestamps, closes, signals, _PRECOMPUTED["tz"], record_equity=True,
+                                      verbose=False, datetimes=False, **params)
+    if not equity.empty:
+        # A position still open at the window's end is force-closed at the last close, after
+        # that bar's equity was recorded; book it on the last bar so the curve, the capital
+        # carried into the next fold and the summary include its PnL. Train and test runs
+        # both score this curve, so selection uses the definition the folds report.
+        capital = params["initial_capital"]
+        for pnl in trades["pnl"].tolist():
+            capital += pnl
+        equity.loc[equity.index[-1], "equity"] = capital
+    if not record_equity:
+        return compute_metrics(equity, trades), trades, None
+    equity["cum_max"] = equity["equity"].cummax()
+    equity["drawdown"] = equity["equity"] / equity["cum_max"] - 1
+    return compute_metrics(equity, trades), trades, equity
+
+
+def run_fold(fold, sim_params, objective="sharpe"):
+    train_start, train_end, test_end = fold
+    scores = []
+    for k in range(len(_PRECOMPUTED["combos"])):
+        summary, _, _ = _run(k, train_start, train_end, sim_params, record_equity=False)
+        score = summary[objective]
+        scores.append(score if np.isfinite(score) else -np.inf)
+    best = int(np.argmax(scores))
+
+    summary, trades, equity = _run(best, train_end, test_end, sim_params, record_equity=True)
+    return {
+        "fold": fold,
+        "params": _PRECOMPUTED["combos"][best],
+        "train_score": scores[best],
+        "test": summary,
+        "trades": trades,
+        "equity": equity,
+    }
+
+
+def _stitch(results, initial_capital):
+    # Each test window starts from initial_capital; rescale so capital carries over
+    capital = initial_capital
+    curves, trades = [], []
+    for r in results:
+        equity = r["equity"]
+        if equity is None or equity.empty:
+            continue
+        scale = capital / initial_capital
+        curves.append(pd.DataFrame({"timestamp": equity["timestamp"], "equity": equity["equity"] * scale}))
+        if not r["trades"].empty:
+            scaled = r["trades"].copy()
+            scaled["pnl"] *= scale
+            trades.append(scaled)
+        capital = curves[-1]["equity"].iloc[-1]
+
+    if not curves:
+        return pd.DataFrame(columns=["timestamp", "equity", "cum_max", "drawdown"]), pd.DataFrame()
+    stitched = pd.concat(curves, ignore_index=True)
+    stitched["cum_max"] = stitched["equity"].cummax()
+    stitched["drawdown"] = stitched["equity"] / stitched["cum_max"] - 1
+    return stitched, pd.concat(trades, ignore_index=True) if trades else pd.DataFrame()
+
+
+def walk_forward(df, strategy="sma_ema", grid=None, train_bars=500, test_bars=100, step=None,
+                 anchored=False, objective="sharpe", initial_capital=100000,
+                 stop_loss_pct=0.002, take_profit_pct=0.004, max_leverage=4, workers=None):
+    combos = expand_grid(grid or PARAM_GRIDS[strategy])
+    folds = make_folds(len(df), train_bars, test_bars, step, anchored)
+    if not folds:
+        raise ValueError(f"{len(df)} bars is too short for train={train_bars} + test={test_bars}.")
+    sim_params = {"initial_capital": initial_capital, "stop_loss_pct": stop_loss_pct,
+                  "take_profit_pct": take_profit_pct, "max_leverage": max_leverage}
+
+    precomputed = precompute_signals(df, strategy, combos)
+    workers = workers or min(len(folds), os.cpu_count() or 1)
+    print(f"🧭 Walk-forward: {len(folds)} folds × {len(combos)} combos on {workers} worker(s)")
+
+    if workers == 1:
+        _init_worker(precomputed)
+        results = [run_fold(fold, sim_params, objective) for fold in folds]
+    else:
+        # Precomputed arrays are shipped once per worker, not once per fold
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(precomputed,)) as pool:
+            results = list(pool.map(run_fold, folds, itertools.repeat(sim_params),
+                                    itertools.repeat(objective)))
+
+    index = df.index
+    rows = []
+    for r in results:
+        train_start, train_end, test_end = r["fold"]
+        rows.append({
+            "train_start": index[train_start],
+            "train_end": index[train_end - 1],
+            "test_start": index[train_end],
+            "test_end": index[test_end - 1],
+            "params": ", ".join(f"{k}={v}" for k, v in r["params"].items()),
+            f"train_{objective}": r["train_score"],
+            "test_return": r["test"]["total_return"],
+            "test_sharpe": r["test"]["sharpe"],
+            "test_max_drawdown": r["test"]["max_drawdown"],
+            "test_trades": r["test"]["total_trades"],
+        })
+    # Folds run on epoch-ns timestamps; convert once for the stitched outputs
+    equity, trades = _stitch(results, initial_capital)
+    tz = precomputed["tz"]
+    equity["timestamp"] = int64_to_datetime(equity["timestamp"].to_numpy(dtype="int64"), tz)
+    for column in ("entry_time", "exit_time"):
+        if column in trades:
+            trades[column] = int64_to_datetime(trades[column].to_numpy(dtype="int64"), tz)
+    return pd.DataFrame(rows), equity, trades
+
+
+# === Report section ===
+def plot_walk_forward(equity, folds, symbol, outpath):
+    plt.figure(figsize=(12, 5))
+    plt.plot(equity["timestamp"], equity["equity"], label="Out-of-sample equity", color="navy")
+    for start in pd.to_datetime(folds["test_start"]):
+        plt.axvline(start, color="gray", linestyle=":", linewidth=0.8)
+    plt.title(f"{symbol} Walk-Forward Stitched Equity")
+    plt.xlabel("Time")
+    plt.ylabel("Equity")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(outpath)
+    plt.close()
+    return outpath
+
+
+def walk_forward_section(folds, chart_name):
+    table = folds.to_html(index=False, float_format=lambda x: f"{x:.4f}", border=0)
+    return f"""<h2>🧭 Walk-Forward Optimization</h2>
+    <p>{len(folds)} folds; each test window trades the parameters chosen on the train window before it.</p>
+    {table}
+    <img src="{chart_name}" alt="Walk-forward equity">"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward optimization")
+    parser.add_argument("csv", help="Bar history CSV with timestamp and close columns")
+    parser.add_argument("--strategy", default="sma_ema", choices=sorted(PARAM_GRIDS))
+    parser.add_argument("--train-bars", type=int, default=500)
+    parser.add_argument("--test-bars", type=int, default=100)
+    parser.add_argument("--step", type=int)
+    parser.add_argument("--anchored", action="store_true", help="Grow the train window from the first bar")
+    parser.add_argument("--objective", default="sharpe")
+    parser.add_argument("--sizing", nargs="+", help="Also search over these position_sizing sizers (e.g. legacy kelly)")
+    parser.add_argument("--compact", action="store_true", help="Load float32 bars projected to the strategy inputs")
+    parser.add_argument("--capital", type=float, default=100000)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--outdir", default=".", help="Results go to <outdir>/<SYMBOL>/, next to the advanced report")
+    args = parser.parse_args()
+
+    symbol = Path(args.csv).name.split("_")[0]
+    outdir = Path(args.outdir) / symbol
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    bars = load_bars(args.csv, strategies=[args.strategy] if args.compact else None, compact=args.compact)
+    grid = {**PARAM_GRIDS[args.strategy], "sizing": args.sizing} if args.sizing else None
+    folds, equity, trades = walk_forward(
+        bars, args.strategy, grid=grid, train_bars=args.train_bars, test_bars=args.test_bars,
+        step=args.step, anchored=args.anchored, objective=args.objective,
+        initial_capital=args.capital, workers=args.workers,
+    )
+
+    folds.to_csv(outdir / f"{symbol}_walk_forward_folds.csv", index=False)
+    equity.to_csv(outdir / f"{symbol}_walk_forward_equity.csv", index=False)
+    trades.to_csv(outdir / f"{symbol}_walk_forward_trades.csv", index=False)
+    chart = plot_walk_forward(equity, folds, symbol, outdir / f"{symbol}_walk_forward_equity.png")
+
+    print("\n📊 Walk-Forward Folds:")
+    print(folds.to_string(index=False))
+    if not equity.empty:
+        print(f"\n📈 Out-of-sample final equity: ${equity['equity'].iloc[-1]:.2f} "
+              f"(max drawdown {equity['drawdown'].min():.2%})")
+    print(f"💾 Saved to {outdir}")